@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 from flask import Flask
+from threading import Thread
 from configparser import ConfigParser
 
 __author__ = "Richard Pöttler & Manuel Pirker"
@@ -40,8 +41,25 @@ app.config["problems"] = {
 	
 }
 app.config["submit_on_change"] = config["application"].getboolean("submit_on_change")
+app.config["render_processes"] = config["application"].getint(
+    "render_processes", fallback=0
+)
+app.config["render_threads"] = config["application"].getboolean(
+    "render_threads", fallback=False
+)
+app.config["precompute"] = config["application"].getboolean(
+    "precompute", fallback=False
+)
+app.config["prefetch"] = config["application"].getboolean("prefetch", fallback=True)
+app.config["partial_updates"] = config["application"].getboolean(
+    "partial_updates", fallback=True
+)
 
 import ezprobs.main
+import ezprobs.problems
+
+ezprobs.problems.render_threads = app.config["render_threads"]
+
 import ezprobs.demo
 import ezprobs.problems.xy
 import ezprobs.problems.free_surface_01
@@ -68,3 +86,7 @@ app.register_blueprint(
 app.register_blueprint(
     problems.pressure_pipe_03.bp, url_prefix="/problems/pressure_pump_turbine"
 )
+
+if app.config["precompute"]:
+    for problem in problems.PROBLEMS.values():
+        Thread(target=problem.precompute, daemon=True).start()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+class LRUCache:
+    """Thread safe cache which drops the least recently used entries."""
+
+    def __init__(self, maxsize=128):
+        """Initializes an empty cache holding at most ``maxsize`` entries."""
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        """Returns the value stored for ``key`` or ``default`` if it is missing."""
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """Stores ``value`` for ``key`` and drops the oldest entries if full."""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Removes all entries and resets the statistics."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """Returns the usage statistics of the cache as dictionary."""
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+def hash_file(path):
+    """Returns the SHA-256 of the file at ``path`` read in blocks."""
+    digest = sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hashed_lines(stream, digest):
+    """Yields the lines of the UTF-8 encoded binary ``stream`` while updating
+    ``digest`` with its content.
+
+    The stream is read in blocks, so uploads can be parsed and hashed without
+    holding them in memory."""
+    rest = b""
+    for block in iter(lambda: stream.read(1 << 16), b""):
+        digest.update(block)
+        # a newline byte is never part of another character in UTF-8
+        complete, _, rest = (rest + block).rpartition(b"\n")
+        yield from complete.decode("utf-8").splitlines(keepends=True)
+    yield from rest.decode("utf-8").splitlines(keepends=True)
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+
+from math import sqrt
+
+import numpy as np
+
+from ezprobs.hydraulics import t_crit_rect, t_n_rect_vec
+from ezprobs.units import GRAVITY
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+def specific_energy(depth, discharge, width):
+    """Calculates the specific energy of a rectangular channel."""
+    return depth + (discharge / (width * depth)) ** 2 / (2 * GRAVITY)
+
+
+def specific_force(depth, discharge, width):
+    """Calculates the specific force (momentum function) of a rectangular
+    channel divided by the specific weight."""
+    return discharge ** 2 / (GRAVITY * width * depth) + width * depth ** 2 / 2
+
+
+def depth_from_energy(energy, discharge, width, supercritical=False, h_c=None):
+    """Calculates the subcritical or supercritical depth of a rectangular
+    channel with the given specific energy.
+
+    The cubic equation is solved by Newton iterations which converge
+    monotonically from the chosen start. Returns the critical depth ``h_c``
+    if the energy is below the minimum."""
+    if h_c is None:
+        h_c = t_crit_rect(discharge, width)
+    if energy <= 1.5 * h_c:
+        return h_c
+    c = (discharge / width) ** 2 / (2 * GRAVITY)
+    h = sqrt(c / energy) if supercritical else energy
+    for _ in range(50):
+        step = (h + c / h ** 2 - energy) / (1 - 2 * c / h ** 3)
+        h -= step
+        if abs(step) < 1e-12 * h:
+            break
+    return h
+
+
+def _friction_slope(depth, discharge, width, strickler_roughness):
+    a = width * depth
+    r = a / (width + 2 * depth)
+    return (discharge / (strickler_roughness * a * r ** (2 / 3))) ** 2
+
+
+def _profile(
+    discharge,
+    width,
+    slope,
+    strickler_roughness,
+    h_n,
+    h_c,
+    start,
+    distances,
+    upstream,
+    spacing,
+):
+    """Computes a water surface profile by the direct step method.
+
+    Starting with the depth ``start`` the profile is marched upstream for
+    subcritical or downstream for supercritical flow. The distances to a
+    range of depths between the start and the depth the profile tends to are
+    integrated at once and the depths at the given ``distances`` from the
+    start are interpolated. ``spacing`` holds the geometric and the linear
+    spacing of the depths towards the normal or the critical depth. Depths
+    beyond the point where the profile reaches the critical depth are NaN."""
+    if np.isnan(start):
+        return np.full(len(distances), np.nan)
+    if upstream:
+        if slope > 0 and h_n > h_c:
+            end, asymptotic = h_n, True
+        elif slope > 0:
+            end, asymptotic = h_c, False
+        else:
+            # no normal depth, the energy can't rise above this bound
+            sf = _friction_slope(start, discharge, width, strickler_roughness)
+            energy = specific_energy(start, discharge, width)
+            end = energy + (sf - slope) * distances.max()
+            asymptotic = False
+    elif slope > 0 and h_n < h_c:
+        end, asymptotic = h_n, True
+    else:
+        end, asymptotic = h_c, False
+
+    if abs(start - end) <= 1e-9 * end:
+        if asymptotic:
+            return np.full(len(distances), end)
+        return np.where(distances > 0, np.nan, start)
+    geometric, linear = spacing
+    if asymptotic:
+        depths = end + (start - end) * geometric
+    else:
+        depths = start + (end - start) * linear
+
+    energy = specific_energy(depths, discharge, width)
+    sf = _friction_slope(depths, discharge, width, strickler_roughness)
+    dx = np.diff(energy) / (slope - (sf[:-1] + sf[1:]) / 2)
+    reached = np.concatenate(([0], np.cumsum(-dx if upstream else dx)))
+    reached = np.maximum.accumulate(np.maximum(reached, 0))
+    return np.interp(
+        distances, reached, depths, right=end if asymptotic else np.nan
+    )
+
+
+def water_surface(reaches, discharge, downstream_depth=None, points=21, samples=48):
+    """Computes the steady water surface along a chain of rectangular reaches.
+
+    ``reaches`` is a list of ``(length, width, slope, strickler_roughness)``
+    tuples from upstream to downstream, the beds of the reaches are joined
+    without steps. The flow leaves the last reach at ``downstream_depth`` or
+    at normal depth if subcritical, at critical depth if the reach is
+    horizontal or adverse, it enters the first one at normal depth
+    if this is supercritical.
+
+    The subcritical profiles are marched upstream from the downstream end,
+    then the supercritical profiles downstream from the upstream end and from
+    every control section where the subcritical profile can't pass. The flow
+    regime with the larger specific force prevails, hydraulic jumps are
+    located where both are equal. At the junctions the energy is conserved.
+    Every reach is divided into ``points`` points and every profile is
+    integrated with ``samples`` depths at once.
+
+    Returns a dictionary with the stations ``x`` and the heights of the
+    ``bed`` and the ``depth`` at the points, where every jump adds the depths
+    before and after at its station, the critical and normal depth of every
+    reach, the stations of the control sections and a list of the jumps with
+    their station and conjugate depths."""
+    lengths, widths, slopes, ks = (
+        np.array(column, dtype=float) for column in zip(*reaches)
+    )
+    count = len(lengths)
+    h_c = t_crit_rect(discharge, widths)
+    h_n = np.full(count, np.inf)
+    sloped = slopes > 0
+    h_n[sloped] = t_n_rect_vec(discharge, ks[sloped], slopes[sloped], widths[sloped])
+    steep = h_n < h_c
+    starts = np.concatenate(([0], np.cumsum(lengths)))
+    beds = np.concatenate((np.cumsum((slopes * lengths)[::-1])[::-1], [0]))
+    local = lengths[:, None] * np.linspace(0, 1, points)
+    spacing = (np.geomspace(1, 1e-6, samples), np.linspace(0, 1, samples))
+
+    # subcritical profiles marched upstream, NaN where there is none
+    subcritical = [None] * count
+    if downstream_depth is not None:
+        depth = max(downstream_depth, h_c[-1])
+    elif steep[-1]:
+        depth = np.nan
+    else:
+        # free overfall at the end of a horizontal or adverse reach
+        depth = h_n[-1] if slopes[-1] > 0 else h_c[-1]
+    for k in reversed(range(count)):
+        subcritical[k] = _profile(
+            discharge,
+            widths[k],
+            slopes[k],
+            ks[k],
+            h_n[k],
+            h_c[k],
+            depth,
+            lengths[k] - local[k],
+            True,
+            spacing,
+        )
+        if k > 0:
+            start = subcritical[k][0]
+            energy = specific_energy(
+                h_c[k] if np.isnan(start) else start, discharge, widths[k]
+            )
+            depth = depth_from_energy(
+                energy, discharge, widths[k - 1], h_c=h_c[k - 1]
+            )
+
+    # supercritical profiles marched downstream, the prevailing regime
+    x = []
+    bed = []
+    depths = []
+    controls = []
+    jumps = []
+    incoming = h_n[0] if steep[0] else None
+    for k in range(count):
+        sub = subcritical[k]
+        if incoming is None and (np.isnan(sub[0]) or steep[k] and sub[0] <= h_c[k]):
+            incoming = h_c[k]
+            controls.append(float(starts[k]))
+        stations = starts[k] + local[k]
+        heights = beds[k] - slopes[k] * local[k]
+        if incoming is None:
+            result = sub
+        else:
+            sup = _profile(
+                discharge,
+                widths[k],
+                slopes[k],
+                ks[k],
+                h_n[k],
+                h_c[k],
+                incoming,
+                local[k],
+                False,
+                spacing,
+            )
+            force = specific_force(sup, discharge, widths[k])
+            difference = force - specific_force(sub, discharge, widths[k])
+            prevails = np.isnan(sub) | (difference > -1e-9 * force)
+            if prevails.all():
+                result = sup
+                end = specific_energy(sup[-1], discharge, widths[k])
+                if k + 1 < count:
+                    incoming = depth_from_energy(
+                        end, discharge, widths[k + 1], True, h_c[k + 1]
+                    )
+            else:
+                j = int(np.argmin(prevails))
+                result = np.where(prevails, sup, sub)
+                if j == 0:
+                    position, t_1, t_2 = stations[0], incoming, sub[0]
+                elif np.isfinite(difference[j - 1 : j + 1]).all():
+                    f = difference[j - 1] / (difference[j - 1] - difference[j])
+                    position = stations[j - 1] + f * (stations[j] - stations[j - 1])
+                    t_1 = sup[j - 1] + f * (sup[j] - sup[j - 1])
+                    t_2 = sub[j - 1] + f * (sub[j] - sub[j - 1])
+                elif np.isfinite(sub[j - 1]):
+                    # the supercritical profile ends before the next point
+                    position, t_1, t_2 = stations[j - 1], sup[j - 1], sub[j - 1]
+                else:
+                    # the subcritical profile starts after the previous point
+                    position, t_1, t_2 = stations[j], np.nanmax(sup[j - 1 : j + 1]), sub[j]
+                jumps.append({"x": float(position), "t_1": float(t_1), "t_2": float(t_2)})
+                height = beds[k] - slopes[k] * (position - starts[k])
+                stations = np.insert(stations, j, [position, position])
+                heights = np.insert(heights, j, [height, height])
+                result = np.insert(result, j, [t_1, t_2])
+                incoming = None
+        x.append(stations)
+        bed.append(heights)
+        depths.append(np.where(np.isnan(result), h_c[k], result))
+
+    return {
+        "x": np.concatenate(x),
+        "bed": np.concatenate(bed),
+        "depth": np.concatenate(depths),
+        "t_crit": h_c,
+        "t_n": h_n,
+        "controls": controls,
+        "jumps": jumps,
+    }
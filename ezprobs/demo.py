@@ -4,12 +4,7 @@ from svgwrite import Drawing, cm, mm
 from flask import Response, Blueprint
 from io import BytesIO
 
-import matplotlib as mpl
-
-mpl.use("Agg")
-# mpl.use("SVG")
-
-import matplotlib.pyplot as plt
+from ezprobs.problems import subplots
 
 
 __author__ = "Richard Pöttler"
@@ -23,7 +18,7 @@ bp = Blueprint("demo", __name__)
 
 @bp.route("/mpl")
 def display_matplotlib():
-    fig, ax = plt.subplots()
+    fig, ax = subplots()
     ax.plot(range(10))
 
     buffer = BytesIO()
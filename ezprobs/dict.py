@@ -36,6 +36,11 @@ DICT_ENG = {"dia_pipe": "pipe diameter",
     "ehead": "energy height",
     "bed": "bed",
     "dia_between":"pipe diameter between",
+    "jump": "hydraulic jump",
+    "envelope": "envelope",
+    "cavitation": "vapour pressure",
+    "upstream": "upstream",
+    "downstream": "downstream",
 }
 
 
@@ -72,4 +77,9 @@ DICT_GER = {"dia_pipe": "Rohrdurchmesser",
     "ehead": "Energiehöhe",
     "bed": "Sohle",
     "dia_between":"Rohrdurchmesser zwischen",
+    "jump": "Wechselsprung",
+    "envelope": "Umhüllende",
+    "cavitation": "Dampfdruck",
+    "upstream": "oberwasserseitig",
+    "downstream": "unterwasserseitig",
 }
\ No newline at end of file
@@ -0,0 +1,591 @@
+#!/usr/bin/env python3
+
+"""Exports the trainer as static site.
+
+Every state selectable with the sliders is solved and rendered ahead of time,
+the plots and solution fragments are written once per content hash and an
+``index.json`` per problem maps the states to their files. The pages load
+``js/static_site.js`` which looks the states up instead of asking the server.
+Running the export again only renders the states whose inputs or code
+changed::
+
+    python -m ezprobs.export site --processes 8
+
+The mixins ``ExerciseSheets`` and ``TableExport`` export single problems
+from the running server, as archive of exercise sheets and as table of the
+solutions on a grid of parameter values.
+"""
+
+from argparse import ArgumentParser
+from collections import deque
+from hashlib import sha256
+from importlib import import_module
+from importlib.metadata import version
+from io import StringIO
+from uuid import uuid4
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+import csv
+import json
+import os
+import re
+import shutil
+import sys
+
+import numpy as np
+from flask import (
+    Response,
+    current_app,
+    jsonify,
+    render_template,
+    request,
+    stream_with_context,
+    url_for,
+)
+from markupsafe import Markup
+
+from ezprobs import app
+from ezprobs.problems import PROBLEMS, Plot, render_executor
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+PACKAGE = os.path.dirname(os.path.abspath(__file__))
+
+
+def solve_table(module, name, columns):
+    """Computes the exported table of the problem ``name`` for the parameter
+    values in ``columns``, the entry point for the export processes."""
+    import_module(module)
+    return PROBLEMS[name].table(columns)
+
+
+def render_sheet(module, name, params):
+    """Solves the problem ``name`` for ``params`` and renders its figure, the
+    entry point for the processes generating exercise sheets and static
+    sites."""
+    import_module(module)
+    problem = PROBLEMS[name]
+    solution = problem.solve(params)
+    return solution, problem.draw_solution(solution)
+
+
+def submit_ahead(executor, function, arguments, ahead):
+    """Yields ``function(*args)`` for every tuple in ``arguments`` in order.
+
+    The calls are submitted to ``executor`` with at most ``ahead`` results
+    waiting to be consumed, the pending calls are cancelled if the consumer
+    stops early."""
+    pending = deque()
+    try:
+        for args in arguments:
+            pending.append(executor.submit(function, *args))
+            if len(pending) >= ahead:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+class _Chunks:
+    """File-like object collecting the written bytes until they are taken,
+    used to stream archives as they are written."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+class ExerciseSheets:
+    """Mixin for problems offering randomized exercise sheets.
+
+    The sheets of random variants of the problem are served as archive
+    under ``/api/v1/sheets``, one page with and one without the solution per
+    variant and a table of all answers."""
+
+    # maximum number of variants of one request for exercise sheets
+    sheet_max_count = 2000
+
+    def variants(self, count, seed=None):
+        """Draws ``count`` random parameter sets from the values selectable
+        with the sliders."""
+        rng = np.random.default_rng(seed)
+        values = [(p.name, np.array(p.values())) for p in self.parameters]
+        return [
+            {name: float(rng.choice(v)) for name, v in values} for _ in range(count)
+        ]
+
+    def template_block(self, name):
+        """Renders the block ``name`` of the problem template."""
+        template = current_app.jinja_env.get_template(self.template)
+        if name not in template.blocks:
+            return ""
+        context = template.new_context({})
+        return Markup("".join(template.blocks[name](context)).strip())
+
+    def api_sheets(self):
+        try:
+            count = int(request.args.get("count", 30))
+            seed = int(request.args.get("seed", uuid4().int % 2 ** 32))
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        if not 1 <= count <= self.sheet_max_count:
+            return (
+                jsonify(error=f"count must be between 1 and {self.sheet_max_count}"),
+                400,
+            )
+        # sheets are always rendered in the render pool, with as many workers
+        # as there are cores if the plots are rendered in the server process
+        processes = current_app.config.get("render_processes", 0) or os.cpu_count()
+        variants = self.variants(count, seed)
+        module = type(self).__module__
+        results = submit_ahead(
+            render_executor(processes),
+            render_sheet,
+            ((module, self.name, params) for params in variants),
+            2 * processes,
+        )
+        # static images of the description are added to the archive
+        description = self.template_block("description")
+        static_url = current_app.static_url_path + "/"
+        images = sorted(set(re.findall(f'src="{static_url}([^"]+)"', description)))
+        description = Markup(
+            str(description).replace(f'src="{static_url}', 'src="../../static/')
+        )
+        common = dict(
+            title=self.template_block("title"),
+            description=description,
+            plot=self.plot,
+            solution_template=self.solution_template,
+            sheet=True,
+        )
+        names = [p.name for p in self.parameters]
+
+        def stream():
+            output = _Chunks()
+            answers = StringIO()
+            writer = csv.writer(answers)
+            with ZipFile(output, "w", ZIP_DEFLATED) as archive:
+                for image in images:
+                    path = os.path.join(current_app.static_folder, image)
+                    if os.path.isfile(path):
+                        archive.write(path, f"static/{image}", ZIP_STORED)
+                for i, (params, (solution, png)) in enumerate(zip(variants, results)):
+                    if i == 0:
+                        # numbers of the solution except the parameters
+                        # converted to SI units
+                        keys = [
+                            k
+                            for k, v in solution.items()
+                            if isinstance(v, (int, float, np.number))
+                            and not isinstance(v, (bool, np.bool_))
+                            and k not in names
+                        ]
+                        writer.writerow(["variant"] + names + keys)
+                    folder = f"{self.name}/{i + 1:04d}"
+                    context = dict(
+                        common,
+                        variant=f"Variante {i + 1} (seed {seed})",
+                        parameters=[p.at(params[p.name]) for p in self.parameters],
+                    )
+                    archive.writestr(
+                        f"{folder}/sheet.html", render_template("sheet.html", **context)
+                    )
+                    archive.writestr(
+                        f"{folder}/solution.html",
+                        render_template("sheet.html", solution=solution, **context),
+                    )
+                    archive.writestr(f"{folder}/plot.png", png, ZIP_STORED)
+                    writer.writerow(
+                        [i + 1]
+                        + [params[name] for name in names]
+                        + [f"{float(solution[k]):.6g}" for k in keys]
+                    )
+                    yield output.take()
+                archive.writestr(f"{self.name}/answers.csv", answers.getvalue())
+            yield output.take()
+
+        response = Response(stream_with_context(stream()), mimetype="application/zip")
+        response.headers[
+            "Content-Disposition"
+        ] = f"attachment; filename={self.name}_sheets_{seed}.zip"
+        return response
+
+    def blueprint(self):
+        bp = super().blueprint()
+        bp.add_url_rule("/api/v1/sheets", "api_sheets", self.api_sheets)
+        return bp
+
+
+class TableExport:
+    """Mixin for problems whose solutions can be exported for a grid of
+    parameter values.
+
+    Problems list the ``export_outputs`` and get the table of these outputs
+    as CSV or NPZ download under ``/api/v1/export``."""
+
+    # solution keys exported for grids of parameter values, the grid is
+    # computed in chunks of ``export_chunk`` rows with at most
+    # ``export_ahead`` chunks computed ahead of the download
+    export_outputs = []
+    export_chunk = 8192
+    export_ahead = 4
+    export_max_rows = 100000000
+
+    def table(self, columns):
+        """Computes the ``export_outputs`` for the parameter values in
+        ``columns``, a dictionary of equally long arrays. Returns the columns
+        extended by the outputs."""
+        names = list(columns)
+        states = [dict(zip(names, row)) for row in zip(*columns.values())]
+        solutions = self.solve_batch(states)
+        return {
+            **columns,
+            **{
+                key: np.array([s[key] for s in solutions], dtype=float)
+                for key in self.export_outputs
+            },
+        }
+
+    def export_grid(self, values):
+        """Returns the values of every parameter spanning the exported grid.
+
+        ``values`` maps parameter names to a single value or to a range
+        ``min:max:step``, all other parameters take the values selectable
+        with the slider. Raises a ``ValueError`` if a value is invalid."""
+        grid = []
+        for p in self.parameters:
+            text = values.get(p.name)
+            if text is None:
+                grid.append(np.array(p.values()))
+                continue
+            bounds = text.split(":")
+            if len(bounds) == 1:
+                grid.append(np.array([p.parse(text)]))
+                continue
+            if len(bounds) != 3:
+                raise ValueError(f"{p.name} must be a value or min:max:step")
+            low, high = p.parse(bounds[0]), p.parse(bounds[1])
+            step = float(bounds[2])
+            if not step > 0 or high < low:
+                raise ValueError(f"{p.name} needs a positive step and min <= max")
+            count = int(np.floor((high - low) / step + 1e-9)) + 1
+            if count > self.export_max_rows:
+                raise ValueError(f"at most {self.export_max_rows} rows are allowed")
+            grid.append(np.round(low + step * np.arange(count), 9))
+        rows = int(np.prod([len(v) for v in grid], dtype=float))
+        if rows > self.export_max_rows:
+            raise ValueError(f"at most {self.export_max_rows} rows are allowed")
+        return grid
+
+    def export_chunks(self, grid, processes=0):
+        """Yields the exported table of the ``grid`` in chunks of rows.
+
+        The rows are enumerated lazily, only the chunks being computed are
+        held in memory. If ``processes`` is not zero the chunks are computed
+        in the shared process pool ahead of the consumer."""
+        names = [p.name for p in self.parameters]
+        shape = tuple(len(v) for v in grid)
+        rows = int(np.prod(shape))
+        executor = render_executor(processes)
+
+        def columns(start):
+            index = np.unravel_index(
+                np.arange(start, min(start + self.export_chunk, rows)), shape
+            )
+            return {name: v[i] for name, v, i in zip(names, grid, index)}
+
+        starts = iter(range(0, rows, self.export_chunk))
+        if executor is None:
+            for start in starts:
+                with self.timings.measure("export"):
+                    chunk = self.table(columns(start))
+                yield chunk
+            return
+
+        module = type(self).__module__
+        yield from submit_ahead(
+            executor,
+            solve_table,
+            ((module, self.name, columns(start)) for start in starts),
+            self.export_ahead,
+        )
+
+    def api_export(self):
+        fmt = request.args.get("format", "csv")
+        if fmt not in ("csv", "npz"):
+            return jsonify(error="format must be csv or npz"), 400
+        try:
+            grid = self.export_grid(request.args)
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        chunks = self.export_chunks(
+            grid, current_app.config.get("render_processes", 0)
+        )
+        names = [p.name for p in self.parameters] + list(self.export_outputs)
+
+        def csv_stream():
+            yield ",".join(names) + "\n"
+            for chunk in chunks:
+                buffer = StringIO()
+                np.savetxt(
+                    buffer,
+                    np.column_stack([chunk[name] for name in names]),
+                    fmt="%.9g",
+                    delimiter=",",
+                )
+                yield buffer.getvalue()
+
+        def npz_stream():
+            # every chunk is a structured array in an entry of the archive,
+            # the archive is written without seeking so it can be streamed
+            dtype = [(name, float) for name in names]
+            output = _Chunks()
+            with ZipFile(output, "w") as archive:
+                for i, chunk in enumerate(chunks):
+                    table = np.empty(len(chunk[names[0]]), dtype=dtype)
+                    for name in names:
+                        table[name] = chunk[name]
+                    name = f"chunk{i:06d}.npy"
+                    with archive.open(name, "w", force_zip64=True) as f:
+                        np.lib.format.write_array(f, table)
+                    yield output.take()
+            yield output.take()
+
+        stream = csv_stream() if fmt == "csv" else npz_stream()
+        response = Response(
+            stream, mimetype="text/csv" if fmt == "csv" else "application/zip"
+        )
+        response.headers[
+            "Content-Disposition"
+        ] = f"attachment; filename={self.name}.{fmt}"
+        return response
+
+    def blueprint(self):
+        bp = super().blueprint()
+        bp.add_url_rule("/api/v1/export", "api_export", self.api_export)
+        return bp
+
+
+def fingerprint(problem):
+    """Returns a hash of everything the rendered states of ``problem``
+    depend on: the modules of the package, the module of the problem, its
+    templates and the version of matplotlib."""
+    files = sorted(
+        os.path.join(PACKAGE, name)
+        for name in os.listdir(PACKAGE)
+        if name.endswith(".py")
+    )
+    files.append(os.path.join(PACKAGE, "problems", "__init__.py"))
+    files.append(sys.modules[type(problem).__module__].__file__)
+    for template in (
+        "base.html",
+        "problem.html",
+        problem.template,
+        problem.solution_template,
+    ):
+        files.append(os.path.join(PACKAGE, "templates", template))
+    digest = sha256(version("matplotlib").encode())
+    for path in files:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def state_key(problem, params):
+    """Returns the key of a state in the index, the values of the parameters
+    as displayed by the sliders."""
+    return ",".join(f"{params[p.name]:g}" for p in problem.parameters)
+
+
+def write_hashed(directory, data, suffix):
+    """Writes ``data`` to a file named after its hash unless it exists and
+    returns the name of the file."""
+    name = sha256(data).hexdigest()[:20] + suffix
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+    return name
+
+
+def export_problem(problem, output, processes, force=False):
+    """Renders all states of ``problem`` into ``output`` and writes its page
+    and index. Returns the number of rendered and of reused states."""
+    for directory in ("img", "html"):
+        os.makedirs(os.path.join(output, directory), exist_ok=True)
+    url = url_for(f"{problem.name}.index")
+    index_path = os.path.join(output, "index.json")
+    code = fingerprint(problem)
+
+    previous = {}
+    if not force and os.path.exists(index_path):
+        with open(index_path) as f:
+            old = json.load(f)
+        if old.get("fingerprint") == code:
+            previous = old["states"]
+
+    def exists(files):
+        return all(
+            os.path.exists(os.path.join(output, files[kind]))
+            for kind in ("plot", "solution")
+        )
+
+    states = {}
+    missing = []
+    for params in problem.grid():
+        key = state_key(problem, params)
+        files = previous.get(key)
+        if files is not None and exists(files):
+            states[key] = files
+        else:
+            missing.append((key, params))
+
+    module = type(problem).__module__
+    results = submit_ahead(
+        render_executor(processes),
+        render_sheet,
+        ((module, problem.name, params) for _, params in missing),
+        2 * processes,
+    )
+    for (key, params), (solution, png) in zip(missing, results):
+        html = render_template(
+            problem.solution_template, solution=solution, sheet=True
+        ).encode()
+        states[key] = {
+            "plot": "img/" + write_hashed(os.path.join(output, "img"), png, ".png"),
+            "solution": "html/"
+            + write_hashed(os.path.join(output, "html"), html, ".html"),
+        }
+
+    index = {
+        "version": 1,
+        "name": problem.name,
+        "fingerprint": code,
+        "parameters": [
+            {
+                "name": p.name,
+                "min": p.val_min,
+                "step": p.val_step,
+                "values": [f"{v:g}" for v in p.values()],
+            }
+            for p in problem.parameters
+        ],
+        "states": states,
+    }
+    with open(index_path + ".tmp", "w") as f:
+        json.dump(index, f, separators=(",", ":"))
+    os.replace(index_path + ".tmp", index_path)
+
+    # files of states no longer in the index
+    used = {name for files in states.values() for name in files.values()}
+    for directory in ("img", "html"):
+        for name in os.listdir(os.path.join(output, directory)):
+            if f"{directory}/{name}" not in used:
+                os.remove(os.path.join(output, directory, name))
+
+    params = problem.defaults()
+    files = states[state_key(problem, params)]
+    plot = problem.plot
+    if plot is not None:
+        plot = Plot(url + files["plot"], plot.alt, plot.caption)
+    page = render_template(
+        problem.template,
+        plot=plot,
+        parameters=problem.parameters,
+        solution=problem.solution(params),
+        sheet=True,
+        static_site=url + "index.json",
+    )
+    with open(os.path.join(output, "index.html"), "w") as f:
+        f.write(page)
+    return len(missing), len(states) - len(missing)
+
+
+def export(output, processes, names=None, force=False):
+    """Exports the problems ``names``, by default all registered ones, and
+    the pages and static files of the site into ``output``."""
+    # the static pages can only submit through the lookup script
+    app.config["submit_on_change"] = True
+    app.config["prefetch"] = False
+    problems = [
+        problem
+        for problem in PROBLEMS.values()
+        if problem.name in app.blueprints and (not names or problem.name in names)
+    ]
+    shutil.copytree(
+        app.static_folder, os.path.join(output, "static"), dirs_exist_ok=True
+    )
+    with app.test_request_context():
+        with open(os.path.join(output, "index.html"), "w") as f:
+            f.write(render_template("index.html"))
+        site = []
+        for problem in problems:
+            url = url_for(f"{problem.name}.index")
+            directory = os.path.join(output, url.strip("/"))
+            rendered, reused = export_problem(problem, directory, processes, force)
+            print(f"{problem.name}: {rendered} states rendered, {reused} reused")
+            site.append(
+                {
+                    "name": problem.name,
+                    "url": url,
+                    "index": url + "index.json",
+                    "states": rendered + reused,
+                }
+            )
+    # problems exported by earlier runs stay in the index
+    path = os.path.join(output, "index.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            exported = {entry["name"] for entry in site}
+            site += [
+                entry
+                for entry in json.load(f)["problems"]
+                if entry["name"] not in exported
+            ]
+    with open(path, "w") as f:
+        json.dump({"version": 1, "problems": site}, f, indent=2)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output", nargs="?", default="site", help="target directory")
+    parser.add_argument(
+        "-p",
+        "--processes",
+        type=int,
+        default=os.cpu_count(),
+        help="number of rendering processes",
+    )
+    parser.add_argument(
+        "--problem",
+        action="append",
+        dest="problems",
+        help="name of a problem to export, all if omitted",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="render all states again"
+    )
+    args = parser.parse_args()
+    export(args.output, max(args.processes, 1), args.problems, args.force)
+
+
+if __name__ == "__main__":
+    main()
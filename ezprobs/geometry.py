@@ -2,6 +2,10 @@
 
 from math import pi
 
+import numpy as np
+
+from ezprobs.units import GRAVITY
+
 __author__ = "Richard Pöttler"
 __copyright__ = "Copyright (c) 2021 Richard Pöttler"
 __license__ = "MIT"
@@ -9,4 +13,148 @@ __email__ = "richard.poettler@gmail.com"
 
 
 def area_circle(r):
-    return r ** 2 / pi
+    return pi * r ** 2
+
+
+# geometry of cross sections, every function returns the flow area, the
+# wetted perimeter and the top width for an array of depths
+def rectangle(depth, width):
+    """Calculates the geometry of a rectangular channel."""
+    depth = np.asarray(depth, dtype=float)
+    return width * depth, width + 2 * depth, np.full(depth.shape, float(width))
+
+
+def trapezoid(depth, bottom, side_slope):
+    """Calculates the geometry of a trapezoidal channel whose sides rise by 1
+    over a horizontal distance of ``side_slope``."""
+    depth = np.asarray(depth, dtype=float)
+    return (
+        (bottom + side_slope * depth) * depth,
+        bottom + 2 * depth * np.sqrt(1 + side_slope ** 2),
+        bottom + 2 * side_slope * depth,
+    )
+
+
+def circle_segment(depth, diameter):
+    """Calculates the geometry of a part-full circular pipe."""
+    depth = np.clip(np.asarray(depth, dtype=float), 0, diameter)
+    theta = 2 * np.arccos(1 - 2 * depth / diameter)
+    return (
+        diameter ** 2 / 8 * (theta - np.sin(theta)),
+        diameter * theta / 2,
+        diameter * np.sin(theta / 2),
+    )
+
+
+def polyline(depth, stations, elevations):
+    """Calculates the geometry of a cross section given by the ``stations``
+    and ``elevations`` of its points.
+
+    The depth is measured from the lowest point, everything below the water
+    level is considered wet. The wetted part of every segment is computed for
+    all depths at once."""
+    depth = np.asarray(depth, dtype=float)
+    y = np.asarray(stations, dtype=float)
+    z = np.asarray(elevations, dtype=float)
+    level = z.min() + depth[..., None]
+    z1 = z[:-1]
+    dy = np.abs(np.diff(y))
+    dz = np.diff(z)
+    length = np.hypot(dy, dz)
+
+    # wetted interval [s_a, s_b] of the parameter along every segment
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing = np.clip((level - z1) / dz, 0, 1)
+    flat = np.broadcast_to(dz == 0, crossing.shape)
+    below = np.where(level > z1, 1.0, 0.0)
+    s_a = np.where(flat, 0, np.where(dz > 0, 0, crossing))
+    s_b = np.where(flat, below, np.where(dz > 0, crossing, 1))
+    wetted = np.maximum(s_b - s_a, 0)
+
+    depth_a = level - z1 - dz * s_a
+    depth_b = level - z1 - dz * s_b
+    return (
+        np.sum(dy * wetted * (depth_a + depth_b) / 2, axis=-1),
+        np.sum(length * wetted, axis=-1),
+        np.sum(dy * wetted, axis=-1),
+    )
+
+
+class Section:
+    """Cross section of a channel with tables of its geometry.
+
+    The flow area, wetted perimeter and top width are computed once for
+    ``resolution`` depths up to ``height`` by ``geometry(depths)``. All other
+    values are interpolated from these tables, the normal and critical depth
+    by inverse interpolation of the conveyance and the section factor, so no
+    iterations are needed."""
+
+    def __init__(self, geometry, height, resolution=2000):
+        self.height = height
+        self.depths = np.linspace(0, height, resolution)
+        self.areas, self.perimeters, self.top_widths = geometry(self.depths)
+        wet = self.areas > 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            radii = np.where(wet, self.areas / self.perimeters, 0)
+            factors = np.where(
+                wet, self.areas * np.sqrt(self.areas / self.top_widths), 0
+            )
+        # the conveyance of closed sections decreases shortly before they are
+        # full, only its rising part is used
+        self.conveyance = np.maximum.accumulate(self.areas * radii ** (2 / 3))
+        self.section_factor = np.maximum.accumulate(factors)
+
+    @classmethod
+    def rectangle(cls, width, height, resolution=2000):
+        return cls(lambda h: rectangle(h, width), height, resolution)
+
+    @classmethod
+    def trapezoid(cls, bottom, side_slope, height, resolution=2000):
+        return cls(lambda h: trapezoid(h, bottom, side_slope), height, resolution)
+
+    @classmethod
+    def circle(cls, diameter, resolution=2000):
+        return cls(lambda h: circle_segment(h, diameter), diameter, resolution)
+
+    @classmethod
+    def polyline(cls, stations, elevations, resolution=2000):
+        """Creates the section of the given points up to the lower bank."""
+        z = np.asarray(elevations, dtype=float)
+        height = min(z[0], z[-1]) - z.min()
+        return cls(lambda h: polyline(h, stations, elevations), height, resolution)
+
+    def area(self, depth):
+        return np.interp(depth, self.depths, self.areas)
+
+    def perimeter(self, depth):
+        return np.interp(depth, self.depths, self.perimeters)
+
+    def top_width(self, depth):
+        return np.interp(depth, self.depths, self.top_widths)
+
+    def hydraulic_radius(self, depth):
+        return self.area(depth) / self.perimeter(depth)
+
+    def normal_depth(self, discharge, strickler_roughness, inclination):
+        """Calculates the normal depths for arrays of values.
+
+        Returns NaN where the discharge exceeds the capacity of the section."""
+        target = np.asarray(discharge, dtype=float) / (
+            np.asarray(strickler_roughness, dtype=float)
+            * np.sqrt(np.asarray(inclination, dtype=float))
+        )
+        return np.interp(target, self.conveyance, self.depths, right=np.nan)
+
+    def critical_depth(self, discharge):
+        """Calculates the critical depths for arrays of discharges.
+
+        Returns NaN where the critical depth is above the table."""
+        target = np.asarray(discharge, dtype=float) / np.sqrt(GRAVITY)
+        return np.interp(target, self.section_factor, self.depths, right=np.nan)
+
+    def specific_energy(self, depth, discharge):
+        return depth + (discharge / self.area(depth)) ** 2 / (2 * GRAVITY)
+
+    def froude(self, depth, discharge):
+        area = self.area(depth)
+        return discharge / area / np.sqrt(GRAVITY * area / self.top_width(depth))
@@ -55,6 +55,93 @@ def t_n_rect(discharge, strickler_roughness, inclination, width, start=1):
     )[0]
 
 
+def t_n_rect_vec(discharge, strickler_roughness, inclination, width, start=1):
+    """Calculates the normal depths of rectangular channels for arrays of values.
+
+    The equation of Strickler is solved by Newton iterations on all elements
+    at once."""
+    q, ks, i, w = np.broadcast_arrays(
+        np.asarray(discharge, dtype=float),
+        np.asarray(strickler_roughness, dtype=float),
+        np.asarray(inclination, dtype=float),
+        np.asarray(width, dtype=float),
+    )
+    h = np.full(q.shape, float(start))
+    for _ in range(50):
+        a = w * h
+        u = w + 2 * h
+        r = a / u
+        f = ks * np.sqrt(i) * r ** (2 / 3) * a - q
+        df = (
+            ks
+            * np.sqrt(i)
+            * (r ** (2 / 3) * w + 2 / 3 * a * r ** (-1 / 3) * w ** 2 / u ** 2)
+        )
+        step = f / df
+        h = np.maximum(h - step, h / 10)
+        if np.all(np.abs(step) < 1e-9 * h):
+            break
+    return h
+
+
+def t_n_rect_sensitivity(discharge, strickler_roughness, inclination, width, depth):
+    """Calculates the derivatives of the normal depths of rectangular channels
+    with respect to the strickler value and the inclination.
+
+    ``depth`` are the normal depths belonging to the other values."""
+    q, ks, i, w, h = np.broadcast_arrays(
+        np.asarray(discharge, dtype=float),
+        np.asarray(strickler_roughness, dtype=float),
+        np.asarray(inclination, dtype=float),
+        np.asarray(width, dtype=float),
+        np.asarray(depth, dtype=float),
+    )
+    a = w * h
+    u = w + 2 * h
+    r = a / u
+    df_dh = (
+        ks
+        * np.sqrt(i)
+        * (r ** (2 / 3) * w + 2 / 3 * a * r ** (-1 / 3) * w ** 2 / u ** 2)
+    )
+    return -q / ks / df_dh, -q / (2 * i) / df_dh
+
+
+def calibrate_rect(
+    depth, discharge, strickler_roughness, inclination, width, fit="ks", iterations=50
+):
+    """Fits the strickler value or the inclination of a rectangular channel to
+    observed pairs of depth and discharge.
+
+    The sum of the squared differences between the normal depths and the
+    observed depths is minimized by Gauss-Newton iterations, the value of the
+    parameter which is not fitted is kept. Both can't be fitted at once as
+    the normal depth only depends on ``ks * sqrt(i)``. Returns the estimate,
+    its standard error and the residuals."""
+    depth = np.asarray(depth, dtype=float)
+    discharge = np.asarray(discharge, dtype=float)
+    ks = float(strickler_roughness)
+    i = float(inclination)
+    for _ in range(iterations):
+        t_n = t_n_rect_vec(discharge, ks, i, width)
+        dt_dks, dt_di = t_n_rect_sensitivity(discharge, ks, i, width, t_n)
+        jacobian = dt_dks if fit == "ks" else dt_di
+        residuals = t_n - depth
+        step = np.sum(jacobian * residuals) / np.sum(jacobian ** 2)
+        if fit == "ks":
+            ks, value = max(ks - step, ks / 10), ks
+        else:
+            i, value = max(i - step, i / 10), i
+        if abs(step) < 1e-12 * value:
+            break
+    t_n = t_n_rect_vec(discharge, ks, i, width)
+    dt_dks, dt_di = t_n_rect_sensitivity(discharge, ks, i, width, t_n)
+    jacobian = dt_dks if fit == "ks" else dt_di
+    residuals = t_n - depth
+    variance = np.sum(residuals ** 2) / max(len(depth) - 1, 1)
+    return ks if fit == "ks" else i, sqrt(variance / np.sum(jacobian ** 2)), residuals
+
+
 def i_r_rect(discharge, strickler_roughness, width, t_1, t_2):
     """Calculates the inclination of the energy line based on the strickler value."""
     # calculate area and wetted perimeter on median values
@@ -67,6 +154,9 @@ def i_r_rect(discharge, strickler_roughness, width, t_1, t_2):
 
 def l_transition_i_r_rect(discharge, strickler_roughness, width, t_1, t_2, inclination):
     """Calculates the transition lenght based only on the inclination of the energy line"""
+    if t_1 == t_2:
+        # no transition, the energy line is parallel to the bed at normal depth
+        return 0.0
     i_r = i_r_rect(discharge, strickler_roughness, width, t_1, t_2)
     v_1 = discharge / (width * t_1)
     v_2 = discharge / (width * t_2)
@@ -194,6 +284,17 @@ def distanceBernoulli(
 
 
 # pipe flow formulary
+# flows below the critical Reynolds number are laminar
+RE_CRITICAL = 2320
+# guess of lambda for hydraulically smooth pipes
+LAMBDA_SMOOTH = 0.02
+
+
+def lambda_laminar(re):
+    """Calculates lambda for pipe loss for laminar conditions"""
+    return 64 / re
+
+
 def lambda_turbulent_rough(k, d):
     """Calculates lambda for pipe loss for rough conditions"""
     return (1 / (2 * log(k / d / 3.71, 10))) ** 2
@@ -202,14 +303,103 @@ def lambda_turbulent_rough(k, d):
 def lambda_turbulent_transition(k, d, re):
     """Calculates lambda for pipe loss for transition (rough->smoth) conditions"""
     return fsolve(
-        lambda lam: (1 / (2 * log(2.51 / (re * sqrt(lam)) + k / d / 3.71, 10))) ** 2
+        lambda lam: (1 / (2 * np.log10(2.51 / (re * np.sqrt(lam)) + k / d / 3.71)))
+        ** 2
         - lam,
-        lambda_turbulent_rough(k, d),
+        lambda_turbulent_rough(k, d) if k > 0 else LAMBDA_SMOOTH,
         xtol=1e-06,
         maxfev=100,
     )[0]
 
 
+def lambda_pipe(k, d, re):
+    """Calculates lambda for pipe loss for laminar and turbulent conditions"""
+    if re < RE_CRITICAL:
+        return lambda_laminar(re)
+    if k > 0 and re * k / d > 1300:
+        return lambda_turbulent_rough(k, d)
+    return lambda_turbulent_transition(k, d, re)
+
+
+def lambda_vec(k, d, re):
+    """Calculates lambda for pipe loss for arrays of values like ``lambda_pipe``.
+
+    Laminar flows get 64 / Re, which is infinite for still water. Turbulent
+    flows use the rough formula above ``re * k / d > 1300`` and otherwise
+    solve the transition formula by fixed point iteration starting from the
+    rough value, or from ``LAMBDA_SMOOTH`` for smooth pipes with ``k = 0``."""
+    k, d, re = np.broadcast_arrays(
+        np.asarray(k, dtype=float), np.asarray(d, dtype=float), np.asarray(re, dtype=float)
+    )
+    relative = k / d / 3.71
+    laminar = re < RE_CRITICAL
+    with np.errstate(divide="ignore"):
+        rough = (1 / (2 * np.log10(relative))) ** 2
+        lam_laminar = 64 / re
+    # the iteration only converges for turbulent flows
+    re_turbulent = np.where(laminar, RE_CRITICAL, re)
+    x = 1 / np.sqrt(np.where(k > 0, rough, LAMBDA_SMOOTH))
+    for _ in range(50):
+        # the viscous term vanishes for infinite Reynolds numbers
+        viscous = np.divide(
+            2.51 * x, re_turbulent, out=np.zeros_like(x), where=re_turbulent < np.inf
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_new = -2 * np.log10(viscous + relative)
+            converged = np.all((x_new == x) | (np.abs(x_new - x) < 1e-12))
+        x = x_new
+        if converged:
+            break
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fully_rough = (k > 0) & (re * k / d > 1300)
+        return np.where(laminar, lam_laminar, np.where(fully_rough, rough, 1 / x ** 2))
+
+
+def pipe_loss_vec(l, a, k, d, q):
+    """Calculates the pipe losses for arrays of values, zero without flow."""
+    q = np.asarray(q, dtype=float)
+    re = reynolds_number(np.abs(q) / a, d)
+    # lambda is infinite for still water but the loss vanishes
+    re = np.where(q == 0, np.inf, re)
+    return lambda_vec(k, d, re) * l / d / (2 * GRAVITY * a ** 2) * q ** 2
+
+
+def discharge_pipe_chain_vec(head, nu_entry, a_out, pipes, iterations=50, start=None):
+    """Calculates the discharges of pipe chains between two basins for arrays of values.
+
+    ``head`` is the difference of the water levels, ``a_out`` the area at the
+    outlet where the velocity head is lost and ``pipes`` a list of ``(l, a, k,
+    d)`` tuples of the pipes. The inlet loss is computed with the area of the
+    first pipe. The discharge is found by fixed point iteration on the loss
+    coefficients, starting from the discharges ``start`` if given and from
+    the discharges of fully rough turbulent flow otherwise."""
+    head = np.maximum(np.asarray(head, dtype=float), 0)
+    a_in = pipes[0][1]
+    shape = np.broadcast(head, a_out, *(v for p in pipes for v in p)).shape
+
+    def coefficient(q):
+        c = (1 / a_out ** 2 + nu_entry / a_in ** 2) / (2 * GRAVITY)
+        for l, a, k, d in pipes:
+            re = np.inf if q is None else reynolds_number(q / a, d)
+            c = c + lambda_vec(k, d, re) * l / d / (2 * GRAVITY * a ** 2)
+        return c
+
+    if start is None:
+        q = np.broadcast_to(np.sqrt(head / coefficient(None)), shape)
+    else:
+        q = np.broadcast_to(np.asarray(start, dtype=float), shape)
+    for _ in range(iterations):
+        # there are no losses without flow
+        q_new = np.where(
+            head > 0, np.sqrt(head / coefficient(np.maximum(q, 1e-12))), 0
+        )
+        converged = np.all(np.abs(q_new - q) <= 1e-10 * q_new)
+        q = q_new
+        if converged:
+            break
+    return q
+
+
 def d_hyd(width, height):
     """Calculates hydraulic diameter for rectangular profiles"""
     return 4 * (width * height) / (2 * (width + height))
@@ -222,13 +412,11 @@ def reynolds_number(v, d):
 
 def pipe_loss(l, a, k, d, q):
     """Calculates the pipe loss for a given discharge"""
-    v = q / a
+    if q == 0:
+        return 0.0
+    v = abs(q) / a
     re = reynolds_number(v, d)
-    lam = (
-        lambda_turbulent_rough(k, d)
-        if re * k / d > 1300
-        else lambda_turbulent_transition(k, d, re)
-    )
+    lam = lambda_pipe(k, d, re)
     return lam * l / d / (2 * GRAVITY * a ** 2) * q ** 2
 
 
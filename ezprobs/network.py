@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+
+from array import array
+from hashlib import sha256
+from tempfile import gettempdir
+
+import os
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from ezprobs.cache import LRUCache, hash_file, hashed_lines
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+# parsed networks by the SHA-256 of their file
+_networks = LRUCache(8)
+
+NODE_KINDS = ("junction", "reservoir", "tank")
+LINK_KINDS = ("pipe", "pump", "valve")
+
+# flow units of EPANET in m^3/s, the first group uses SI units for all other
+# values, the second one US units
+SI_FLOW_UNITS = {
+    "LPS": 1e-3,
+    "LPM": 1e-3 / 60,
+    "MLD": 1e3 / 86400,
+    "CMH": 1 / 3600,
+    "CMD": 1 / 86400,
+    "CMS": 1.0,
+}
+US_FLOW_UNITS = {
+    "CFS": 0.0283168,
+    "GPM": 6.30902e-5,
+    "MGD": 0.0438126,
+    "IMGD": 0.0526168,
+    "AFD": 0.0142764,
+}
+FOOT = 0.3048
+INCH = 0.0254
+
+
+class Network:
+    """Pipe network with array-backed tables of its nodes and links.
+
+    Nodes and links are numbered in the order of the file, ``node_index`` and
+    ``link_index`` map their ids to these numbers. All values are in SI
+    units, the roughness is the sand roughness in m for the Darcy-Weisbach
+    formula and the coefficient otherwise. Pumps keep their parameters as
+    given in the file."""
+
+    # names of the arrays saved by ``save``
+    fields = (
+        "node_ids",
+        "node_kind",
+        "elevation",
+        "demand",
+        "head",
+        "link_ids",
+        "link_kind",
+        "start",
+        "end",
+        "length",
+        "diameter",
+        "roughness",
+        "minor_loss",
+        "closed",
+        "pump_links",
+        "pump_parameters",
+        "headloss",
+    )
+
+    def __init__(self, **arrays):
+        for name in self.fields:
+            setattr(self, name, arrays[name])
+        self.node_index = {node: i for i, node in enumerate(self.node_ids.tolist())}
+        self.link_index = {link: i for i, link in enumerate(self.link_ids.tolist())}
+
+    def save(self, path):
+        """Saves the tables to the binary file ``path``."""
+        np.savez(path, **{name: getattr(self, name) for name in self.fields})
+
+    @classmethod
+    def load(cls, path):
+        """Loads the tables saved with ``save``."""
+        with np.load(path) as data:
+            return cls(**{name: data[name] for name in cls.fields})
+
+    def components(self):
+        """Returns the number of connected parts of the network and the
+        number of nodes without a connection to a reservoir or tank."""
+        count = len(self.node_ids)
+        graph = coo_matrix(
+            (np.ones(len(self.start)), (self.start, self.end)), shape=(count, count)
+        )
+        parts, labels = connected_components(graph, directed=False)
+        supplied = np.isin(labels, labels[self.node_kind > 0])
+        return parts, int(np.count_nonzero(~supplied))
+
+    def summary(self):
+        """Returns the sizes and totals of the network as dictionary."""
+        parts, unsupplied = self.components()
+        pipes = self.link_kind == 0
+        nodes = np.bincount(self.node_kind, minlength=len(NODE_KINDS))
+        links = np.bincount(self.link_kind, minlength=len(LINK_KINDS))
+        return {
+            "nodes": dict(zip(NODE_KINDS, nodes.tolist())),
+            "links": dict(zip(LINK_KINDS, links.tolist())),
+            "length": float(self.length[pipes].sum()),
+            "demand": float(self.demand.sum()),
+            "headloss": str(self.headloss),
+            "components": int(parts),
+            "unsupplied": unsupplied,
+        }
+
+
+def read_inp(lines):
+    """Parses the nodes and links of an EPANET input file from an iterable of
+    lines.
+
+    The sections JUNCTIONS, RESERVOIRS, TANKS, PIPES, PUMPS and VALVES are
+    read together with the units and the headloss formula of OPTIONS, all
+    other sections are skipped. The values are appended to compact arrays line
+    by line, the node ids of the links are resolved at the end so the
+    sections may appear in any order.
+
+    Raises a ``ValueError`` if the file is invalid."""
+    node_ids = []
+    node_kind = array("b")
+    elevation = array("d")
+    demand = array("d")
+    head = array("d")
+    link_ids = []
+    link_kind = array("b")
+    start = []
+    end = []
+    length = array("d")
+    diameter = array("d")
+    roughness = array("d")
+    minor_loss = array("d")
+    closed = array("b")
+    pump_links = array("q")
+    pump_parameters = []
+    options = {"UNITS": "GPM", "HEADLOSS": "H-W"}
+
+    def link(values, kind, l, d, k, m, status):
+        link_ids.append(values[0])
+        start.append(values[1])
+        end.append(values[2])
+        link_kind.append(kind)
+        length.append(l)
+        diameter.append(d)
+        roughness.append(k)
+        minor_loss.append(m)
+        closed.append(status.upper() == "CLOSED")
+
+    section = None
+    for number, line in enumerate(lines, 1):
+        line = line.split(";", 1)[0].strip()
+        if not line:
+            continue
+        if line.startswith("["):
+            section = line.strip("[]").upper()
+            continue
+        values = line.split()
+        try:
+            if section == "JUNCTIONS":
+                node_ids.append(values[0])
+                node_kind.append(0)
+                elevation.append(float(values[1]))
+                demand.append(float(values[2]) if len(values) > 2 else 0.0)
+                head.append(float(values[1]))
+            elif section == "RESERVOIRS":
+                node_ids.append(values[0])
+                node_kind.append(1)
+                elevation.append(float(values[1]))
+                demand.append(0.0)
+                head.append(float(values[1]))
+            elif section == "TANKS":
+                node_ids.append(values[0])
+                node_kind.append(2)
+                elevation.append(float(values[1]))
+                demand.append(0.0)
+                head.append(float(values[1]) + float(values[2]))
+            elif section == "PIPES":
+                minor = float(values[6]) if len(values) > 6 else 0.0
+                status = values[7] if len(values) > 7 else "OPEN"
+                link(
+                    values, 0, float(values[3]), float(values[4]), float(values[5]),
+                    minor, status,
+                )
+            elif section == "PUMPS":
+                pump_links.append(len(link_ids))
+                pump_parameters.append(" ".join(values[3:]))
+                link(values, 1, 0.0, 0.0, 0.0, 0.0, "OPEN")
+            elif section == "VALVES":
+                minor = float(values[6]) if len(values) > 6 else 0.0
+                link(values, 2, 0.0, float(values[3]), 0.0, minor, "OPEN")
+            elif section == "OPTIONS" and len(values) > 1:
+                options[values[0].upper()] = values[1].upper()
+        except (IndexError, ValueError):
+            raise ValueError(f"invalid line {number} in section {section}")
+
+    index = {node: i for i, node in enumerate(node_ids)}
+    try:
+        start = np.fromiter(map(index.__getitem__, start), np.int64, len(start))
+        end = np.fromiter(map(index.__getitem__, end), np.int64, len(end))
+    except KeyError as e:
+        raise ValueError(f"unknown node {e}")
+
+    units = options["UNITS"]
+    if units in SI_FLOW_UNITS:
+        flow, l, d, k = SI_FLOW_UNITS[units], 1.0, 1e-3, 1e-3
+    elif units in US_FLOW_UNITS:
+        flow, l, d, k = US_FLOW_UNITS[units], FOOT, INCH, 1e-3 * FOOT
+    else:
+        raise ValueError(f"unknown flow units {units}")
+    headloss = options["HEADLOSS"]
+    roughness = np.frombuffer(roughness)
+    return Network(
+        node_ids=np.array(node_ids),
+        node_kind=np.frombuffer(node_kind, dtype=np.int8),
+        elevation=np.frombuffer(elevation) * l,
+        demand=np.frombuffer(demand) * flow,
+        head=np.frombuffer(head) * l,
+        link_ids=np.array(link_ids),
+        link_kind=np.frombuffer(link_kind, dtype=np.int8),
+        start=start,
+        end=end,
+        length=np.frombuffer(length) * l,
+        diameter=np.frombuffer(diameter) * d,
+        roughness=roughness * k if headloss == "D-W" else roughness,
+        minor_loss=np.frombuffer(minor_loss),
+        closed=np.frombuffer(closed, dtype=np.int8).astype(bool),
+        pump_links=np.frombuffer(pump_links, dtype=np.int64),
+        pump_parameters=np.array(pump_parameters, dtype=str),
+        headloss=np.array(headloss),
+    )
+
+
+def _cache_path(key, cache_dir):
+    if cache_dir is None:
+        cache_dir = os.path.join(gettempdir(), "ezprobs-networks")
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, f"{key}.npz")
+
+
+def load_network(path, cache_dir=None):
+    """Returns the network of the EPANET input file at ``path``.
+
+    Parsed networks are kept in memory and saved as ``.npz`` file named
+    after the hash of the input file to ``cache_dir``, by default a
+    directory in the temporary directory, so they are loaded in a fraction
+    of the time later on."""
+    key = hash_file(path)
+    network = cached_network(key, cache_dir)
+    if network is None:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            network = read_inp(f)
+        network.save(_cache_path(key, cache_dir))
+        _networks.put(key, network)
+    return network
+
+
+def upload_network(stream, cache_dir=None):
+    """Parses a network from the binary ``stream`` of an upload and caches
+    it like ``load_network``. Returns the hash of the upload and the
+    network."""
+    digest = sha256()
+    network = read_inp(hashed_lines(stream, digest))
+    key = digest.hexdigest()
+    network.save(_cache_path(key, cache_dir))
+    _networks.put(key, network)
+    return key, network
+
+
+def cached_network(key, cache_dir=None):
+    """Returns the network with the hash ``key`` from memory or from its
+    binary file or ``None`` if it was never parsed."""
+    network = _networks.get(key)
+    if network is None:
+        path = _cache_path(key, cache_dir)
+        if os.path.exists(path):
+            network = Network.load(path)
+            _networks.put(key, network)
+    return network
@@ -1,5 +1,51 @@
 #!/usr/bin/env python3
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from copy import copy
+from importlib import import_module
+from io import BytesIO
+from itertools import product, repeat
+from threading import Lock, get_native_id
+from time import perf_counter
+from urllib.parse import parse_qsl
+
+import os
+import re
+
+from flask import (
+    Blueprint,
+    Response,
+    abort,
+    current_app,
+    jsonify,
+    render_template,
+    request,
+    session,
+)
+from markupsafe import Markup
+from ezprobs.cache import LRUCache
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.image import imsave
+
+
+# all instantiated problems by their name
+PROBLEMS = {}
+# the plots are rendered by threads of the server process instead of
+# processes, set from the config
+render_threads = False
+
+_executor = None
+_executor_lock = Lock()
+_prefetch_executor = None
+_job_executor = None
+_mathtext_lock = Lock()
+# values of the solution templates marked by ``placeholder``
+_placeholder = re.compile(r"\\class\{solution-(\w+)\}\{([^{}]*)\}")
+
 
 class Parameter:
     """Holds a parameter and it's description for a problem."""
@@ -33,6 +79,29 @@ class Parameter:
         self.val_max = val_max
         self.val_step = val_step
 
+    def parse(self, value):
+        """Converts ``value`` to a number.
+
+        Raises a ``ValueError`` if the value is not a number or is not between
+        the minimum and maximum value."""
+        value = float(value)
+        if not self.val_min <= value <= self.val_max:
+            raise ValueError(
+                f"{self.name} ({value}) must be between minimum ({self.val_min}) and maximum ({self.val_max})"
+            )
+        return value
+
+    def values(self):
+        """Returns all values which can be selected with the slider."""
+        count = int(round((self.val_max - self.val_min) / self.val_step)) + 1
+        return [round(self.val_min + i * self.val_step, 9) for i in range(count)]
+
+    def at(self, value):
+        """Returns a copy of the parameter with the slider set to ``value``."""
+        parameter = copy(self)
+        parameter.val_initial = value
+        return parameter
+
 
 class Plot:
     """Plot which should appear over the parameter section."""
@@ -41,3 +110,634 @@ class Plot:
         self.url = url
         self.alt = alt
         self.caption = caption
+
+
+class Solution(dict):
+    """Holds the computed values of a problem.
+
+    The solution is a plain dictionary so it can be passed to the templates,
+    stored in the session and serialized to JSON."""
+
+
+class Timings:
+    """Collects the number of calls and the durations of named operations."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = Lock()
+
+    @contextmanager
+    def measure(self, name):
+        """Measures the duration of the enclosed block."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, perf_counter() - start)
+
+    def add(self, name, duration):
+        """Adds a call to ``name`` which took ``duration`` seconds."""
+        with self._lock:
+            count, total, maximum = self._data.get(name, (0, 0.0, 0.0))
+            self._data[name] = (count + 1, total + duration, max(maximum, duration))
+
+    def summary(self):
+        """Returns the collected timings as dictionary."""
+        with self._lock:
+            return {
+                name: {
+                    "count": count,
+                    "total": total,
+                    "mean": total / count,
+                    "max": maximum,
+                }
+                for name, (count, total, maximum) in self._data.items()
+            }
+
+
+def render_executor(processes):
+    """Returns the process pool shared by all problems to render plots and
+    run simulations, a thread pool if ``render_threads`` is set.
+
+    Returns ``None`` if ``processes`` is zero and the plots should be rendered
+    in the calling process."""
+    global _executor
+    if not processes:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            if render_threads:
+                _executor = ThreadPoolExecutor(
+                    max_workers=processes, thread_name_prefix="render"
+                )
+            else:
+                _executor = ProcessPoolExecutor(max_workers=processes)
+        return _executor
+
+
+def _lower_priority():
+    """Lowers the scheduling priority of the calling thread to idle."""
+    try:
+        os.setpriority(os.PRIO_PROCESS, get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+
+
+def prefetch_executor():
+    """Returns the thread pool shared by all problems to prefetch plots.
+
+    The threads run with the lowest scheduling priority where supported so
+    prefetching doesn't slow down the actual requests."""
+    global _prefetch_executor
+    with _executor_lock:
+        if _prefetch_executor is None:
+            _prefetch_executor = ThreadPoolExecutor(
+                max_workers=2,
+                thread_name_prefix="prefetch",
+                initializer=_lower_priority,
+            )
+        return _prefetch_executor
+
+
+def job_executor():
+    """Returns the thread pool shared by all problems to run long simulations
+    in the background.
+
+    Jobs run one at a time with the lowest scheduling priority where
+    supported."""
+    global _job_executor
+    with _executor_lock:
+        if _job_executor is None:
+            _job_executor = ThreadPoolExecutor(
+                max_workers=1,
+                thread_name_prefix="job",
+                initializer=_lower_priority,
+            )
+        return _job_executor
+
+
+class _LockedParser:
+    """Math text parser which lays out one text at a time."""
+
+    def __init__(self, parser):
+        self.parser = parser
+
+    def parse(self, *args, **kwargs):
+        # matplotlib's parser keeps its state in the class, which is not
+        # thread-safe, so the text layout of all threads is serialized
+        with _mathtext_lock:
+            return self.parser.parse(*args, **kwargs)
+
+
+class Canvas(FigureCanvasAgg):
+    """Agg canvas whose renderer lays out math text under a lock so several
+    threads can draw at once."""
+
+    def get_renderer(self, *args, **kwargs):
+        renderer = super().get_renderer(*args, **kwargs)
+        if not isinstance(renderer.mathtext_parser, _LockedParser):
+            renderer.mathtext_parser = _LockedParser(renderer.mathtext_parser)
+        return renderer
+
+
+def subplots(nrows=1, ncols=1, figsize=None, **kwargs):
+    """Creates a figure with a grid of axes like ``pyplot.subplots``.
+
+    The figure is drawn on its own ``Canvas`` and never registered with
+    pyplot, so figures can be created and rendered by several threads at
+    once."""
+    fig = Figure(figsize=figsize)
+    Canvas(fig)
+    return fig, fig.subplots(nrows, ncols, **kwargs)
+
+
+def fill_vertices(x, y1, y2=0):
+    """Returns the vertices of the polygon drawn by ``fill_between(x, y1, y2)``
+    for updating its data with ``set_verts``."""
+    x = np.asarray(x, dtype=float)
+    y1 = np.broadcast_to(y1, x.shape)
+    y2 = np.broadcast_to(y2, x.shape)
+    return np.concatenate(
+        [
+            [(x[0], y2[0])],
+            np.column_stack((x, y1)),
+            [(x[-1], y2[-1])],
+            np.column_stack((x, y2))[::-1],
+        ]
+    )
+
+
+def placeholder(name, text):
+    """Typesets the value ``text`` of a solution template as placeholder
+    ``name``, available in all templates.
+
+    The page patches the typeset placeholders in place if only their values
+    change instead of replacing and typesetting the whole solution."""
+    return Markup("\\class{{solution-{}}}{{{}}}").format(name, text)
+
+
+def split_placeholders(html):
+    """Returns the rendered solution ``html`` with empty placeholders and the
+    values of the placeholders by their name."""
+    values = dict(_placeholder.findall(html))
+    return _placeholder.sub(r"\\class{solution-\1}{}", html), values
+
+
+def render_figure(figure, *args):
+    """Creates the figure ``figure(*args)`` and returns it rendered as PNG."""
+    fig = figure(*args)
+    if not isinstance(fig.canvas, Canvas):
+        Canvas(fig)
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+class Layers:
+    """Figure of a layered problem whose static artists are rasterized once.
+
+    The figure is created by ``problem.background``, everything except the
+    returned artists is drawn into a background. Rendering a solution
+    restores the background and only draws the artists updated by
+    ``problem.foreground`` on top of it. A figure can only be drawn by one
+    thread at a time, ``Problem.draw_solution`` keeps a pool of them."""
+
+    def __init__(self, problem, solution):
+        self.problem = problem
+        self.fig, self.artists = problem.background(solution)
+        for artist in self.artists.values():
+            artist.set_animated(True)
+        self.fig.canvas.draw()
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self.dynamic = sorted(self.artists.values(), key=lambda a: a.get_zorder())
+
+    def render(self, solution):
+        """Returns the figure for ``solution`` as PNG."""
+        self.problem.foreground(self.artists, solution)
+        canvas = self.fig.canvas
+        canvas.restore_region(self.background)
+        renderer = canvas.get_renderer()
+        for artist in self.dynamic:
+            artist.draw(renderer)
+        buffer = BytesIO()
+        imsave(buffer, np.asarray(canvas.buffer_rgba()), format="png")
+        return buffer.getvalue()
+
+
+def render_png(module, name, params):
+    """Renders the plot of the problem ``name`` as PNG.
+
+    This is the entry point for the rendering processes. The problem is looked
+    up after importing the ``module`` it is defined in."""
+    import_module(module)
+    return PROBLEMS[name].draw(params)
+
+
+class Problem:
+    """Base class of a problem.
+
+    Subclasses declare the ``parameters`` of the problem and implement
+    ``solve`` and ``figure``. Both must only depend on their arguments so the
+    results can be cached and computed outside of a request. Problems whose
+    figure is mostly the same for all solutions can be ``layered`` instead
+    of implementing ``figure``. The routes of the problem are provided by
+    ``blueprint``."""
+
+    # unique name of the problem, used as name of the blueprint
+    name = None
+    # template of the problem page and the solution section
+    template = None
+    solution_template = None
+    # list of ``Parameter`` instances with their default values
+    parameters = []
+    plot = None
+
+    cache_size = 8192
+    plot_cache_size = 128
+    # maximum number of states accepted by one request of the batch API
+    batch_size = 10000
+    # maximum number of states waiting to be prefetched
+    prefetch_size = 32
+    # accuracies the batch API can solve states with
+    accuracies = ("exact",)
+    # problems whose figure is split into ``background`` and ``foreground``,
+    # the background is rasterized once and reused for every plot
+    layered = False
+
+    def __init__(self):
+        self.solutions = LRUCache(self.cache_size)
+        self.plots = LRUCache(self.plot_cache_size)
+        self.timings = Timings()
+        self._prefetching = set()
+        self._prefetching_lock = Lock()
+        self._layers = []
+        self._layers_lock = Lock()
+        PROBLEMS[self.name] = self
+
+    def solve(self, params):
+        """Computes the ``Solution`` for the given parameter values.
+
+        ``params`` is a dictionary holding the value of every parameter in the
+        unit displayed at the slider."""
+        raise NotImplementedError
+
+    def figure(self, solution):
+        """Creates the matplotlib figure displaying the given solution."""
+        if not self.layered:
+            raise NotImplementedError
+        fig, artists = self.background(solution)
+        self.foreground(artists, solution)
+        return fig
+
+    def background(self, solution):
+        """Creates the figure of a ``layered`` problem with everything that is
+        the same for all solutions. Only the parts of ``solution`` which do not
+        depend on the parameters may be used.
+
+        Returns the figure and a dictionary of the artists which change with
+        the solution, these are set by ``foreground`` and drawn on top of the
+        rest in the order of their z-order. Static artists which have to
+        cover them belong to the dictionary as well."""
+        raise NotImplementedError
+
+    def foreground(self, artists, solution):
+        """Updates the ``artists`` returned by ``background`` to display the
+        given solution."""
+        raise NotImplementedError
+
+    def solve_batch(self, states):
+        """Computes the solutions for a list of parameter values.
+
+        Subclasses should override this with a vectorized implementation, by
+        default every state is solved on its own."""
+        return [self.solution(params) for params in states]
+
+    def arrays(self, states):
+        """Returns the values of every parameter in ``states`` as numpy array."""
+        return {
+            p.name: np.array([params[p.name] for params in states], dtype=float)
+            for p in self.parameters
+        }
+
+    def defaults(self):
+        """Returns the initial values of all parameters."""
+        return {p.name: p.val_initial for p in self.parameters}
+
+    def parse(self, values):
+        """Extracts the parameter values from the mapping ``values``.
+
+        Missing parameters are set to their initial value. Raises a
+        ``ValueError`` if a value is invalid."""
+        return {p.name: p.parse(values.get(p.name, p.val_initial)) for p in self.parameters}
+
+    def key(self, params):
+        """Returns the cache key for the given parameter values."""
+        return tuple(round(float(params[p.name]), 9) for p in self.parameters)
+
+    def grid(self):
+        """Returns the parameter values of all states selectable with the sliders."""
+        names = [p.name for p in self.parameters]
+        return [
+            dict(zip(names, values))
+            for values in product(*(p.values() for p in self.parameters))
+        ]
+
+    def solution(self, params):
+        """Returns the cached solution for ``params`` or computes it."""
+        key = self.key(params)
+        solution = self.solutions.get(key)
+        if solution is None:
+            with self.timings.measure("solve"):
+                solution = self.solve(params)
+            self.solutions.put(key, solution)
+        return solution
+
+    def draw(self, params):
+        """Renders the figure for ``params`` as PNG."""
+        return self.draw_solution(self.solution(params))
+
+    def draw_solution(self, solution):
+        """Renders the figure displaying ``solution`` as PNG.
+
+        Layered problems draw the foreground on a background taken from a pool
+        of ``Layers``, a new one is only set up if all are in use."""
+        if not self.layered:
+            return render_figure(self.figure, solution)
+        with self._layers_lock:
+            layers = self._layers.pop() if self._layers else None
+        if layers is None:
+            layers = Layers(self, solution)
+        try:
+            return layers.render(solution)
+        finally:
+            with self._layers_lock:
+                self._layers.append(layers)
+
+    def render(self, params, processes=0):
+        """Returns the cached plot for ``params`` or renders it.
+
+        If ``processes`` is not zero the plot is rendered in the shared process
+        pool."""
+        key = self.key(params)
+        png = self.plots.get(key)
+        if png is None:
+            with self.timings.measure("render"):
+                executor = render_executor(processes)
+                if executor is None:
+                    png = self.draw(params)
+                else:
+                    png = executor.submit(
+                        render_png, type(self).__module__, self.name, params
+                    ).result()
+            self.plots.put(key, png)
+        return png
+
+    def precompute(self, render=False, processes=0):
+        """Computes the solutions of all states selectable with the sliders.
+
+        If ``render`` is set the plots are rendered as well, but only if all of
+        them fit into the plot cache."""
+        grid = self.grid()
+        with self.timings.measure("precompute"):
+            for params in grid:
+                self.solution(params)
+            if not render or len(grid) > self.plots.maxsize:
+                return
+            executor = render_executor(processes)
+            if executor is None:
+                pngs = map(self.draw, grid)
+            else:
+                pngs = executor.map(
+                    render_png, repeat(type(self).__module__), repeat(self.name), grid
+                )
+            for params, png in zip(grid, pngs):
+                self.plots.put(self.key(params), png)
+
+    def neighbours(self, params):
+        """Returns the states reachable by moving one slider by one step."""
+        states = []
+        for p in self.parameters:
+            for step in (-p.val_step, p.val_step):
+                value = round(params[p.name] + step, 9)
+                if p.val_min <= value <= p.val_max:
+                    states.append({**params, p.name: value})
+        return states
+
+    def prefetch(self, states, processes=0):
+        """Renders the plots of ``states`` in the background.
+
+        States already cached or waiting to be rendered are skipped, as are
+        all states once ``prefetch_size`` states are waiting."""
+        for params in states:
+            key = self.key(params)
+            with self._prefetching_lock:
+                if (
+                    key in self.plots
+                    or key in self._prefetching
+                    or len(self._prefetching) >= self.prefetch_size
+                ):
+                    continue
+                self._prefetching.add(key)
+            prefetch_executor().submit(self._prefetch, key, params, processes)
+
+    def _prefetch(self, key, params, processes):
+        try:
+            with self.timings.measure("prefetch"):
+                self.render(params, processes)
+        finally:
+            with self._prefetching_lock:
+                self._prefetching.discard(key)
+
+    def prefetch_neighbours(self, params):
+        """Prefetches the neighbours of ``params`` if enabled in the config."""
+        if current_app.config.get("prefetch", False):
+            self.prefetch(
+                self.neighbours(params), current_app.config.get("render_processes", 0)
+            )
+
+    @property
+    def session_key(self):
+        return f"{self.name}_params"
+
+    def request_params(self):
+        """Returns the parameter values submitted with the current request."""
+        if request.method == "POST":
+            try:
+                return self.parse(request.form)
+            except ValueError as e:
+                abort(400, str(e))
+        return self.defaults()
+
+    def session_params(self):
+        """Returns the parameter values stored in the session."""
+        return session.get(self.session_key, self.defaults())
+
+    def page_context(self, params):
+        """Returns the variables of the problem template for ``params``."""
+        return dict(
+            plot=self.plot,
+            parameters=[p.at(params[p.name]) for p in self.parameters],
+            solution=self.solution(params),
+        )
+
+    def index(self):
+        params = self.request_params()
+        session[self.session_key] = params
+        self.prefetch_neighbours(params)
+
+        return render_template(self.template, **self.page_context(params))
+
+    def plot_function(self):
+        # plots requested with their parameters in the url can be cached by
+        # the browser, all others depend on the session
+        if any(p.name in request.args for p in self.parameters):
+            try:
+                params = self.parse(request.args)
+            except ValueError as e:
+                abort(400, str(e))
+            max_age = 3600
+        else:
+            params = self.session_params()
+            max_age = 0
+
+        response = Response(
+            self.render(params, current_app.config.get("render_processes", 0)),
+            mimetype="image/png",
+        )
+        response.cache_control.max_age = max_age
+        return response
+
+    def ajax(self):
+        params = self.request_params()
+        session[self.session_key] = params
+        self.prefetch_neighbours(params)
+
+        return render_template(
+            self.solution_template,
+            solution=self.solution(params),
+        )
+
+    def ajax_values(self):
+        """Returns the values of the solution placeholders which differ from
+        the state ``previous`` displayed by the client.
+
+        If anything else changed, e.g. a text depending on the solution, or
+        the previous state is missing the rendered solution is returned as
+        ``html`` instead."""
+        params = self.request_params()
+        session[self.session_key] = params
+        self.prefetch_neighbours(params)
+
+        html = render_template(self.solution_template, solution=self.solution(params))
+        skeleton, values = split_placeholders(html)
+        try:
+            previous = self.parse(dict(parse_qsl(request.form["previous"])))
+        except (KeyError, ValueError):
+            return jsonify(version=1, html=html)
+        previous_skeleton, previous_values = split_placeholders(
+            render_template(self.solution_template, solution=self.solution(previous))
+        )
+        if skeleton != previous_skeleton:
+            return jsonify(version=1, html=html)
+        return jsonify(
+            version=1,
+            values={
+                name: value
+                for name, value in values.items()
+                if previous_values.get(name) != value
+            },
+        )
+
+    def prefetch_hint(self):
+        """Prefetches the state the client is about to request.
+
+        The client sends the state while a slider is dragged, the state and
+        its neighbours are rendered in the background."""
+        params = self.request_params()
+        if current_app.config.get("prefetch", False):
+            self.prefetch(
+                [params] + self.neighbours(params),
+                current_app.config.get("render_processes", 0),
+            )
+        return "", 204
+
+    def api_parameters(self):
+        return jsonify(
+            version=1,
+            name=self.name,
+            parameters=[
+                {
+                    "name": p.name,
+                    "min": p.val_min,
+                    "max": p.val_max,
+                    "step": p.val_step,
+                    "initial": p.val_initial,
+                    "unit": p.unit,
+                    "description": p.description,
+                }
+                for p in self.parameters
+            ],
+        )
+
+    def api_solve(self):
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get("states"), list):
+            return jsonify(error="expected an object with a list of states"), 400
+        if len(data["states"]) > self.batch_size:
+            return jsonify(error=f"at most {self.batch_size} states are allowed"), 400
+        accuracy = data.get("accuracy", "exact")
+        if accuracy not in self.accuracies:
+            return (
+                jsonify(error=f"accuracy must be {' or '.join(self.accuracies)}"),
+                400,
+            )
+        try:
+            states = [self.parse(params) for params in data["states"]]
+        except (AttributeError, TypeError, ValueError) as e:
+            return jsonify(error=str(e)), 400
+
+        return jsonify(
+            version=1,
+            accuracy=accuracy,
+            states=states,
+            **self.batch(states, accuracy),
+        )
+
+    def batch(self, states, accuracy):
+        """Solves ``states`` for the batch API with one of the
+        ``accuracies``. Returns the ``solutions`` and anything else the
+        response should hold as dictionary."""
+        with self.timings.measure("solve_batch"):
+            solutions = self.solve_batch(states) if states else []
+        return {"solutions": solutions}
+
+    def caches(self):
+        """Returns the caches of the problem reported by ``stats`` by name."""
+        return {
+            "solutions": self.solutions,
+            "plots": self.plots,
+        }
+
+    def stats(self):
+        return jsonify(
+            timings=self.timings.summary(),
+            **{name: cache.info() for name, cache in self.caches().items()},
+        )
+
+    def blueprint(self):
+        """Creates the blueprint with the routes of the problem."""
+        bp = Blueprint(self.name, type(self).__module__)
+        bp.add_url_rule("/", "index", self.index, methods=["POST", "GET"])
+        bp.add_url_rule("/plot", "plot_function", self.plot_function)
+        bp.add_url_rule("/ajax", "ajax", self.ajax, methods=["POST", "GET"])
+        bp.add_url_rule(
+            "/values", "ajax_values", self.ajax_values, methods=["POST"]
+        )
+        bp.add_url_rule("/prefetch", "prefetch", self.prefetch_hint, methods=["POST"])
+        bp.add_app_template_global(placeholder)
+        bp.add_url_rule("/stats", "stats", self.stats)
+        bp.add_url_rule("/api/v1/", "api_parameters", self.api_parameters)
+        bp.add_url_rule(
+            "/api/v1/solve", "api_solve", self.api_solve, methods=["POST"]
+        )
+        return bp
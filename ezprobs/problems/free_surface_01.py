@@ -1,29 +1,35 @@
 #!/usr/bin/env python3
 
-from flask import Blueprint, Response, render_template, request, session
 from ezprobs.hydraulics import (
-    t_n_rect,
+    calibrate_rect,
+    t_n_rect_vec,
     t_crit_rect,
-    l_transition_i_r_rect,
-    depth_bernoulli_upstream,
-    depth_bernoulli_downstream,
-    froude,
 )
 
-from ezprobs.problems import Parameter, Plot
+from ezprobs.cache import LRUCache
+from ezprobs.problems import (
+    Parameter,
+    Plot,
+    Problem,
+    Solution,
+    fill_vertices,
+    render_figure,
+    subplots,
+)
+from ezprobs.export import ExerciseSheets
+from ezprobs.surrogate import SurrogateBatch
+from ezprobs.uncertainty import UncertaintyMode
+from ezprobs.survey import cached_survey, upload_survey
+from ezprobs.unsteady import UnsteadyChannel
+from flask import Response, jsonify, request
+from scipy.stats import t as student_t
 from ezprobs.units import M, S, M3PS, GRAVITY, PERMILLE
-from ezprobs.dict import DICT_GER, DICT_ENG
+from ezprobs.dict import DICT_GER
 
-from io import BytesIO
-from math import sqrt
+from io import StringIO
 
+import csv
 import numpy as np
-import matplotlib as mpl
-
-
-mpl.use("Agg")
-
-import matplotlib.pyplot as plt
 
 __author__ = "Manuel Pirker"
 __copyright__ = "Copyright (c) 2021 Manuel Pirkerr"
@@ -31,40 +37,28 @@ __license__ = "MIT"
 __email__ = "manuel.pirker@tugraz.at"
 
 
-bp = Blueprint("free_surface_01", __name__)
-
+lang = DICT_GER
 
-def compute_solution():
-    w = 30 * M
-    q = 150 * M3PS
-    iso = 8 * PERMILLE
-
-    ks = 40 * M ** (1 / 3) / S
-
-    if request.method == "POST":
-        ks = int(request.form["ks"]) * M ** (1 / 3) / S
-        iso = float(request.form["iso"]) * PERMILLE
-        q = int(request.form["q"]) * M3PS
-
-    t_crit = t_crit_rect(q, w)
-    t_n = t_n_rect(q, ks, iso, w)
 
+def uncertainty_kernel(inputs, q, w, t_n):
+    """Computes the normal depths for the discharge ``q`` and the discharges
+    at the nominal normal depth ``t_n`` for samples of roughness and slope."""
+    ks = inputs["ks"]
+    iso = inputs["iso"]
+    a = w * t_n
+    r = a / (w + 2 * t_n)
     return {
-        "iso": iso,
-        "w": w,
-        "q": q,
-        "t_crit": t_crit,
-        "t_n": t_n,
-        "ks": ks,
+        "t_n": t_n_rect_vec(q, ks, iso, w),
+        "q": ks * np.sqrt(iso) * r ** (2 / 3) * a,
     }
 
 
-@bp.route("/", methods=["POST", "GET"])
-def index():
-    lang = DICT_GER
-    
-    solution = compute_solution()
-    session["solution"] = solution
+class FreeSurface01(
+    UnsteadyChannel, UncertaintyMode, SurrogateBatch, ExerciseSheets, Problem
+):
+    name = "free_surface_01"
+    template = "problems/free_surface_01.html"
+    solution_template = "problems/free_surface_01_solution.html"
 
     parameters = [
         Parameter(
@@ -73,7 +67,7 @@ def index():
             15,
             85,
             5,
-            solution["ks"],
+            40,
             unit="m^{1/3}/s",
             description=lang["kst_river"],
         ),
@@ -83,7 +77,7 @@ def index():
             5,
             12,
             0.5,
-            solution["iso"] / PERMILLE,
+            8,
             unit="\\unicode{0x2030}",
             description=lang["iso"],
         ),
@@ -93,184 +87,447 @@ def index():
             100,
             200,
             5,
-            solution["q"] / M3PS,
+            150,
             unit="m^3/s",
             description=lang["discharge"],
         ),
     ]
 
     plot = Plot("plot", alt="surface", caption="Water Surface")
-
-    return render_template(
-        "problems/free_surface_01.html",
-        plot=plot,
-        parameters=parameters,
-        solution=solution,
-    )
-
-
-@bp.route("/plot")
-def plot_function():
-    lang = DICT_GER
-    
-    ## load values  -----------------------------------------------------------
-    iso = session["solution"]["iso"]
-    w = session["solution"]["w"]
-    q = session["solution"]["q"]
-    t_crit = session["solution"]["t_crit"]
-    t_n = session["solution"]["t_n"]
-    # ks = session["solution"]["ks"]
-    
-    v = q/(t_n*w)
-    fr = v/np.sqrt(GRAVITY*t_n)
-
-    if np.round(t_crit,1) == np.round(t_n,1):
-        strFlow = lang["crit"]
-        t_n = t_crit
-        fr=1
-        
-    elif t_crit < t_n:
-        strFlow = lang["sub_l"]
-    else:
-        strFlow = lang["super_l"]
-    ## begin calculation  -----------------------------------------------------
-    # define plot size
-    x_min = -50 * M
-    x_max = 0 * M
-    y_min = -1 * M
-    y_max = 5 * M
-
-    xlabels = []
-    xticks = []
-    
-    
-    xx = np.array([x_min, x_max])
-    so = -xx*iso
-    head = (q / (w * t_n)) ** 2 / (2 * GRAVITY)
-	
-	
-    ## begin plotting sequence ------------------------------------------------
-    fig, ax = plt.subplots(1,2,figsize=(9,5))
-    ax[0].fill_between(xx, so, so + t_n, color="b", alpha=0.1)
-    ax[0].fill_between(xx, so, so - 0.5, color="k", alpha=0.1)
-
-    # plot the sole
-    ax[0].plot([x_min, x_max], [x_min * -iso, x_max * -iso], "k", lw=1.5)
-
-    #ax.plot(xx, so + t_crit, "k:", label="Krit. Wassertiefe", lw=1.5)
-    #ax.plot(xx, so + depth, "b", label="Wasserspiegel", lw=1.5)
-    #ax.plot(head_xx, head_so + head_depth + head, "r--", label="Energielinie", lw=1.5)
-
-    ax[0].plot(xx, so + t_crit, "k:", label=lang["tcrit"], lw=2)
-    ax[0].plot(xx, so + t_n, "b", label=lang["wline_l"], lw=1.5)
-    ax[0].plot(xx, so + t_n + head, "r--", label=lang["eline_l"], lw=1.5)
-    
-    ax[0].text(np.mean(xx), y_max, f"Fr = {fr:3.2f}", va="top", ha="center", weight="bold")
-
-    ax[0].set_title(f"{strFlow}", 
-        fontsize=12, 
-        fontweight="bold",
-        fontstyle="italic")
-    ## figure style settings --------------------------------------------------
-    ax[0].set_frame_on(False)
-    ax[0].xaxis.grid()
-    ax[0].set_xlim((x_min,x_max)) # keep x=0 in center of plot
-    #ax.set_xlim(x_min, x_max)
-    ax[0].set_xticks(xticks)
-    ax[0].set_xticklabels(xlabels)
-
-    ax[0].axhline(y=-x_min * iso + t_n + head, color="k", lw=0.5, alpha=0.4)
-    ax[0].axhline(y=-x_max * iso, color="k", lw=0.5, alpha=0.4)
-    ax[0].set_ylim(y_min, y_max)
-    ax[0].set_yticks(
-        [
-            -x_max * iso,
-            -x_min * iso,
-            -x_min * iso + t_crit,
-            -x_min * iso + t_n + head,
+    layered = True
+    surrogate_outputs = ["t_n", "t_crit"]
+    uncertain_inputs = {"ks": 0.1, "iso": 0.1}
+    uncertainty_outputs = {"t_n": "$t_N$ [m]", "q": "$Q(t_N)$ [m$^3$/s]"}
+    # discharges of the rating curve
+    rating_curve_discharges = np.linspace(1, 400, 400) * M3PS
+    # maximum number of surveyed points of an upload
+    survey_max_points = 1000000
+
+    def __init__(self):
+        super().__init__()
+        self.rating_curves = LRUCache(64)
+
+    def solve(self, params):
+        return self.solve_batch([params])[0]
+
+    def solve_batch(self, states):
+        values = self.arrays(states)
+        w = 30 * M
+        ks = values["ks"] * M ** (1 / 3) / S
+        iso = values["iso"] * PERMILLE
+        q = values["q"] * M3PS
+
+        t_crit = t_crit_rect(q, w)
+        t_n = t_n_rect_vec(q, ks, iso, w)
+
+        return [
+            Solution(
+                iso=iso[i],
+                w=w,
+                q=q[i],
+                t_crit=t_crit[i],
+                t_n=t_n[i],
+                ks=ks[i],
+            )
+            for i in range(len(states))
         ]
-    )
-    #ax.set_yticklabels(["$B.H.$", "$Sohle$", "$W.L.$", "$E.H.$"])
-    ax[0].set_yticklabels([lang["href_s"], lang["bed"], "$t_{crit}$", lang["ehorizont_s"]])
-
-    secax = ax[0].secondary_yaxis("right")
-    secax.set_yticks(
-        np.sort([
-            -x_max * iso,
-            -x_max * iso + t_n,
-            -x_max * iso + t_n + head,
-        ])
-    )
-    #secax.set_yticklabels(["$B.H.$", "$W.L.$", "$E.L.$", "$E.H.$"])
-    if np.round(t_crit,1) == np.round(t_n,1):
-        secax.set_yticklabels([lang["href_s"], "$t = t_{crit}$", lang["eline_s"]])
-    else:
-        secax.set_yticklabels([lang["href_s"], "$t = t_N$", lang["eline_s"]])
-    
-
-    secax.spines["right"].set_visible(False)
-    ax[0].spines["right"].set_visible(False)
-
-    #ax.legend(loc="right")
-    ax[0].legend(loc='upper center', bbox_to_anchor=(0.5, -0.05),
-          fancybox=True, shadow=True, ncol=3)
-    
-    ## second axes diagram
-    xx = np.linspace(0.001,10, 100)
-    xx1 = np.linspace(0.001,t_crit, 50)
-    xx2 = np.linspace(t_crit,10, 50)
-    heads = (q / (w * xx)) ** 2 / (2 * GRAVITY)
-    heads1 = (q / (w * xx1)) ** 2 / (2 * GRAVITY)
-    heads2 = (q / (w * xx2)) ** 2 / (2 * GRAVITY)
-    crit_head = (q / (w * t_crit)) ** 2 / (2 * GRAVITY)
-    
-    ax[1].plot(xx + heads, xx, color='k', lw=2)
-    ax[1].fill_betweenx( xx1, xx1 + heads1, color='g', alpha=0.15)
-    ax[1].fill_betweenx( xx2, xx2 + heads2, color='r', alpha=0.15)
-    ax[1].fill_betweenx( [0,-0.5], [5,5], color='k', alpha=0.1)
-    ax[1].plot(xx, xx, color='k', lw=1.5, ls='--')
-    ax[1].plot([0, 5], [t_crit, t_crit], color='k', lw=2, ls=':')
-    ax[1].plot([0, t_n], [t_n, t_n], color='b', lw=2, label=lang["wlvl"])
-    ax[1].plot([t_n, t_n+head], [t_n, t_n], color='r', lw=2, label=lang["vlvl"])
-    
-    ax[1].text(1,0.5,lang["super_s"], color='grey', size=12, style="italic", weight='bold')
-    ax[1].text(1,3,lang["sub_s"], color='grey', size=12, style="italic", weight='bold')
-    
-    ax[1].axis("equal")
-    ax[1].set_xlim((0,5))
-    ax[1].set_ylim(ax[0].get_ylim())
-    ax[1].set_frame_on(False)
-    ax[1].set_xticks(np.sort([
-            0,
-            t_crit + crit_head,
-        ]))
-    ax[1].set_xticklabels(["0","$H_{min}$"])
-    ax[1].set_yticks(np.sort([
-            -x_max * iso,
-            -x_max * iso + t_n,
-        ]))
-    ax[1].set_yticklabels([" "," "])
-    ax[1].xaxis.grid()
-    ax[1].yaxis.grid()
-    ax[1].set_xlabel(lang["ehead"])
-    ax[1].set_title(f"q={q:4.1f} $m^3/s$")
-    
-    ax[1].legend(loc='upper left',
-        fancybox=True, shadow=True, ncol=1)
-    
-    ## cache figure -----------------------------------------------------------
-    buffer = BytesIO()
-    fig.savefig(buffer, format="png")
-    plt.close(fig)
-    return Response(buffer.getvalue(), mimetype="image/png")
-
-
-@bp.route("/ajax", methods=["POST", "GET"])
-def ajax():
-    solution = compute_solution()
-    session["solution"] = solution
-
-    return render_template(
-        "problems/free_surface_01_solution.html",
-        solution=solution,
-    )
+
+    def uncertainty_model(self, params):
+        solution = self.solution(params)
+        return (
+            uncertainty_kernel,
+            {"ks": solution["ks"], "iso": solution["iso"]},
+            {"q": solution["q"], "w": solution["w"], "t_n": solution["t_n"]},
+        )
+
+    def channel(self, params, sections):
+        return {
+            "length": 10000 * M,
+            "width": 30 * M,
+            "slope": params["iso"] * PERMILLE,
+            "strickler_roughness": params["ks"] * M ** (1 / 3) / S,
+            "discharge": params["q"] * M3PS,
+        }
+
+    def calibrate(self, depths, discharges, params, fit="ks", confidence=0.95):
+        """Estimates the strickler value or the slope from observed depths and
+        discharges, the other one is taken from ``params``.
+
+        Returns the estimate with its standard error and confidence interval
+        in the units of the sliders."""
+        unit = M ** (1 / 3) / S if fit == "ks" else PERMILLE
+        estimate, error, residuals = calibrate_rect(
+            depths,
+            discharges,
+            params["ks"] * M ** (1 / 3) / S,
+            params["iso"] * PERMILLE,
+            30 * M,
+            fit,
+        )
+        half_width = student_t.ppf((1 + confidence) / 2, len(depths) - 1) * error
+        return {
+            "parameter": fit,
+            "estimate": estimate / unit,
+            "standard_error": error / unit,
+            "confidence": confidence,
+            "interval": [
+                (estimate - half_width) / unit,
+                (estimate + half_width) / unit,
+            ],
+            "rms": float(np.sqrt(np.mean(residuals ** 2))),
+            "residuals": residuals.tolist(),
+        }
+
+    def api_calibrate(self):
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get("observations"), list):
+            return jsonify(error="expected an object with a list of observations"), 400
+        observations = data["observations"]
+        if not 2 <= len(observations) <= self.batch_size:
+            return (
+                jsonify(error=f"between 2 and {self.batch_size} observations are required"),
+                400,
+            )
+        fit = data.get("fit", "ks")
+        if fit not in ("ks", "iso"):
+            return jsonify(error="fit must be ks or iso"), 400
+        try:
+            params = self.parse(data)
+            depths = np.array([float(o["depth"]) for o in observations])
+            discharges = np.array([float(o["discharge"]) for o in observations])
+            confidence = float(data.get("confidence", 0.95))
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify(error=str(e)), 400
+        if not (np.all(depths > 0) and np.all(discharges > 0)):
+            return jsonify(error="depths and discharges must be positive"), 400
+        if not 0 < confidence < 1:
+            return jsonify(error="confidence must be between 0 and 1"), 400
+
+        with self.timings.measure("calibrate"):
+            result = self.calibrate(depths, discharges, params, fit, confidence)
+        return jsonify(version=1, **result)
+
+    def api_survey_upload(self):
+        try:
+            key, survey = upload_survey(
+                request.stream, max_points=self.survey_max_points
+            )
+        except (UnicodeDecodeError, ValueError) as e:
+            return jsonify(error=str(e)), 400
+        return jsonify(
+            version=1, survey=key, sections=len(survey), points=len(survey.stations)
+        )
+
+    def api_survey(self, survey):
+        survey = cached_survey(survey)
+        if survey is None:
+            return jsonify(error="unknown survey, upload it again"), 404
+        try:
+            if any(p.name in request.args for p in self.parameters):
+                params = self.parse(request.args)
+            else:
+                params = self.session_params()
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+
+        q = params["q"] * M3PS
+        with self.timings.measure("survey"):
+            t_n = survey.normal_depth(q, params["ks"] * M ** (1 / 3) / S)
+            t_crit = survey.critical_depth(q)
+        # JSON has no NaN, sections without a depth are null
+        values = lambda a: [None if np.isnan(v) else v for v in a.tolist()]
+        return jsonify(
+            version=1,
+            state=params,
+            chainage=survey.chainage.tolist(),
+            bed=survey.bed.tolist(),
+            slope=survey.slope.tolist(),
+            t_n=values(t_n),
+            t_crit=values(t_crit),
+        )
+
+    def rating_curve(self, params):
+        """Returns the normal and critical depths for all discharges of the
+        rating curve of the channel selected by ``params``.
+
+        The curves are cached per strickler value, slope and width."""
+        ks = params["ks"] * M ** (1 / 3) / S
+        iso = params["iso"] * PERMILLE
+        w = 30 * M
+        key = (round(ks, 9), round(iso, 12), w)
+        curve = self.rating_curves.get(key)
+        if curve is None:
+            with self.timings.measure("rating_curve"):
+                q = self.rating_curve_discharges
+                curve = (q, t_n_rect_vec(q, ks, iso, w), t_crit_rect(q, w))
+            self.rating_curves.put(key, curve)
+        return curve
+
+    def rating_curve_figure(self, params):
+        """Creates the figure of the rating curve with the current state."""
+        q, t_n, t_crit = self.rating_curve(params)
+        solution = self.solution(params)
+
+        fig, ax = subplots()
+        ax.plot(q, t_n, color="b", label=lang["tn"])
+        ax.plot(q, t_crit, color="r", linestyle="--", label=lang["tcrit"])
+        ax.plot(solution["q"], solution["t_n"], "ko")
+        ax.set_xlabel(f"{lang['discharge']} [m$^3$/s]")
+        ax.set_ylabel(f"{lang['wlvl']} [m]")
+        ax.set_xlim(0, q[-1])
+        ax.set_ylim(0)
+        ax.grid(True)
+        ax.legend()
+        return fig
+
+    def rating_curve_plot(self):
+        return Response(
+            render_figure(self.rating_curve_figure, self.session_params()),
+            mimetype="image/png",
+        )
+
+    def rating_curve_table(self):
+        q, t_n, t_crit = self.rating_curve(self.session_params())
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["q [m3/s]", "t_n [m]", "t_crit [m]"])
+        for row in zip(q, t_n, t_crit):
+            writer.writerow([f"{v:.4f}" for v in row])
+        response = Response(buffer.getvalue(), mimetype="text/csv")
+        response.headers["Content-Disposition"] = "attachment; filename=rating_curve.csv"
+        return response
+
+    def blueprint(self):
+        bp = super().blueprint()
+        bp.add_url_rule(
+            "/api/v1/calibrate", "api_calibrate", self.api_calibrate, methods=["POST"]
+        )
+        bp.add_url_rule("/rating_curve", "rating_curve", self.rating_curve_plot)
+        bp.add_url_rule(
+            "/api/v1/survey",
+            "api_survey_upload",
+            self.api_survey_upload,
+            methods=["POST"],
+        )
+        bp.add_url_rule("/api/v1/survey/<survey>", "api_survey", self.api_survey)
+        bp.add_url_rule(
+            "/rating_curve.csv", "rating_curve_table", self.rating_curve_table
+        )
+        return bp
+
+    def background(self, solution):
+        lang = DICT_GER
+
+        # define plot size
+        x_min = -50 * M
+        x_max = 0 * M
+        y_min = -1 * M
+        y_max = 5 * M
+
+        xlabels = []
+        xticks = []
+
+        xx = np.array([x_min, x_max])
+
+        ## begin plotting sequence ------------------------------------------------
+        fig, ax = subplots(1,2,figsize=(9,5))
+        water = ax[0].fill_between(xx, 0, 0, color="b", alpha=0.1)
+        bed = ax[0].fill_between(xx, 0, 0, color="k", alpha=0.1)
+
+        # plot the sole
+        sole, = ax[0].plot([], [], "k", lw=1.5)
+
+        #ax.plot(xx, so + t_crit, "k:", label="Krit. Wassertiefe", lw=1.5)
+        #ax.plot(xx, so + depth, "b", label="Wasserspiegel", lw=1.5)
+        #ax.plot(head_xx, head_so + head_depth + head, "r--", label="Energielinie", lw=1.5)
+
+        crit_line, = ax[0].plot([], [], "k:", label=lang["tcrit"], lw=2)
+        water_line, = ax[0].plot([], [], "b", label=lang["wline_l"], lw=1.5)
+        energy_line, = ax[0].plot([], [], "r--", label=lang["eline_l"], lw=1.5)
+
+        froude = ax[0].text(np.mean(xx), y_max, "", va="top", ha="center", weight="bold")
+
+        ax[0].set_title("",
+            fontsize=12,
+            fontweight="bold",
+            fontstyle="italic")
+        ## figure style settings --------------------------------------------------
+        ax[0].set_frame_on(False)
+        ax[0].xaxis.grid()
+        ax[0].set_xlim((x_min,x_max)) # keep x=0 in center of plot
+        #ax.set_xlim(x_min, x_max)
+        ax[0].set_xticks(xticks)
+        ax[0].set_xticklabels(xlabels)
+
+        horizon = ax[0].axhline(y=0, color="k", lw=0.5, alpha=0.4)
+        reference = ax[0].axhline(y=0, color="k", lw=0.5, alpha=0.4)
+        ax[0].set_ylim(y_min, y_max)
+
+        secax = ax[0].secondary_yaxis("right")
+        secax.spines["right"].set_visible(False)
+        ax[0].spines["right"].set_visible(False)
+
+        #ax.legend(loc="right")
+        ax[0].legend(loc='upper center', bbox_to_anchor=(0.5, -0.05),
+              fancybox=True, shadow=True, ncol=3)
+
+        ## second axes diagram
+        xx = np.linspace(0.001,10, 100)
+        curve, = ax[1].plot([], [], color='k', lw=2)
+        supercritical = ax[1].fill_betweenx([0, 0], 0, color='g', alpha=0.15)
+        subcritical = ax[1].fill_betweenx([0, 0], 0, color='r', alpha=0.15)
+        ax[1].fill_betweenx( [0,-0.5], [5,5], color='k', alpha=0.1)
+        diagonal, = ax[1].plot(xx, xx, color='k', lw=1.5, ls='--')
+        crit_depth, = ax[1].plot([], [], color='k', lw=2, ls=':')
+        level, = ax[1].plot([], [], color='b', lw=2, label=lang["wlvl"])
+        velocity_head, = ax[1].plot([], [], color='r', lw=2, label=lang["vlvl"])
+
+        super_label = ax[1].text(1,0.5,lang["super_s"], color='grey', size=12, style="italic", weight='bold')
+        sub_label = ax[1].text(1,3,lang["sub_s"], color='grey', size=12, style="italic", weight='bold')
+
+        ax[1].axis("equal")
+        ax[1].set_xlim((0,5))
+        ax[1].set_ylim(ax[0].get_ylim())
+        ax[1].set_frame_on(False)
+        ax[1].xaxis.grid()
+        ax[1].yaxis.grid()
+        ax[1].set_xlabel(lang["ehead"])
+
+        legend = ax[1].legend(loc='upper left',
+            fancybox=True, shadow=True, ncol=1)
+
+        # the fills of the second axes lie below the diagonal, the labels and
+        # the legend
+        return fig, {
+            "water": water,
+            "bed": bed,
+            "sole": sole,
+            "crit_line": crit_line,
+            "water_line": water_line,
+            "energy_line": energy_line,
+            "froude": froude,
+            "title": ax[0].title,
+            "horizon": horizon,
+            "reference": reference,
+            "yaxis": ax[0].yaxis,
+            "secax": secax,
+            "curve": curve,
+            "supercritical": supercritical,
+            "subcritical": subcritical,
+            "crit_depth": crit_depth,
+            "level": level,
+            "velocity_head": velocity_head,
+            "energy_xaxis": ax[1].xaxis,
+            "energy_yaxis": ax[1].yaxis,
+            "energy_title": ax[1].title,
+            "diagonal": diagonal,
+            "super_label": super_label,
+            "sub_label": sub_label,
+            "legend": legend,
+        }
+
+    def foreground(self, artists, solution):
+        lang = DICT_GER
+
+        ## load values  -----------------------------------------------------------
+        iso = solution["iso"]
+        w = solution["w"]
+        q = solution["q"]
+        t_crit = solution["t_crit"]
+        t_n = solution["t_n"]
+        # ks = solution["ks"]
+
+        v = q/(t_n*w)
+        fr = v/np.sqrt(GRAVITY*t_n)
+
+        if np.round(t_crit,1) == np.round(t_n,1):
+            strFlow = lang["crit"]
+            t_n = t_crit
+            fr=1
+
+        elif t_crit < t_n:
+            strFlow = lang["sub_l"]
+        else:
+            strFlow = lang["super_l"]
+        ## begin calculation  -----------------------------------------------------
+        x_min = -50 * M
+        x_max = 0 * M
+
+        xx = np.array([x_min, x_max])
+        so = -xx*iso
+        head = (q / (w * t_n)) ** 2 / (2 * GRAVITY)
+
+        ## update plotting sequence -----------------------------------------------
+        artists["water"].set_verts([fill_vertices(xx, so, so + t_n)])
+        artists["bed"].set_verts([fill_vertices(xx, so, so - 0.5)])
+        artists["sole"].set_data([x_min, x_max], [x_min * -iso, x_max * -iso])
+        artists["crit_line"].set_data(xx, so + t_crit)
+        artists["water_line"].set_data(xx, so + t_n)
+        artists["energy_line"].set_data(xx, so + t_n + head)
+        artists["froude"].set_text(f"Fr = {fr:3.2f}")
+        artists["title"].set_text(f"{strFlow}")
+
+        artists["horizon"].set_ydata([-x_min * iso + t_n + head] * 2)
+        artists["reference"].set_ydata([-x_max * iso] * 2)
+        artists["yaxis"].set_ticks(
+            [
+                -x_max * iso,
+                -x_min * iso,
+                -x_min * iso + t_crit,
+                -x_min * iso + t_n + head,
+            ]
+        )
+        #["$B.H.$", "$Sohle$", "$W.L.$", "$E.H.$"]
+        artists["yaxis"].set_ticklabels(
+            [lang["href_s"], lang["bed"], "$t_{crit}$", lang["ehorizont_s"]]
+        )
+
+        secax = artists["secax"]
+        secax.set_yticks(
+            np.sort([
+                -x_max * iso,
+                -x_max * iso + t_n,
+                -x_max * iso + t_n + head,
+            ])
+        )
+        #secax.set_yticklabels(["$B.H.$", "$W.L.$", "$E.L.$", "$E.H.$"])
+        if np.round(t_crit,1) == np.round(t_n,1):
+            secax.set_yticklabels([lang["href_s"], "$t = t_{crit}$", lang["eline_s"]])
+        else:
+            secax.set_yticklabels([lang["href_s"], "$t = t_N$", lang["eline_s"]])
+
+        ## second axes diagram
+        xx = np.linspace(0.001,10, 100)
+        xx1 = np.linspace(0.001,t_crit, 50)
+        xx2 = np.linspace(t_crit,10, 50)
+        heads = (q / (w * xx)) ** 2 / (2 * GRAVITY)
+        heads1 = (q / (w * xx1)) ** 2 / (2 * GRAVITY)
+        heads2 = (q / (w * xx2)) ** 2 / (2 * GRAVITY)
+        crit_head = (q / (w * t_crit)) ** 2 / (2 * GRAVITY)
+
+        artists["curve"].set_data(xx + heads, xx)
+        artists["supercritical"].set_verts([fill_vertices(xx1, xx1 + heads1, 0)[:, ::-1]])
+        artists["subcritical"].set_verts([fill_vertices(xx2, xx2 + heads2, 0)[:, ::-1]])
+        artists["crit_depth"].set_data([0, 5], [t_crit, t_crit])
+        artists["level"].set_data([0, t_n], [t_n, t_n])
+        artists["velocity_head"].set_data([t_n, t_n+head], [t_n, t_n])
+
+        artists["energy_xaxis"].set_ticks(
+            np.sort([
+                0,
+                t_crit + crit_head,
+            ])
+        )
+        artists["energy_xaxis"].set_ticklabels(["0","$H_{min}$"])
+        artists["energy_yaxis"].set_ticks(
+            np.sort([
+                -x_max * iso,
+                -x_max * iso + t_n,
+            ])
+        )
+        artists["energy_yaxis"].set_ticklabels([" "," "])
+        artists["energy_title"].set_text(f"q={q:4.1f} $m^3/s$")
+
+
+problem = FreeSurface01()
+bp = problem.blueprint()
@@ -1,8 +1,7 @@
 #!/usr/bin/env python3
 
-from flask import Blueprint, Response, render_template, request, session
 from ezprobs.hydraulics import (
-    t_n_rect,
+    t_n_rect_vec,
     t_crit_rect,
     l_transition_i_r_rect,
     depth_bernoulli_upstream,
@@ -10,20 +9,31 @@ from ezprobs.hydraulics import (
     froude,
 )
 
-from ezprobs.problems import Parameter, Plot
+from ezprobs.cache import LRUCache
+from ezprobs.channel import water_surface
+from ezprobs.problems import (
+    Parameter,
+    Plot,
+    Problem,
+    Solution,
+    subplots,
+)
+from ezprobs.export import ExerciseSheets, TableExport
+from ezprobs.surrogate import SurrogateBatch
+from ezprobs.uncertainty import UncertaintyMode
+from ezprobs.unsteady import UnsteadyChannel
+from flask import Response, abort, jsonify, request
 from ezprobs.units import M, S, M3PS, GRAVITY, PERMILLE
-from ezprobs.dict import DICT_GER, DICT_ENG
+from ezprobs.dict import DICT_GER
 
 from io import BytesIO
 from math import sqrt
+from threading import Lock
 
 import numpy as np
-import matplotlib as mpl
-
-
-mpl.use("Agg")
-
-import matplotlib.pyplot as plt
+from matplotlib.colors import ListedColormap
+from matplotlib.image import imsave
+from matplotlib.patches import Patch
 
 __author__ = "Manuel Pirker"
 __copyright__ = "Copyright (c) 2021 Manuel Pirkerr"
@@ -31,47 +41,86 @@ __license__ = "MIT"
 __email__ = "manuel.pirker@tugraz.at"
 
 
-bp = Blueprint("free_surface_02", __name__)
-
+lang = DICT_GER
 
-def compute_solution():
-    w = 30 * M
-    q = 150 * M3PS
-    i1 = 3 * PERMILLE
-    i2 = 8 * PERMILLE
 
-    ks1 = 40 * M ** (1 / 3) / S
-    ks2 = 70 * M ** (1 / 3) / S
+def uncertainty_kernel(inputs, q, w):
+    """Computes the normal depths of both reaches for samples of roughness
+    and slope."""
+    return {
+        "t_n1": t_n_rect_vec(q, inputs["ks1"], inputs["i1"], w),
+        "t_n2": t_n_rect_vec(q, inputs["ks2"], inputs["i2"], w),
+    }
 
-    if request.method == "POST":
-        ks1 = int(request.form["ks1"]) * M ** (1 / 3) / S
-        ks2 = int(request.form["ks2"]) * M ** (1 / 3) / S
-        i1 = int(request.form["i1"]) * PERMILLE
-        i2 = int(request.form["i2"]) * PERMILLE
 
-    t_crit = t_crit_rect(q, w)
-    t_n1 = t_n_rect(q, ks1, i1, w)
-    t_n2 = t_n_rect(q, ks2, i2, w)
+class RegimeMap:
+    """Map of the flow regimes on which only the operating point is drawn per
+    request.
 
-    return {
-        "i1": i1,
-        "i2": i2,
-        "w": w,
-        "q": q,
-        "t_crit": t_crit,
-        "t_n1": t_n1,
-        "ks_1": ks1,
-        "t_n2": t_n2,
-        "ks_2": ks2,
-    }
+    The regimes are drawn into a background once, which is restored before
+    the operating point is drawn on top of it."""
 
+    colors = ["tomato", "gold", "lightskyblue", "mediumseagreen"]
 
-@bp.route("/", methods=["POST", "GET"])
-def index():
-    lang = DICT_GER
-    
-    solution = compute_solution()
-    session["solution"] = solution
+    def __init__(self, x, y, regimes, names):
+        labels = [
+            f"{lang['super_l']} - {lang['super_l']}",
+            f"{lang['super_l']} - {lang['sub_l']} ({lang['jump']})",
+            f"{lang['sub_l']} - {lang['super_l']}",
+            f"{lang['sub_l']} - {lang['sub_l']}",
+        ]
+        fig, ax = subplots()
+        ax.imshow(
+            regimes,
+            origin="lower",
+            extent=(x[0], x[-1], y[0], y[-1]),
+            aspect="auto",
+            cmap=ListedColormap(self.colors),
+            vmin=0,
+            vmax=3,
+            interpolation="nearest",
+        )
+        ax.set_xlabel(names[0])
+        ax.set_ylabel(names[1])
+        ax.legend(
+            handles=[Patch(color=c, label=l) for c, l in zip(self.colors, labels)],
+            loc="upper center",
+            bbox_to_anchor=(0.5, -0.15),
+            ncol=2,
+            fontsize="small",
+        )
+        fig.tight_layout()
+        fig.canvas.draw()
+        self.background = fig.canvas.copy_from_bbox(fig.bbox)
+        (self.marker,) = ax.plot(
+            [], [], "kx", markersize=10, mew=2, clip_on=False, animated=True
+        )
+        self.ax = ax
+        self.canvas = fig.canvas
+        self._lock = Lock()
+
+    def render(self, x, y):
+        """Returns the map with the operating point at ``x``, ``y`` as PNG."""
+        with self._lock:
+            self.canvas.restore_region(self.background)
+            self.marker.set_data([x], [y])
+            self.ax.draw_artist(self.marker)
+            buffer = BytesIO()
+            imsave(buffer, np.asarray(self.canvas.buffer_rgba()), format="png")
+        return buffer.getvalue()
+
+
+class FreeSurface02(
+    UnsteadyChannel,
+    UncertaintyMode,
+    SurrogateBatch,
+    TableExport,
+    ExerciseSheets,
+    Problem,
+):
+    name = "free_surface_02"
+    template = "problems/free_surface_02.html"
+    solution_template = "problems/free_surface_02_solution.html"
 
     parameters = [
         Parameter(
@@ -80,7 +129,7 @@ def index():
             20,
             100,
             10,
-            solution["ks_1"],
+            40,
             unit="m^{1/3}/s",
             description=lang["kst_river"] + " 1",
         ),
@@ -90,7 +139,7 @@ def index():
             20,
             100,
             10,
-            solution["ks_2"],
+            70,
             unit="m^{1/3}/s",
             description=lang["kst_river"] + " 2",
         ),
@@ -100,7 +149,7 @@ def index():
             2,
             8,
             1,
-            solution["i1"] / PERMILLE,
+            3,
             unit="\\unicode{0x2030}",
             description=lang["iso"] + " 1",
         ),
@@ -110,166 +159,76 @@ def index():
             2,
             8,
             1,
-            solution["i2"] / PERMILLE,
+            8,
             unit="\\unicode{0x2030}",
             description=lang["iso"] + " 2",
         ),
     ]
 
     plot = Plot("plot", alt="surface", caption="Water Surface")
-
-    return render_template(
-        "problems/free_surface_02.html",
-        plot=plot,
-        parameters=parameters,
-        solution=solution,
-    )
-
-
-@bp.route("/plot")
-def plot_function():
-    lang = DICT_GER
-    
-    ## load values  -----------------------------------------------------------
-    iso1 = session["solution"]["i1"]
-    iso2 = session["solution"]["i2"]
-    w = session["solution"]["w"]
-    q = session["solution"]["q"]
-    t_crit = session["solution"]["t_crit"]
-    t_n1 = session["solution"]["t_n1"]
-    ks_1 = session["solution"]["ks_1"]
-    t_n2 = session["solution"]["t_n2"]
-    ks_2 = session["solution"]["ks_2"]
-
-    ## begin calculation  -----------------------------------------------------
-    # define plot size
-    x_min = -150 * M
-    x_max = 150 * M
-    y_min = -2 * M
-    y_max = 5 * M
-    x_padding = 25 * M
-
-    xlabels = []
-    xticks = []
-    depth = np.empty(0)
-    so = np.empty(0)
-    xx = np.empty(0)
-    strFlow1 = "x"
-    strFlow2 = "x"
-    head_xx = np.empty(0)
-    head_so = np.empty(0)
-    head_depth = np.empty(0)
-
-    # check flow regime
-    isSubCritical = (t_n1 > t_crit, t_n2 > t_crit)
-    if isSubCritical == (True, True):
-        strFlow1 = lang["sub_s"] #"ö"
-        strFlow2 = lang["sub_s"] #"ö"
-        xlabels = ["$t_{N,1}$", "$t_{N,2}$"]
-        xticks = [-l_transition_i_r_rect(q, ks_1, w, t_n1, t_n2, iso1), 0]
-        x_min = min(xticks[0] - x_padding, x_min)
-        x_max = max(xticks[1] + x_padding, x_max)
-        lim_diff = x_max + x_min
-        x_min -= lim_diff/2
-        x_max -= lim_diff/2
-
-        # upstream channel
-        xx1 = np.linspace(x_min, 0, 101) * M
-        # downstream channel
-        xx2 = np.linspace(0, x_max, 2) * M
-
-        xx = np.concatenate((xx1, xx2), axis=None)
-        so = np.concatenate((xx1 * -iso1, xx2 * -iso2), axis=None)
-        depth = np.concatenate(
-            (
-                depth_bernoulli_upstream(xx1, t_n2, q, w, ks_1, iso1),
-                depth_bernoulli_downstream(xx2, t_n2, q, w, ks_2, iso2),
-            ),
-            axis=None,
-        )
-        head_xx = xx
-        head_so = so
-        head_depth = depth
-    elif isSubCritical == (False, False):
-        strFlow1 = lang["super_s"] #"i"
-        strFlow2 = lang["super_s"] #"i"
-        xlabels = ["$t_{N,1}$", "$t_{N,2}$"]
-        xticks = [0, l_transition_i_r_rect(q, ks_2, w, t_n1, t_n2, iso2)]
-        x_min = min(xticks[0] - x_padding, x_min)
-        x_max = max(xticks[1] + x_padding, x_max)
-        lim_diff = x_max + x_min
-        x_min -= lim_diff/2
-        x_max -= lim_diff/2
-
-        # upstream channel
-        xx1 = np.linspace(x_min, 0, 2) * M
-        # downstream channel
-        xx2 = np.linspace(0, x_max, 101) * M
-
-        xx = np.concatenate((xx1, xx2), axis=None)
-        so = np.concatenate((xx1 * -iso1, xx2 * -iso2), axis=None)
-        depth = np.concatenate(
-            (
-                depth_bernoulli_upstream(xx1, t_n1, q, w, ks_1, iso1),
-                depth_bernoulli_downstream(xx2, t_n1, q, w, ks_2, iso2),
-            ),
-            axis=None,
-        )
-        head_xx = xx
-        head_so = so
-        head_depth = depth
-    elif isSubCritical == (True, False):
-        strFlow1 = lang["sub_s"] #"ö"
-        strFlow2 = lang["super_s"] #"i"
-        xlabels = ["$t_{N,1}$", "$t_{crit}$", "$t_{N,2}$"]
-        xticks = [
-            -l_transition_i_r_rect(q, ks_1, w, t_n1, t_crit, iso1),
-            0,
-            l_transition_i_r_rect(q, ks_2, w, t_crit, t_n2, iso2),
-        ]
-        x_min = min(xticks[0] - x_padding, x_min)
-        x_max = max(xticks[2] + x_padding, x_max)
-        lim_diff = x_max + x_min
-        x_min -= lim_diff/2
-        x_max -= lim_diff/2
-
-        # upstream channel
-        xx1 = np.linspace(x_min, 0, 101) * M
-        # downstream channel
-        xx2 = np.linspace(0, x_max, 101) * M
-
-        xx = np.concatenate((xx1, xx2), axis=None)
-        so = np.concatenate((xx1 * -iso1, xx2 * -iso2), axis=None)
-        depth = np.concatenate(
-            (
-                depth_bernoulli_upstream(xx1, t_crit, q, w, ks_1, iso1),
-                depth_bernoulli_downstream(xx2, t_crit, q, w, ks_2, iso2),
-            ),
-            axis=None,
-        )
-        head_xx = xx
-        head_so = so
-        head_depth = depth
-    elif isSubCritical == (False, True):
-        v_n1 = q / (w * t_n1)
-        v_n2 = q / (w * t_n2)
-
-        strFlow1 = lang["super_s"] #"i"
-        strFlow2 = lang["sub_s"] #"ö"
-
-        t2 = t_n2
-        v2 = v_n2
-        t1 = 1 / 2 * t2 * (sqrt(1 + 8 * froude(v2, t2) ** 2) - 1)
-        if t1 > t_n1:
-            # case A (jump in section 2)
-            v1 = q / (w * t1)
-            lw = 3 * t1 * (sqrt(1 + 8 * froude(v1, t1) ** 2) - 3)
-            lv = l_transition_i_r_rect(q, ks_2, w, t_n1, t1, iso2)
-
-            xlabels = ["$t_{N,1}$", "$t_1$", "$t_{N,2} = t_2$"]
-            xticks = [0, lv, lv + lw]
+    export_outputs = ["t_crit", "t_n1", "t_n2"]
+    surrogate_outputs = ["t_n1", "t_n2", "t_crit"]
+    uncertain_inputs = {"ks1": 0.1, "ks2": 0.1, "i1": 0.1, "i2": 0.1}
+    uncertainty_outputs = {"t_n1": "$t_{N,1}$ [m]", "t_n2": "$t_{N,2}$ [m]"}
+    # parameters spanning the planes of the regime map
+    regime_planes = {"ks": ("ks1", "ks2"), "i": ("i1", "i2")}
+    regime_map_resolution = 200
+    # maximum number of reaches of a water surface request
+    profile_max_reaches = 1000
+
+    def __init__(self):
+        super().__init__()
+        self.regime_maps = LRUCache(16)
+
+    def channel(self, params, sections):
+        # the slope and roughness change in the middle of the channel
+        upstream = np.arange(sections) < sections // 2
+        return {
+            "length": 10000 * M,
+            "width": 30 * M,
+            "slope": np.where(upstream, params["i1"], params["i2"]) * PERMILLE,
+            "strickler_roughness": np.where(upstream, params["ks1"], params["ks2"])
+            * M ** (1 / 3)
+            / S,
+            "discharge": 150 * M3PS,
+        }
+
+    def solve(self, params):
+        # the depths are those of the batch solution, the water surface
+        # profile is added on top of them
+        solution = self.solve_batch([params])[0]
+        w = solution["w"]
+        q = solution["q"]
+        iso1 = solution["i1"]
+        iso2 = solution["i2"]
+        ks_1 = solution["ks_1"]
+        ks_2 = solution["ks_2"]
+        t_crit = solution["t_crit"]
+        t_n1 = solution["t_n1"]
+        t_n2 = solution["t_n2"]
+
+        ## begin calculation  -----------------------------------------------------
+        # define plot size
+        x_min = -150 * M
+        x_max = 150 * M
+        x_padding = 25 * M
+
+        xlabels = []
+        xticks = []
+        depth = np.empty(0)
+        so = np.empty(0)
+        xx = np.empty(0)
+        head_xx = np.empty(0)
+        head_so = np.empty(0)
+        head_depth = np.empty(0)
+
+        # check flow regime
+        isSubCritical = (t_n1 > t_crit, t_n2 > t_crit)
+        if isSubCritical == (True, True):
+            xlabels = ["$t_{N,1}$", "$t_{N,2}$"]
+            xticks = [-l_transition_i_r_rect(q, ks_1, w, t_n1, t_n2, iso1), 0]
             x_min = min(xticks[0] - x_padding, x_min)
-            x_max = max(xticks[2] + x_padding, x_max)
+            x_max = max(xticks[1] + x_padding, x_max)
             lim_diff = x_max + x_min
             x_min -= lim_diff/2
             x_max -= lim_diff/2
@@ -277,48 +236,53 @@ def plot_function():
             # upstream channel
             xx1 = np.linspace(x_min, 0, 101) * M
             # downstream channel
-            xx2 = np.linspace(0, lv, 100) * M
-            xx3 = np.linspace(lv, lv + lw, 100) * M
-            xx4 = np.linspace(lv + lw, x_max, 100) * M
+            xx2 = np.linspace(0, x_max, 2) * M
 
-            xx = np.concatenate((xx1, xx2, xx3, xx4), axis=None)
-            so = np.concatenate(
-                (xx1 * -iso1, xx2 * -iso2, xx3 * -iso2, xx4 * -iso2), axis=None
-            )
-            depth_xx1 = depth_bernoulli_upstream(xx1, t_n1, q, w, ks_1, iso1)
-            depth_xx2 = depth_bernoulli_downstream(xx2, t_n1, q, w, ks_2, iso2)
-            depth_xx3 = depth_bernoulli_downstream(xx3, depth_xx2[-1], q, w, ks_2, iso2)
-            depth_xx4 = depth_bernoulli_downstream(xx4, t_n2, q, w, ks_2, iso2)
+            xx = np.concatenate((xx1, xx2), axis=None)
+            so = np.concatenate((xx1 * -iso1, xx2 * -iso2), axis=None)
             depth = np.concatenate(
                 (
-                    depth_xx1,
-                    depth_xx2,
-                    depth_xx3,
-                    depth_xx4,
+                    depth_bernoulli_upstream(xx1, t_n2, q, w, ks_1, iso1),
+                    depth_bernoulli_downstream(xx2, t_n2, q, w, ks_2, iso2),
                 ),
                 axis=None,
             )
-            head_xx = np.concatenate((xx1, xx2, xx4), axis=None)
-            head_so = np.concatenate((xx1 * -iso1, xx2 * -iso2, xx4 * -iso2), axis=None)
-            head_depth = np.concatenate(
+            head_xx = xx
+            head_so = so
+            head_depth = depth
+        elif isSubCritical == (False, False):
+            xlabels = ["$t_{N,1}$", "$t_{N,2}$"]
+            xticks = [0, l_transition_i_r_rect(q, ks_2, w, t_n1, t_n2, iso2)]
+            x_min = min(xticks[0] - x_padding, x_min)
+            x_max = max(xticks[1] + x_padding, x_max)
+            lim_diff = x_max + x_min
+            x_min -= lim_diff/2
+            x_max -= lim_diff/2
+
+            # upstream channel
+            xx1 = np.linspace(x_min, 0, 2) * M
+            # downstream channel
+            xx2 = np.linspace(0, x_max, 101) * M
+
+            xx = np.concatenate((xx1, xx2), axis=None)
+            so = np.concatenate((xx1 * -iso1, xx2 * -iso2), axis=None)
+            depth = np.concatenate(
                 (
-                    depth_xx1,
-                    depth_xx2,
-                    depth_xx4,
+                    depth_bernoulli_upstream(xx1, t_n1, q, w, ks_1, iso1),
+                    depth_bernoulli_downstream(xx2, t_n1, q, w, ks_2, iso2),
                 ),
                 axis=None,
             )
-        else:
-            # case B (jump in section 1)
-            t1 = t_n1
-            v1 = v_n1
-            t2 = 1 / 2 * t1 * (sqrt(1 + 8 * froude(v1, t1) ** 2) - 1)
-            v2 = q / (w * t2)
-            lw = 3 * t1 * (sqrt(1 + 8 * froude(v1, t1) ** 2) - 3)
-            lv = l_transition_i_r_rect(q, ks_1, w, t2, t_n2, iso1)
-
-            xlabels = ["$t_{N,1} = t_1$", "$t_2$", "$t_{N,2}$"]
-            xticks = [-(lw + lv), -lv, 0]
+            head_xx = xx
+            head_so = so
+            head_depth = depth
+        elif isSubCritical == (True, False):
+            xlabels = ["$t_{N,1}$", "$t_{crit}$", "$t_{N,2}$"]
+            xticks = [
+                -l_transition_i_r_rect(q, ks_1, w, t_n1, t_crit, iso1),
+                0,
+                l_transition_i_r_rect(q, ks_2, w, t_crit, t_n2, iso2),
+            ]
             x_min = min(xticks[0] - x_padding, x_min)
             x_max = max(xticks[2] + x_padding, x_max)
             lim_diff = x_max + x_min
@@ -326,162 +290,470 @@ def plot_function():
             x_max -= lim_diff/2
 
             # upstream channel
-            xx1 = np.linspace(-600, -(lw + lv), 101) * M
-            xx2 = np.linspace(-(lw + lv), -lv, 101) * M
-            xx3 = np.linspace(-lv, 0, 101) * M
+            xx1 = np.linspace(x_min, 0, 101) * M
             # downstream channel
-            xx4 = np.linspace(0, 600, 101) * M
-
-            # fake t_2'
-            t2d = t_n1 + (t_crit - t_n1) / 2
-
-            # quadratic water surface between 1 and 2
-            # fit polynominal for the water surface
-            # y = a x^2 + b x + c
-            # y' = 2 a x + b + 0 c
-            # y(xx2[0]) = t_n1
-            # y(xx2[-1]) = t2d
-            # y'(xx2[-1]) = 0
-            left = np.array(
-                [
-                    [xx2[0] ** 2, xx2[0], 1],
-                    [xx2[-1] ** 2, xx2[-1], 1],
-                    [2 * xx2[-1], 1, 0],
-                ]
-            )
-            right = np.array([t_n1, t2d, 0])
-            (a, b, c) = np.linalg.solve(left, right)
-            fit_xx2 = lambda x: a * x ** 2 + b * x + c
+            xx2 = np.linspace(0, x_max, 101) * M
 
-            xx = np.concatenate((xx1, xx2, xx3, xx4), axis=None)
-            so = np.concatenate(
-                (xx1 * -iso1, xx2 * -iso1, xx3 * -iso1, xx4 * -iso2), axis=None
-            )
-            depth_xx1 = depth_bernoulli_upstream(xx1, t_n1, q, w, ks_1, iso1)
-            depth_xx2 = fit_xx2(xx2)
-            depth_xx3 = depth_bernoulli_upstream(xx3, t_n2, q, w, ks_1, iso1)
-            depth_xx4 = depth_bernoulli_downstream(xx4, t_n2, q, w, ks_2, iso2)
+            xx = np.concatenate((xx1, xx2), axis=None)
+            so = np.concatenate((xx1 * -iso1, xx2 * -iso2), axis=None)
             depth = np.concatenate(
                 (
-                    depth_xx1,
-                    depth_xx2,
-                    depth_xx3,
-                    depth_xx4,
+                    depth_bernoulli_upstream(xx1, t_crit, q, w, ks_1, iso1),
+                    depth_bernoulli_downstream(xx2, t_crit, q, w, ks_2, iso2),
                 ),
                 axis=None,
             )
-            head_xx = np.concatenate((xx1, xx3, xx4), axis=None)
-            head_so = np.concatenate((xx1 * -iso1, xx3 * -iso1, xx4 * -iso2), axis=None)
-            head_depth = np.concatenate(
-                (
-                    depth_xx1,
-                    depth_xx3,
-                    depth_xx4,
-                ),
-                axis=None,
+            head_xx = xx
+            head_so = so
+            head_depth = depth
+        elif isSubCritical == (False, True):
+            v_n1 = q / (w * t_n1)
+            v_n2 = q / (w * t_n2)
+
+
+            t2 = t_n2
+            v2 = v_n2
+            t1 = 1 / 2 * t2 * (sqrt(1 + 8 * froude(v2, t2) ** 2) - 1)
+            if t1 > t_n1:
+                # case A (jump in section 2)
+                v1 = q / (w * t1)
+                lw = 3 * t1 * (sqrt(1 + 8 * froude(v1, t1) ** 2) - 3)
+                lv = l_transition_i_r_rect(q, ks_2, w, t_n1, t1, iso2)
+
+                xlabels = ["$t_{N,1}$", "$t_1$", "$t_{N,2} = t_2$"]
+                xticks = [0, lv, lv + lw]
+                x_min = min(xticks[0] - x_padding, x_min)
+                x_max = max(xticks[2] + x_padding, x_max)
+                lim_diff = x_max + x_min
+                x_min -= lim_diff/2
+                x_max -= lim_diff/2
+
+                # upstream channel
+                xx1 = np.linspace(x_min, 0, 101) * M
+                # downstream channel
+                xx2 = np.linspace(0, lv, 100) * M
+                xx3 = np.linspace(lv, lv + lw, 100) * M
+                xx4 = np.linspace(lv + lw, x_max, 100) * M
+
+                xx = np.concatenate((xx1, xx2, xx3, xx4), axis=None)
+                so = np.concatenate(
+                    (xx1 * -iso1, xx2 * -iso2, xx3 * -iso2, xx4 * -iso2), axis=None
+                )
+                depth_xx1 = depth_bernoulli_upstream(xx1, t_n1, q, w, ks_1, iso1)
+                depth_xx2 = depth_bernoulli_downstream(xx2, t_n1, q, w, ks_2, iso2)
+                depth_xx3 = depth_bernoulli_downstream(xx3, depth_xx2[-1], q, w, ks_2, iso2)
+                depth_xx4 = depth_bernoulli_downstream(xx4, t_n2, q, w, ks_2, iso2)
+                depth = np.concatenate(
+                    (
+                        depth_xx1,
+                        depth_xx2,
+                        depth_xx3,
+                        depth_xx4,
+                    ),
+                    axis=None,
+                )
+                head_xx = np.concatenate((xx1, xx2, xx4), axis=None)
+                head_so = np.concatenate((xx1 * -iso1, xx2 * -iso2, xx4 * -iso2), axis=None)
+                head_depth = np.concatenate(
+                    (
+                        depth_xx1,
+                        depth_xx2,
+                        depth_xx4,
+                    ),
+                    axis=None,
+                )
+            else:
+                # case B (jump in section 1)
+                t1 = t_n1
+                v1 = v_n1
+                t2 = 1 / 2 * t1 * (sqrt(1 + 8 * froude(v1, t1) ** 2) - 1)
+                v2 = q / (w * t2)
+                lw = 3 * t1 * (sqrt(1 + 8 * froude(v1, t1) ** 2) - 3)
+                lv = l_transition_i_r_rect(q, ks_1, w, t2, t_n2, iso1)
+
+                xlabels = ["$t_{N,1} = t_1$", "$t_2$", "$t_{N,2}$"]
+                xticks = [-(lw + lv), -lv, 0]
+                x_min = min(xticks[0] - x_padding, x_min)
+                x_max = max(xticks[2] + x_padding, x_max)
+                lim_diff = x_max + x_min
+                x_min -= lim_diff/2
+                x_max -= lim_diff/2
+
+                # upstream channel
+                xx1 = np.linspace(-600, -(lw + lv), 101) * M
+                xx2 = np.linspace(-(lw + lv), -lv, 101) * M
+                xx3 = np.linspace(-lv, 0, 101) * M
+                # downstream channel
+                xx4 = np.linspace(0, 600, 101) * M
+
+                # fake t_2'
+                t2d = t_n1 + (t_crit - t_n1) / 2
+
+                # quadratic water surface between 1 and 2
+                # fit polynominal for the water surface
+                # y = a x^2 + b x + c
+                # y' = 2 a x + b + 0 c
+                # y(xx2[0]) = t_n1
+                # y(xx2[-1]) = t2d
+                # y'(xx2[-1]) = 0
+                left = np.array(
+                    [
+                        [xx2[0] ** 2, xx2[0], 1],
+                        [xx2[-1] ** 2, xx2[-1], 1],
+                        [2 * xx2[-1], 1, 0],
+                    ]
+                )
+                right = np.array([t_n1, t2d, 0])
+                (a, b, c) = np.linalg.solve(left, right)
+                fit_xx2 = lambda x: a * x ** 2 + b * x + c
+
+                xx = np.concatenate((xx1, xx2, xx3, xx4), axis=None)
+                so = np.concatenate(
+                    (xx1 * -iso1, xx2 * -iso1, xx3 * -iso1, xx4 * -iso2), axis=None
+                )
+                depth_xx1 = depth_bernoulli_upstream(xx1, t_n1, q, w, ks_1, iso1)
+                depth_xx2 = fit_xx2(xx2)
+                depth_xx3 = depth_bernoulli_upstream(xx3, t_n2, q, w, ks_1, iso1)
+                depth_xx4 = depth_bernoulli_downstream(xx4, t_n2, q, w, ks_2, iso2)
+                depth = np.concatenate(
+                    (
+                        depth_xx1,
+                        depth_xx2,
+                        depth_xx3,
+                        depth_xx4,
+                    ),
+                    axis=None,
+                )
+                head_xx = np.concatenate((xx1, xx3, xx4), axis=None)
+                head_so = np.concatenate((xx1 * -iso1, xx3 * -iso1, xx4 * -iso2), axis=None)
+                head_depth = np.concatenate(
+                    (
+                        depth_xx1,
+                        depth_xx3,
+                        depth_xx4,
+                    ),
+                    axis=None,
+                )
+
+        if t_n1 == t_n2:
+            xlabels = ["$t_{N,1} = t_{N,2}$"]
+            xticks = [0]
+
+        head = (q / (w * head_depth)) ** 2 / (2 * GRAVITY)
+
+        solution.update(
+            x_min=x_min,
+            x_max=x_max,
+            xticks=[float(x) for x in xticks],
+            xlabels=xlabels,
+            xx=xx.tolist(),
+            so=so.tolist(),
+            depth=depth.tolist(),
+            head_xx=head_xx.tolist(),
+            head_so=head_so.tolist(),
+            head_depth=head_depth.tolist(),
+            head=head.tolist(),
+        )
+        return solution
+
+    def solve_batch(self, states):
+        """Computes the depths and flow regimes for a list of parameter values.
+
+        The water surface profiles are not part of the batch solutions,
+        ``solve`` adds them to the values computed here."""
+        values = self.arrays(states)
+        w = 30 * M
+        q = 150 * M3PS
+        iso1 = values["i1"] * PERMILLE
+        iso2 = values["i2"] * PERMILLE
+        ks_1 = values["ks1"] * M ** (1 / 3) / S
+        ks_2 = values["ks2"] * M ** (1 / 3) / S
+
+        t_crit = t_crit_rect(q, w)
+        t_n1 = t_n_rect_vec(q, ks_1, iso1, w)
+        t_n2 = t_n_rect_vec(q, ks_2, iso2, w)
+
+        return [
+            Solution(
+                i1=iso1[i],
+                i2=iso2[i],
+                w=w,
+                q=q,
+                t_crit=t_crit,
+                t_n1=t_n1[i],
+                ks_1=ks_1[i],
+                t_n2=t_n2[i],
+                ks_2=ks_2[i],
+                sub_critical=[bool(t_n1[i] > t_crit), bool(t_n2[i] > t_crit)],
             )
+            for i in range(len(states))
+        ]
+
+    def table(self, columns):
+        w = 30 * M
+        q = 150 * M3PS
+        ks_1 = columns["ks1"] * M ** (1 / 3) / S
+        ks_2 = columns["ks2"] * M ** (1 / 3) / S
+        return {
+            **columns,
+            "t_crit": np.full(len(ks_1), t_crit_rect(q, w)),
+            "t_n1": t_n_rect_vec(q, ks_1, columns["i1"] * PERMILLE, w),
+            "t_n2": t_n_rect_vec(q, ks_2, columns["i2"] * PERMILLE, w),
+        }
+
+    def uncertainty_model(self, params):
+        return (
+            uncertainty_kernel,
+            {
+                "ks1": params["ks1"] * M ** (1 / 3) / S,
+                "ks2": params["ks2"] * M ** (1 / 3) / S,
+                "i1": params["i1"] * PERMILLE,
+                "i2": params["i2"] * PERMILLE,
+            },
+            {"q": 150 * M3PS, "w": 30 * M},
+        )
 
-    if t_n1 == t_n2:
-        xlabels = ["$t_{N,1} = t_{N,2}$"]
-        xticks = [0]
-
-    head = (q / (w * head_depth)) ** 2 / (2 * GRAVITY)
-    ## begin plotting sequence ------------------------------------------------
-    fig, ax = plt.subplots(figsize=(9,5))
-    ax.fill_between(xx, so, so + depth, color="b", alpha=0.1)
-    ax.fill_between(xx, so, so - 0.5, color="k", alpha=0.1)
-
-    # plot the sole
-    ax.plot([x_min, 0], [x_min * -iso1, 0], "k", lw=1.5)
-    ax.plot([0, x_max], [0, x_max * -iso2], "k", lw=3)
-
-    #ax.plot(xx, so + t_crit, "k:", label="Krit. Wassertiefe", lw=1.5)
-    #ax.plot(xx, so + depth, "b", label="Wasserspiegel", lw=1.5)
-    #ax.plot(head_xx, head_so + head_depth + head, "r--", label="Energielinie", lw=1.5)
-
-    ax.plot(xx, so + t_crit, "k:", label=lang["tcrit"], lw=1.5)
-    ax.plot(xx, so + depth, "b", label=lang["wline_l"], lw=1.5)
-    ax.plot(head_xx, head_so + head_depth + head, "r--", label=lang["eline_l"], lw=1.5)
-
-    #plt.text(
-       # x_min / 2,
-       # y_max,
-       # strFlow1,
-       # ha="center",
-       # va="top",
-       # weight="bold",
-       # style="italic",
-       # size=14,
-    #)
-    #plt.text(
-        #x_max / 2,
-        #y_max,
-        #strFlow2,
-        #ha="center",
-        #va="top",
-        #weight="bold",
-        #style="italic",
-        #size=14,
-    #)
-    plt.suptitle('  A', fontsize=16, fontweight="bold")
-    plt.title(f"{strFlow1}               {strFlow2}", 
-        fontsize=12, 
-        fontweight="bold",
-        fontstyle="italic")
-    ## figure style settings --------------------------------------------------
-    ax.set_frame_on(False)
-    ax.xaxis.grid()
-    lim_diff = x_max + x_min
-    ax.set_xlim(x_min-lim_diff/2, x_max-lim_diff/2) # keep x=0 in center of plot
-    #ax.set_xlim(x_min, x_max)
-    ax.set_xticks(xticks)
-    ax.set_xticklabels(xlabels)
-
-    plt.axhline(y=-x_min * iso1 + depth[0] + head[0], color="k", lw=0.5, alpha=0.4)
-    plt.axhline(y=-x_max * iso2, color="k", lw=0.5, alpha=0.4)
-    ax.set_ylim(y_min, y_max)
-    ax.set_yticks(
-        [
-            -x_max * iso2,
-            -x_min * iso1,
-            -x_min * iso1 + depth[0],
-            -x_min * iso1 + depth[0] + head[0],
+    def regime_map(self, plane, params):
+        """Returns the flow regimes over the plane spanned by the parameters
+        of ``plane``, the other parameters are taken from ``params``.
+
+        The regimes are coded as ``2 * sub_critical_1 + sub_critical_2`` on a
+        grid with ``regime_map_resolution`` points along both axes. Returns
+        the values along both axes and the regimes with one row per value of
+        the second axis."""
+        names = self.regime_planes[plane]
+        axes = [
+            np.linspace(p.val_min, p.val_max, self.regime_map_resolution)
+            for p in self.parameters
+            if p.name in names
         ]
-    )
-    #ax.set_yticklabels(["$B.H.$", "$Sohle$", "$W.L.$", "$E.H.$"])
-    ax.set_yticklabels([lang["href_s"], lang["bed"], lang["wline_s"], lang["ehorizont_s"]])
-
-    secax = ax.secondary_yaxis("right")
-    secax.set_yticks(
-        [
-            -x_max * iso2,
-            -x_max * iso2 + depth[-1],
-            -x_max * iso2 + depth[-1] + head[-1],
-            -x_min * iso1 + depth[0] + head[0],
+        mesh = np.meshgrid(*axes)
+        values = {**params, names[0]: mesh[0], names[1]: mesh[1]}
+        w = 30 * M
+        q = 150 * M3PS
+        t_crit = t_crit_rect(q, w)
+        t_n1 = t_n_rect_vec(
+            q, values["ks1"] * M ** (1 / 3) / S, values["i1"] * PERMILLE, w
+        )
+        t_n2 = t_n_rect_vec(
+            q, values["ks2"] * M ** (1 / 3) / S, values["i2"] * PERMILLE, w
+        )
+        regimes = 2 * (t_n1 > t_crit) + (t_n2 > t_crit)
+        return axes[0], axes[1], regimes
+
+    def regime_diagram(self, plane, params):
+        """Returns the ``RegimeMap`` of ``plane`` through the state
+        ``params``, cached per slice through the parameter space."""
+        names = self.regime_planes[plane]
+        key = (plane,) + tuple(
+            self.key(params)[i]
+            for i, p in enumerate(self.parameters)
+            if p.name not in names
+        )
+        diagram = self.regime_maps.get(key)
+        if diagram is None:
+            with self.timings.measure("regime_map"):
+                diagram = RegimeMap(*self.regime_map(plane, params), names)
+            self.regime_maps.put(key, diagram)
+        return diagram
+
+    def regime_plot(self):
+        plane = request.args.get("plane", "ks")
+        if plane not in self.regime_planes:
+            abort(400, "plane must be ks or i")
+        params = self.session_params()
+        names = self.regime_planes[plane]
+        diagram = self.regime_diagram(plane, params)
+        with self.timings.measure("regime_plot"):
+            png = diagram.render(params[names[0]], params[names[1]])
+        return Response(png, mimetype="image/png")
+
+    def reaches(self, params, length=600 * M):
+        """Returns both reaches of the channel for ``water_surface``."""
+        return [
+            (
+                length,
+                30 * M,
+                params[f"i{n}"] * PERMILLE,
+                params[f"ks{n}"] * M ** (1 / 3) / S,
+            )
+            for n in (1, 2)
         ]
-    )
-    #secax.set_yticklabels(["$B.H.$", "$W.L.$", "$E.L.$", "$E.H.$"])
-    secax.set_yticklabels([lang["href_s"], lang["wline_s"], lang["eline_s"], lang["ehorizont_s"]])
-
-    secax.spines["right"].set_visible(False)
-    ax.spines["right"].set_visible(False)
-
-    #ax.legend(loc="right")
-    ax.legend(loc='upper center', bbox_to_anchor=(0.5, -0.05),
-          fancybox=True, shadow=True, ncol=3)
-    ## cache figure -----------------------------------------------------------
-    buffer = BytesIO()
-    fig.savefig(buffer, format="png")
-    plt.close(fig)
-    return Response(buffer.getvalue(), mimetype="image/png")
-
-
-@bp.route("/ajax", methods=["POST", "GET"])
-def ajax():
-    solution = compute_solution()
-    session["solution"] = solution
-
-    return render_template(
-        "problems/free_surface_02_solution.html",
-        solution=solution,
-    )
+
+    def api_profile(self):
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify(error="expected an object"), 400
+        try:
+            params = self.parse(data)
+            if "reaches" in data:
+                reaches = [
+                    (
+                        float(r["length"]) * M,
+                        float(r["width"]) * M,
+                        float(r["i"]) * PERMILLE,
+                        float(r["ks"]) * M ** (1 / 3) / S,
+                    )
+                    for r in data["reaches"]
+                ]
+            else:
+                reaches = self.reaches(params)
+            discharge = float(data.get("discharge", 150)) * M3PS
+            downstream_depth = data.get("downstream_depth")
+            if downstream_depth is not None:
+                downstream_depth = float(downstream_depth) * M
+            points = int(data.get("points", 21))
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify(error=str(e)), 400
+        if not 1 <= len(reaches) <= self.profile_max_reaches:
+            return (
+                jsonify(error=f"between 1 and {self.profile_max_reaches} reaches are allowed"),
+                400,
+            )
+        if not all(l > 0 and w > 0 and ks > 0 for l, w, _, ks in reaches):
+            return jsonify(error="lengths, widths and ks must be positive"), 400
+        if discharge <= 0 or downstream_depth is not None and downstream_depth <= 0:
+            return jsonify(error="discharge and downstream_depth must be positive"), 400
+        if not 2 <= points <= 1000:
+            return jsonify(error="points must be between 2 and 1000"), 400
+
+        with self.timings.measure("profile"):
+            profile = water_surface(reaches, discharge, downstream_depth, points)
+        return jsonify(
+            version=1,
+            discharge=discharge,
+            x=profile["x"].tolist(),
+            bed=profile["bed"].tolist(),
+            depth=profile["depth"].tolist(),
+            t_crit=profile["t_crit"].tolist(),
+            # horizontal and adverse reaches have no normal depth
+            t_n=[t if np.isfinite(t) else None for t in profile["t_n"].tolist()],
+            controls=profile["controls"],
+            jumps=profile["jumps"],
+        )
+
+    def caches(self):
+        return dict(super().caches(), regime_maps=self.regime_maps)
+
+    def blueprint(self):
+        bp = super().blueprint()
+        bp.add_url_rule("/regime_map", "regime_map", self.regime_plot)
+        bp.add_url_rule(
+            "/api/v1/profile", "api_profile", self.api_profile, methods=["POST"]
+        )
+        return bp
+
+    def figure(self, solution):
+        ## load values  -------------------------------------------------------
+        iso1 = solution["i1"]
+        iso2 = solution["i2"]
+        t_crit = solution["t_crit"]
+        x_min = solution["x_min"]
+        x_max = solution["x_max"]
+        xticks = solution["xticks"]
+        xlabels = solution["xlabels"]
+        xx = np.array(solution["xx"])
+        so = np.array(solution["so"])
+        depth = np.array(solution["depth"])
+        head_xx = np.array(solution["head_xx"])
+        head_so = np.array(solution["head_so"])
+        head_depth = np.array(solution["head_depth"])
+        head = np.array(solution["head"])
+        strFlow1, strFlow2 = (
+            lang["sub_s"] if sub_critical else lang["super_s"]
+            for sub_critical in solution["sub_critical"]
+        )
+
+        # define plot size
+        y_min = -2 * M
+        y_max = 5 * M
+
+        ## begin plotting sequence ------------------------------------------------
+        fig, ax = subplots(figsize=(9,5))
+        ax.fill_between(xx, so, so + depth, color="b", alpha=0.1)
+        ax.fill_between(xx, so, so - 0.5, color="k", alpha=0.1)
+
+        # plot the sole
+        ax.plot([x_min, 0], [x_min * -iso1, 0], "k", lw=1.5)
+        ax.plot([0, x_max], [0, x_max * -iso2], "k", lw=3)
+
+        #ax.plot(xx, so + t_crit, "k:", label="Krit. Wassertiefe", lw=1.5)
+        #ax.plot(xx, so + depth, "b", label="Wasserspiegel", lw=1.5)
+        #ax.plot(head_xx, head_so + head_depth + head, "r--", label="Energielinie", lw=1.5)
+
+        ax.plot(xx, so + t_crit, "k:", label=lang["tcrit"], lw=1.5)
+        ax.plot(xx, so + depth, "b", label=lang["wline_l"], lw=1.5)
+        ax.plot(head_xx, head_so + head_depth + head, "r--", label=lang["eline_l"], lw=1.5)
+
+        #plt.text(
+           # x_min / 2,
+           # y_max,
+           # strFlow1,
+           # ha="center",
+           # va="top",
+           # weight="bold",
+           # style="italic",
+           # size=14,
+        #)
+        #plt.text(
+            #x_max / 2,
+            #y_max,
+            #strFlow2,
+            #ha="center",
+            #va="top",
+            #weight="bold",
+            #style="italic",
+            #size=14,
+        #)
+        fig.suptitle('  A', fontsize=16, fontweight="bold")
+        ax.set_title(f"{strFlow1}               {strFlow2}", 
+            fontsize=12, 
+            fontweight="bold",
+            fontstyle="italic")
+        ## figure style settings --------------------------------------------------
+        ax.set_frame_on(False)
+        ax.xaxis.grid()
+        lim_diff = x_max + x_min
+        ax.set_xlim(x_min-lim_diff/2, x_max-lim_diff/2) # keep x=0 in center of plot
+        #ax.set_xlim(x_min, x_max)
+        ax.set_xticks(xticks)
+        ax.set_xticklabels(xlabels)
+
+        ax.axhline(y=-x_min * iso1 + depth[0] + head[0], color="k", lw=0.5, alpha=0.4)
+        ax.axhline(y=-x_max * iso2, color="k", lw=0.5, alpha=0.4)
+        ax.set_ylim(y_min, y_max)
+        ax.set_yticks(
+            [
+                -x_max * iso2,
+                -x_min * iso1,
+                -x_min * iso1 + depth[0],
+                -x_min * iso1 + depth[0] + head[0],
+            ]
+        )
+        #ax.set_yticklabels(["$B.H.$", "$Sohle$", "$W.L.$", "$E.H.$"])
+        ax.set_yticklabels([lang["href_s"], lang["bed"], lang["wline_s"], lang["ehorizont_s"]])
+
+        secax = ax.secondary_yaxis("right")
+        secax.set_yticks(
+            [
+                -x_max * iso2,
+                -x_max * iso2 + depth[-1],
+                -x_max * iso2 + depth[-1] + head[-1],
+                -x_min * iso1 + depth[0] + head[0],
+            ]
+        )
+        #secax.set_yticklabels(["$B.H.$", "$W.L.$", "$E.L.$", "$E.H.$"])
+        secax.set_yticklabels([lang["href_s"], lang["wline_s"], lang["eline_s"], lang["ehorizont_s"]])
+
+        secax.spines["right"].set_visible(False)
+        ax.spines["right"].set_visible(False)
+
+        #ax.legend(loc="right")
+        ax.legend(loc='upper center', bbox_to_anchor=(0.5, -0.05),
+              fancybox=True, shadow=True, ncol=3)
+
+        return fig
+
+
+problem = FreeSurface02()
+bp = problem.blueprint()
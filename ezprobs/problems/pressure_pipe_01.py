@@ -1,21 +1,29 @@
 #!/usr/bin/env python3
 
-from flask import Blueprint, Response, render_template, request, session
 from ezprobs.geometry import area_circle
-from ezprobs.hydraulics import pipe_loss, local_loss
-from ezprobs.problems import Parameter, Plot
-from ezprobs.units import M, CM, MM, M3PS, KINEMATIC_VISCOSITY, GRAVITY
-from ezprobs.dict import DICT_GER, DICT_ENG
-from io import BytesIO
-from math import sqrt
-from scipy.optimize import fsolve
+from ezprobs.hydraulics import (
+    pipe_loss_vec,
+    local_loss,
+    discharge_pipe_chain_vec,
+)
+from ezprobs.problems import (
+    Parameter,
+    Plot,
+    Problem,
+    Solution,
+    subplots,
+)
+from ezprobs.export import ExerciseSheets, TableExport
+from ezprobs.surrogate import SurrogateBatch
+from ezprobs.uncertainty import UncertaintyMode
+from ezprobs.network import cached_network, upload_network
+from ezprobs.transient import PressureSurge, closing_valve, water_hammer
+from flask import abort, jsonify, request
+from ezprobs.units import M, CM, MM, GRAVITY
+from ezprobs.dict import DICT_GER
+from scipy.optimize import minimize
 
 import numpy as np
-import matplotlib as mpl
-
-mpl.use("Agg")
-
-import matplotlib.pyplot as plt
 
 __author__ = "Richard Pöttler"
 __copyright__ = "Copyright (c) 2021 Richard Pöttler"
@@ -23,47 +31,33 @@ __license__ = "MIT"
 __email__ = "richard.poettler@gmail.com"
 
 
-bp = Blueprint("pressure_pipe_01", __name__)
+lang = DICT_GER
 
 
-def compute_solution():
-    d1 = 70 * CM
-    d2 = 70 * CM
-    d3 = 70 * CM
+def pipe_lines(d1, d2, d3, k):
+    """Computes the discharge and the lines along the pipes for arrays of
+    diameters and sand roughnesses.
+
+    Returns the discharges, the stations, the pipe axis, the energy horizon
+    and the energy and pressure lines with one row per discharge."""
     ha = 360.0 * M
-    hb = 197.2 * M
     h2 = 231.6 * M
     h3 = 260.5 * M
     h4 = 210.45 * M
     l1 = 280 * M
     l2 = 150 * M
     l3 = 350 * M
-    k = 0.3 * MM
     nu_entry = 0.5
-	
-    scale = 1 # over scaling velocity head for better display
 
-    q_initial = 3 * 10 ** -3 * M3PS
-
-    if request.method == "POST":
-        d1 = float(request.form["d1"]) * CM
-        d2 = float(request.form["d2"]) * CM
-        d3 = float(request.form["d3"]) * CM
+    scale = 1 # over scaling velocity head for better display
 
     a1 = area_circle(d1 / 2)
     a2 = area_circle(d2 / 2)
     a3 = area_circle(d3 / 2)
 
-    q = fsolve(
-        lambda q: h4
-        + (q / a3) ** 2 / (2 * GRAVITY)
-        + local_loss(nu_entry, a1, q)
-        + pipe_loss(l1, a1, k, d1, q)
-        + pipe_loss(l2, a2, k, d2, q)
-        + pipe_loss(l3, a3, k, d3, q)
-        - ha,
-        1,
-    )[0]
+    q = discharge_pipe_chain_vec(
+        ha - h4, nu_entry, a3, [(l1, a1, k, d1), (l2, a2, k, d2), (l3, a3, k, d3)]
+    )
 
     v1 = q / a1
     v2 = q / a2
@@ -78,42 +72,69 @@ def compute_solution():
     x = np.cumsum(distances)
     pipe = np.array([ha-10, h2, h2, h3, h3, h4])
     energy_horizon = np.full((len(x)), ha)
-    losses = np.array(
+    losses = np.stack(
         [
             local_loss(nu_entry, a1, q),
-            pipe_loss(l1, a1, k, d1, q),
-            0,
-            pipe_loss(l2, a2, k, d2, q),
-            0,
-            pipe_loss(l3, a3, k, d3, q),
-        ]
+            pipe_loss_vec(l1, a1, k, d1, q),
+            np.zeros(len(q)),
+            pipe_loss_vec(l2, a2, k, d2, q),
+            np.zeros(len(q)),
+            pipe_loss_vec(l3, a3, k, d3, q),
+        ],
+        axis=1,
     )
-    cum_losses = np.cumsum(losses)
+    cum_losses = np.cumsum(losses, axis=1)
     energy_line = energy_horizon - cum_losses
-    energy_line[0] = energy_horizon[0]-scale*cum_losses[0] # for display
-    kinetic_energy = np.array([v1, v1, v2, v2, v3, v3]) ** 2 / (2 * GRAVITY)
+    energy_line[:, 0] = energy_horizon[0]-scale*cum_losses[:, 0] # for display
+    kinetic_energy = np.stack([v1, v1, v2, v2, v3, v3], axis=1) ** 2 / (2 * GRAVITY)
     pressure_line = energy_line - kinetic_energy
     #pressure_line = energy_line - scale*kinetic_energy # for display
 
-    return {
-        "d1": d1,
-        "d2": d2,
-        "d3": d3,
-        "discharge": q,
-        "x": x.tolist(),
-        "pipe": pipe.tolist(),
-        "energy_horizon": energy_horizon.tolist(),
-        "energy_line": energy_line.tolist(),
-        "pressure_line": pressure_line.tolist(),
-    }
-
-
-@bp.route("/", methods=["POST", "GET"])
-def index():
-    lang = DICT_GER
-    
-    solution = compute_solution()
-    session["solution"] = solution
+    return q, x, pipe, energy_horizon, energy_line, pressure_line
+
+
+def uncertainty_kernel(inputs, d1, d2, d3):
+    """Computes discharge and pressure line for samples of the sand roughness."""
+    q, _, _, _, _, pressure_line = pipe_lines(d1, d2, d3, inputs["k"])
+    return {"discharge": q, "pressure_line": pressure_line}
+
+
+def pipe_cost(d1, d2, d3):
+    """Estimates the relative costs of the pipes, assuming the costs per
+    metre grow with the diameter to the power of 1.5."""
+    return sum(l * d ** 1.5 for l, d in ((280 * M, d1), (150 * M, d2), (350 * M, d3)))
+
+
+def pressure_head(d1, d2, d3, k):
+    """Computes the discharges and the minimum pressure heads at the high
+    points of the pipe axis for arrays of diameters."""
+    q, _, pipe, _, _, pressure_line = pipe_lines(d1, d2, d3, k)
+    return q, np.min(pressure_line[:, 1:-1] - pipe[1:-1], axis=1)
+
+
+def pareto_front(costs, benefits):
+    """Returns the indices of the points no other point is at least as cheap
+    and as good as in every benefit and better in one of them, sorted by
+    costs."""
+    points = np.column_stack([-np.asarray(costs)] + [np.asarray(b) for b in benefits])
+    better_equal = np.all(points[:, None, :] >= points[None, :, :], axis=2)
+    better = np.any(points[:, None, :] > points[None, :, :], axis=2)
+    dominated = np.any(better_equal & better, axis=0)
+    front = np.flatnonzero(~dominated)
+    return front[np.argsort(np.asarray(costs)[front])]
+
+
+class PressurePipe01(
+    PressureSurge,
+    UncertaintyMode,
+    SurrogateBatch,
+    TableExport,
+    ExerciseSheets,
+    Problem,
+):
+    name = "pressure_pipe_01"
+    template = "problems/pressure_pipe_01.html"
+    solution_template = "problems/pressure_pipe_01_solution.html"
 
     parameters = [
         Parameter(
@@ -122,7 +143,7 @@ def index():
             70,
             90,
             2,
-            solution["d1"] / CM,
+            70,
             unit="cm",
             description=lang["dia_between"] + " I & II",
         ),
@@ -132,7 +153,7 @@ def index():
             70,
             90,
             2,
-            solution["d2"] / CM,
+            70,
             unit="cm",
             description=lang["dia_between"] + " II & III",
         ),
@@ -142,100 +163,292 @@ def index():
             70,
             90,
             2,
-            solution["d3"] / CM,
+            70,
             unit="cm",
             description=lang["dia_between"] + " III & VI",
         ),
     ]
 
     plot = Plot("plot", alt="plot", caption="Energy- and pressure lines")
+    layered = True
+    export_outputs = ["discharge"]
+    surrogate_outputs = ["discharge", "energy_line", "pressure_line"]
+    uncertain_inputs = {"k": 0.3}
+    uncertainty_outputs = {"discharge": "Q [m$^3$/s]", "pressure_line": "h [m]"}
 
-    return render_template(
-        "problems/pressure_pipe_01.html",
-        plot=plot,
-        parameters=parameters,
-        solution=solution,
-    )
+    def solve(self, params):
+        return self.solve_batch([params])[0]
 
+    def solve_batch(self, states):
+        values = self.arrays(states)
+        k = 0.3 * MM
+        d1 = values["d1"] * CM
+        d2 = values["d2"] * CM
+        d3 = values["d3"] * CM
+        q, x, pipe, energy_horizon, energy_line, pressure_line = pipe_lines(
+            d1, d2, d3, k
+        )
 
-@bp.route("/plot")
-def plot_function():
-    lang = DICT_GER
-    
-    ha = 360.0 * M
-    hb = 197.2 * M
-    h2 = 231.6 * M
-    h3 = 260.5 * M
-    h4 = 210.45 * M
-	
-    x = session["solution"]["x"]
-    d1 = session["solution"]["d1"]
-    d2 = session["solution"]["d2"]
-    d3 = session["solution"]["d3"]
-    q = session["solution"]["discharge"]
-    pipe = session["solution"]["pipe"]
-    energy_horizon = session["solution"]["energy_horizon"]
-    energy_line = session["solution"]["energy_line"]
-    pressure_line = session["solution"]["pressure_line"]
-    
-
-    #xticks = np.array([0, l1, l1+l2, l1+l2+l3])
-    #xticks = np.array([])
-    xticks = np.array([0, x[5]])
-    # yticks = np.sort(np.array([ha, h2, h3, h4]))
-	
-    fig, ax = plt.subplots(figsize=(9,5))
-    ax.set_frame_on(False)
-    ax.set_xticks(xticks)
-    ax.set_xticklabels(['A','B'])
-    #ax.set_yticks(yticks)
-	
-    ax.plot(x, energy_horizon, label=lang["ehorizont_l"], color="red", linestyle="dashdot", lw=1)
-    ax.plot(x, energy_line, label=lang["eline_l"], color="red", lw=1.5)
-    ax.plot(x, pressure_line, label=lang["pline_l"], color="blue", linestyle="dashed", lw=1.5)
-    ax.plot(x, pipe, label=lang["paxis"], color="black", linestyle="dashdot", lw=1)
-	
-	# plot reservoirs
-    ax.plot(np.array([-50, 0]), np.array([ha, ha]), color="blue", lw=1.5)
-    ax.plot(np.array([x[5], x[5]+50]), np.array([hb, hb]), color="blue", lw=1.5)
-    ax.plot(np.array([-50, -50, 0, 0]), np.array([ha+3, ha-20, ha-20, ha+3]), color="k", lw=1.5)
-    ax.plot(np.array([x[5], x[5], x[5]+50, x[5]+50]), np.array([hb+3, hb-20, hb-20, hb+3]), color="k", lw=1.5)
-    
-    ax.fill_between(np.array([-50, 0]), np.array([ha, ha]), np.array([ha, ha])-20, color="b", alpha=0.1)
-    ax.fill_between(np.array([x[5], x[5]+50]), np.array([hb, hb]), np.array([hb, hb])-20, color="b", alpha=0.1)
-
-	# add labels 
-    ax.text(x[0],ha-10,'I ',ha="right")
-    ax.text(x[1],h2,'II', va='top', ha='center')
-    ax.text(x[3],h3,'III', va='bottom', ha='center')
-    ax.text(x[5],h4,' IV')
-    ax.text(x[-1], ha, lang["ehorizont_s"], ha='right', va="bottom")
-    
-    ax.text((x[0]+x[1])/2,(ha-10+h2)/2,f"DN{int(d1*1000)}",ha="right", va="top", color='k')
-    ax.text((x[1]+x[3])/2,(h3+h2)/2,f"DN{int(d2*1000)}",ha="left", va="top", color='k')
-    ax.text((x[3]+x[5])/2,(h3+h4)/2,f"DN{int(d3*1000)}",ha="right", va="top", color='k')
-	
-    ax.grid(axis='x')
-    plt.title(lang["discharge"]+f" q = {q:4.3f} $m^3/s$")
-    ax.legend()
-    ax.legend(loc='upper center', bbox_to_anchor=(0.5, -0.05),
-          fancybox=True, shadow=True, ncol=4)
-    #ax.set_xlabel("Distance [m]")
-    ax.set_ylabel(lang["hasl"])
-    #ax.set_title("Pressure- and Energyline")
-
-    buffer = BytesIO()
-    fig.savefig(buffer, format="png")
-    plt.close(fig)
-    return Response(buffer.getvalue(), mimetype="image/png")
-
-
-@bp.route("/ajax", methods=["POST", "GET"])
-def ajax():
-    solution = compute_solution()
-    session["solution"] = solution
-
-    return render_template(
-        "problems/pressure_pipe_01_solution.html",
-        solution=solution,
-    )
+        return [
+            Solution({
+                "d1": d1[i],
+                "d2": d2[i],
+                "d3": d3[i],
+                "discharge": q[i],
+                "x": x.tolist(),
+                "pipe": pipe.tolist(),
+                "energy_horizon": energy_horizon.tolist(),
+                "energy_line": energy_line[i].tolist(),
+                "pressure_line": pressure_line[i].tolist(),
+            })
+            for i in range(len(states))
+        ]
+
+    def table(self, columns):
+        q, *_ = pipe_lines(
+            columns["d1"] * CM, columns["d2"] * CM, columns["d3"] * CM, 0.3 * MM
+        )
+        return {**columns, "discharge": q}
+
+    def uncertainty_model(self, params):
+        return (
+            uncertainty_kernel,
+            {"k": 0.3 * MM},
+            {
+                "d1": params["d1"] * CM,
+                "d2": params["d2"] * CM,
+                "d3": params["d3"] * CM,
+            },
+        )
+
+    def optimize(self, discharge=None, pressure=None):
+        """Finds the cheapest diameters meeting a minimum ``discharge`` and a
+        minimum ``pressure`` head.
+
+        All combinations of the diameters selectable with the sliders are
+        evaluated at once, the cheapest feasible one is then refined with
+        continuous diameters. Returns the Pareto front of costs, discharge and
+        minimum pressure head and the optimum, which is ``None`` if no
+        combination meets the requirements."""
+        k = 0.3 * MM
+        catalogue = [np.array(p.values()) * CM for p in self.parameters]
+        d1, d2, d3 = (d.ravel() for d in np.meshgrid(*catalogue, indexing="ij"))
+        q, head = pressure_head(d1, d2, d3, k)
+        costs = pipe_cost(d1, d2, d3)
+
+        def design(d, q, head, cost):
+            return {
+                "d1": d[0] / CM,
+                "d2": d[1] / CM,
+                "d3": d[2] / CM,
+                "discharge": float(q),
+                "pressure_head": float(head),
+                "cost": float(cost),
+            }
+
+        front = [
+            design((d1[i], d2[i], d3[i]), q[i], head[i], costs[i])
+            for i in pareto_front(costs, [q, head])
+        ]
+
+        feasible = np.ones(len(q), dtype=bool)
+        if discharge is not None:
+            feasible &= q >= discharge
+        if pressure is not None:
+            feasible &= head >= pressure
+        if not feasible.any():
+            return front, None
+
+        i = np.flatnonzero(feasible)[np.argmin(costs[feasible])]
+        optimum = design((d1[i], d2[i], d3[i]), q[i], head[i], costs[i])
+        constraints = []
+        if discharge is not None:
+            constraints.append(
+                {
+                    "type": "ineq",
+                    "fun": lambda d: pressure_head(*(d[:, None] * CM), k)[0][0] / discharge - 1,
+                }
+            )
+        if pressure is not None:
+            constraints.append(
+                {
+                    "type": "ineq",
+                    "fun": lambda d: pressure_head(*(d[:, None] * CM), k)[1][0] - pressure,
+                }
+            )
+        bounds = [(p.val_min, p.val_max) for p in self.parameters]
+        result = minimize(
+            lambda d: pipe_cost(*(d * CM)) / costs[i],
+            [optimum["d1"], optimum["d2"], optimum["d3"]],
+            method="SLSQP",
+            bounds=bounds,
+            constraints=constraints,
+        )
+        if result.success and all(c["fun"](result.x) >= -1e-6 for c in constraints):
+            refined = result.x[:, None] * CM
+            q_refined, head_refined = pressure_head(*refined, k)
+            optimum["refined"] = design(
+                refined[:, 0], q_refined[0], head_refined[0], pipe_cost(*refined)[0]
+            )
+        return front, optimum
+
+    def api_optimize(self):
+        discharge = request.args.get("discharge")
+        pressure = request.args.get("pressure")
+        if discharge is None and pressure is None:
+            abort(400, "expected a discharge or pressure requirement")
+        try:
+            discharge = None if discharge is None else float(discharge)
+            pressure = None if pressure is None else float(pressure)
+        except ValueError as e:
+            abort(400, str(e))
+        if discharge is not None and not 0 < discharge < np.inf:
+            abort(400, "discharge must be positive")
+        if pressure is not None and not np.isfinite(pressure):
+            abort(400, "pressure must be finite")
+        with self.timings.measure("optimize"):
+            front, optimum = self.optimize(discharge, pressure)
+        return jsonify(
+            version=1,
+            discharge=discharge,
+            pressure=pressure,
+            optimum=optimum,
+            front=front,
+        )
+
+    def surge(self, params, closure_time):
+        """Simulates the pressure surge after closing the valve at the outlet
+        into basin IV within ``closure_time`` seconds."""
+        solution = self.solution(params)
+        k = 0.3 * MM
+        with self.timings.measure("surge"):
+            return water_hammer(
+                [
+                    (280 * M, k, solution["d1"]),
+                    (150 * M, k, solution["d2"]),
+                    (350 * M, k, solution["d3"]),
+                ],
+                360.0 * M,
+                210.45 * M,
+                solution["discharge"],
+                3,
+                "valve",
+                closing_valve(closure_time),
+                max(20, 3 * closure_time + 10),
+            )
+
+    def surge_profile(self, params):
+        solution = self.solution(params)
+        return solution["x"], solution["pipe"], solution["pressure_line"]
+
+    def api_network_upload(self):
+        try:
+            with self.timings.measure("network"):
+                key, network = upload_network(request.stream)
+        except (UnicodeDecodeError, ValueError) as e:
+            return jsonify(error=str(e)), 400
+        return jsonify(version=1, network=key, **network.summary())
+
+    def api_network(self, network):
+        # only hex digests name cache files
+        if len(network) != 64 or network.strip("0123456789abcdef"):
+            return jsonify(error="invalid network id"), 400
+        result = cached_network(network)
+        if result is None:
+            return jsonify(error="unknown network, upload it again"), 404
+        return jsonify(version=1, network=network, **result.summary())
+
+    def blueprint(self):
+        bp = super().blueprint()
+        bp.add_url_rule("/api/v1/optimize", "api_optimize", self.api_optimize)
+        bp.add_url_rule(
+            "/api/v1/network",
+            "api_network_upload",
+            self.api_network_upload,
+            methods=["POST"],
+        )
+        bp.add_url_rule(
+            "/api/v1/network/<network>", "api_network", self.api_network
+        )
+        return bp
+
+    def background(self, solution):
+        lang = DICT_GER
+
+        ha = 360.0 * M
+        hb = 197.2 * M
+        h2 = 231.6 * M
+        h3 = 260.5 * M
+        h4 = 210.45 * M
+
+        x = solution["x"]
+        pipe = solution["pipe"]
+        energy_horizon = solution["energy_horizon"]
+
+
+        #xticks = np.array([0, l1, l1+l2, l1+l2+l3])
+        #xticks = np.array([])
+        xticks = np.array([0, x[5]])
+        # yticks = np.sort(np.array([ha, h2, h3, h4]))
+
+        fig, ax = subplots(figsize=(9,5))
+        ax.set_frame_on(False)
+        ax.set_xticks(xticks)
+        ax.set_xticklabels(['A','B'])
+        #ax.set_yticks(yticks)
+
+        ax.plot(x, energy_horizon, label=lang["ehorizont_l"], color="red", linestyle="dashdot", lw=1)
+        energy_line, = ax.plot([], [], label=lang["eline_l"], color="red", lw=1.5)
+        pressure_line, = ax.plot([], [], label=lang["pline_l"], color="blue", linestyle="dashed", lw=1.5)
+        ax.plot(x, pipe, label=lang["paxis"], color="black", linestyle="dashdot", lw=1)
+
+        # plot reservoirs
+        ax.plot(np.array([-50, 0]), np.array([ha, ha]), color="blue", lw=1.5)
+        ax.plot(np.array([x[5], x[5]+50]), np.array([hb, hb]), color="blue", lw=1.5)
+        ax.plot(np.array([-50, -50, 0, 0]), np.array([ha+3, ha-20, ha-20, ha+3]), color="k", lw=1.5)
+        ax.plot(np.array([x[5], x[5], x[5]+50, x[5]+50]), np.array([hb+3, hb-20, hb-20, hb+3]), color="k", lw=1.5)
+
+        ax.fill_between(np.array([-50, 0]), np.array([ha, ha]), np.array([ha, ha])-20, color="b", alpha=0.1)
+        ax.fill_between(np.array([x[5], x[5]+50]), np.array([hb, hb]), np.array([hb, hb])-20, color="b", alpha=0.1)
+
+        # add labels
+        ax.text(x[0],ha-10,'I ',ha="right")
+        ax.text(x[1],h2,'II', va='top', ha='center')
+        ax.text(x[3],h3,'III', va='bottom', ha='center')
+        ax.text(x[5],h4,' IV')
+        ax.text(x[-1], ha, lang["ehorizont_s"], ha='right', va="bottom")
+
+        d1 = ax.text((x[0]+x[1])/2,(ha-10+h2)/2,"",ha="right", va="top", color='k')
+        d2 = ax.text((x[1]+x[3])/2,(h3+h2)/2,"",ha="left", va="top", color='k')
+        d3 = ax.text((x[3]+x[5])/2,(h3+h4)/2,"",ha="right", va="top", color='k')
+
+        ax.grid(axis='x')
+        ax.legend()
+        ax.legend(loc='upper center', bbox_to_anchor=(0.5, -0.05),
+              fancybox=True, shadow=True, ncol=4)
+        #ax.set_xlabel("Distance [m]")
+        ax.set_ylabel(lang["hasl"])
+        #ax.set_title("Pressure- and Energyline")
+
+        return fig, {
+            "energy_line": energy_line,
+            "pressure_line": pressure_line,
+            "d1": d1,
+            "d2": d2,
+            "d3": d3,
+            "title": ax.title,
+        }
+
+    def foreground(self, artists, solution):
+        lang = DICT_GER
+        q = solution["discharge"]
+        x = solution["x"]
+        artists["energy_line"].set_data(x, solution["energy_line"])
+        artists["pressure_line"].set_data(x, solution["pressure_line"])
+        for name in ("d1", "d2", "d3"):
+            artists[name].set_text(f"DN{int(solution[name]*1000)}")
+        artists["title"].set_text(lang["discharge"]+f" q = {q:4.3f} $m^3/s$")
+
+
+problem = PressurePipe01()
+bp = problem.blueprint()
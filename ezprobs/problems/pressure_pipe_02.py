@@ -1,21 +1,35 @@
 #!/usr/bin/env python3
 
-from flask import Blueprint, Response, render_template, request, session
 from ezprobs.geometry import area_circle
-from ezprobs.hydraulics import pipe_loss, local_loss
-from ezprobs.problems import Parameter, Plot
-from ezprobs.units import M, CM, MM, M3PS, KINEMATIC_VISCOSITY, GRAVITY
-from ezprobs.dict import DICT_GER, DICT_ENG
+from ezprobs.hydraulics import (
+    lambda_vec,
+    RE_CRITICAL,
+    reynolds_number,
+    pipe_loss_vec,
+    local_loss,
+    discharge_pipe_chain_vec,
+)
+from ezprobs.cache import LRUCache
+from ezprobs.problems import (
+    Canvas,
+    Parameter,
+    Plot,
+    Problem,
+    Solution,
+    render_figure,
+    subplots,
+)
+from ezprobs.export import ExerciseSheets
+from ezprobs.surrogate import SurrogateBatch
+from ezprobs.units import M, CM, MM, KINEMATIC_VISCOSITY, GRAVITY
+from ezprobs.dict import DICT_GER
+from flask import Response
 from io import BytesIO
-from math import sqrt
-from scipy.optimize import fsolve
+from threading import Lock
 
 import numpy as np
-import matplotlib as mpl
-
-mpl.use("Agg")
-
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.image import imsave
 
 __author__ = "Manuel Pirker"
 __copyright__ = "Copyright (c) 2021 Manuel Pirker"
@@ -23,93 +37,109 @@ __license__ = "MIT"
 __email__ = "manuel.pirker@tugraz.at"
 
 
-bp = Blueprint("pressure_pipe_02", __name__)
+lang = DICT_GER
+
+
+class MoodyDiagram:
+    """Moody diagram on which only the operating point is drawn per request.
+
+    The curves are evaluated once for all ``relative_roughness`` values and
+    drawn into a background which is restored before the operating point is
+    drawn on top of it."""
+
+    def __init__(self, relative_roughness, reynolds):
+        self.relative_roughness = relative_roughness
+        self.reynolds = reynolds
+        self.canvas = None
+        self._lock = Lock()
+
+    def _setup(self):
+        re = self.reynolds
+        laminar = re[re <= 4000]
+        turbulent = re[re >= 2320]
+        fig = Figure(figsize=(9, 5))
+        canvas = Canvas(fig)
+        ax = fig.add_subplot()
+        ax.loglog(laminar, 64 / laminar, color="k", lw=1)
+        lam = lambda_vec(self.relative_roughness[:, None], 1.0, turbulent[None, :])
+        for relative, curve in zip(self.relative_roughness, lam):
+            ax.loglog(turbulent, curve, color="grey", lw=0.8)
+            ax.text(
+                turbulent[-1], curve[-1], f" {relative:g}", va="center", fontsize="x-small"
+            )
+        ax.set_xlim(re[0], re[-1] * 4)
+        ax.set_xlabel("Re [-]")
+        ax.set_ylabel("$\\lambda$ [-]")
+        ax.grid(True, which="both", lw=0.3)
+        fig.tight_layout()
+        canvas.draw()
+        self.background = canvas.copy_from_bbox(fig.bbox)
+        (self.marker,) = ax.plot([], [], "ro", animated=True)
+        self.label = ax.text(0, 0, "", color="r", va="bottom", animated=True)
+        self.ax = ax
+        self.canvas = canvas
 
+    def render(self, re, lam, relative_roughness):
+        """Returns the diagram with the operating point as PNG, still water
+        has no operating point."""
+        with self._lock:
+            if self.canvas is None:
+                self._setup()
+            self.canvas.restore_region(self.background)
+            if re > 0 and np.isfinite(lam):
+                self.marker.set_data([re], [lam])
+                self.label.set_position((re, lam))
+                self.label.set_text(f" k/d = {relative_roughness:.4f}")
+                self.ax.draw_artist(self.marker)
+                self.ax.draw_artist(self.label)
+            buffer = BytesIO()
+            imsave(buffer, np.asarray(self.canvas.buffer_rgba()), format="png")
+        return buffer.getvalue()
 
-def compute_solution():
-    d = 5 * CM
+
+def drain_basin(d, hb, area=2 * M ** 2, steps=100):
+    """Simulates how basin A drains through pipes of the diameters ``d``.
+
+    The level is integrated over the square root of the head above the outlet
+    or the water level ``hb`` in basin B, which drops almost linearly in time
+    while the flow is turbulent, so all discharges are solved at once for
+    ``steps`` steps. Below the head at which the flow would become laminar the
+    drainage would slow down exponentially, so the rest of the head drains
+    with the loss coefficient of the critical Reynolds number until the level
+    crosses the outlet. Returns the times, levels and discharges with one row
+    per diameter and the times to drain the basin."""
     ha = 150 * CM
-    hb = 20 * CM
     hout = 30 * CM
     l = 2 * M
     k = 0.3 * MM
     nu_entry = 0.5
-	
-    scale = 1 # over scaling velocity head for better display
 
-    q_initial = 3 * 10 ** -3 * M3PS
+    d = np.asarray(d, dtype=float)[:, None]
+    a = area_circle(d / 2)
+    tail = max(hb, hout)
+    s = np.sqrt(max(ha - tail, 0)) * np.linspace(1, 0, steps + 1)
+
+    # the lowest head at which the flow is still turbulent
+    q_critical = RE_CRITICAL * KINEMATIC_VISCOSITY * a / d
+    head_critical = local_loss(1 + nu_entry, a, q_critical) + lambda_vec(
+        k, d, RE_CRITICAL
+    ) * l / d / (2 * GRAVITY * a ** 2) * q_critical ** 2
+    head = np.maximum(s ** 2, head_critical)
+    q = discharge_pipe_chain_vec(head, nu_entry, a, [(l, a, k, d)])
+    # the square root of the head drops with sqrt(head) / q / (2 area)
+    rate = np.sqrt(head) / q
+    q = s / rate
 
-    if request.method == "POST":
-        d = float(request.form["d"]) * MM
-        hb = float(request.form["hb"]) * CM
+    dt = area * (s[:-1] - s[1:]) * (rate[:, :-1] + rate[:, 1:])
+    t = np.concatenate((np.zeros((len(d), 1)), np.cumsum(dt, axis=1)), axis=1)
+    levels = np.broadcast_to(tail + s ** 2, t.shape)
+    return t, levels, q, t[:, -1]
 
-    a = area_circle(d / 2)
-    
-    
-    if hb == ha:
-        q = 0
-    elif hb < hout:
-        q = fsolve(
-            lambda q: hout
-            + (q / a) ** 2 / (2 * GRAVITY)
-            + local_loss(nu_entry, a, q)
-            + pipe_loss(l, a, k, d, q)
-            - ha,
-            1,
-        )[0]
-    else:
-        q = fsolve(
-            lambda q: hb
-            + (q / a) ** 2 / (2 * GRAVITY)
-            + local_loss(nu_entry, a, q)
-            + pipe_loss(l, a, k, d, q)
-            - ha,
-            1,
-        )[0]
-	
-
-    v = q / a
-
-    distances = np.array([0, l])
-
-    x = np.cumsum(distances)
-    pipe = np.array([ha-0.85, hout])
-    energy_horizon = np.full((len(x)), ha)
-	
-    if hb == ha:
-        losses = np.array([0, 0])
-    else:
-        losses = np.array(
-            [
-                local_loss(nu_entry, a, q),
-                pipe_loss(l, a, k, d, q),
-            ]
-        )
-    cum_losses = np.cumsum(losses)
-    energy_line = energy_horizon - cum_losses
-    energy_line[0] = energy_horizon[0]-scale*cum_losses[0] # for display
-    kinetic_energy = np.array([v, v]) ** 2 / (2 * GRAVITY)
-    pressure_line = energy_line - kinetic_energy
-    #pressure_line = energy_line - scale*kinetic_energy # for display
-
-    return {
-        "d": d,
-        "hb": hb,
-        "discharge": q,
-        "x": x.tolist(),
-        "pipe": pipe.tolist(),
-        "energy_horizon": energy_horizon.tolist(),
-        "energy_line": energy_line.tolist(),
-        "pressure_line": pressure_line.tolist(),
-    }
-
-
-@bp.route("/", methods=["POST", "GET"])
-def index():
-    lang = DICT_GER
-    
-    solution = compute_solution()
-    session["solution"] = solution
+
+class PressurePipe02(SurrogateBatch, ExerciseSheets, Problem):
+    name = "pressure_pipe_02"
+    template = "problems/pressure_pipe_02.html"
+    solution_template = "problems/pressure_pipe_02_solution.html"
 
     parameters = [
         Parameter(
@@ -118,7 +148,7 @@ def index():
             10,
             120,
             5,
-            solution["d"] / MM,
+            50,
             unit="mm",
             description=lang["dia_pipe"],
         ),
@@ -128,100 +158,199 @@ def index():
             10,
             150,
             10,
-            solution["hb"] / CM,
+            20,
             unit="cm",
-            description=lang["wlvl_basin"]+" B",
+            description=lang["wlvl_basin"] + " B",
         ),
     ]
 
     plot = Plot("plot", alt="plot", caption="Energy- and pressure lines")
-
-    return render_template(
-        "problems/pressure_pipe_02.html",
-        plot=plot,
-        parameters=parameters,
-        solution=solution,
+    surrogate_outputs = ["discharge", "energy_line", "pressure_line"]
+    moody = MoodyDiagram(
+        np.array([1e-5, 5e-5, 1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2]),
+        np.logspace(2.5, 8, 600),
     )
 
+    def __init__(self):
+        super().__init__()
+        self.drains = LRUCache(32)
 
-@bp.route("/plot")
-def plot_function():
-    ha = 1.5 * M
-    hout = 0.5 * M
-    lang = DICT_GER
-	
-    x = session["solution"]["x"]
-    d = session["solution"]["d"]
-    hb = session["solution"]["hb"]
-    pipe = session["solution"]["pipe"]
-    energy_horizon = session["solution"]["energy_horizon"]
-    energy_line = session["solution"]["energy_line"]
-    pressure_line = session["solution"]["pressure_line"]
-
-    #xticks = np.array([0, l1, l1+l2, l1+l2+l3])
-    #xticks = np.array([])
-    xticks = np.array([-.50, 0, x[-1], x[-1]+.50])
-    #yticks = np.sort(np.array([ha, hout, hb, 175]))
-	
-    fig, ax = plt.subplots(figsize=(9,5))
-    ax.set_frame_on(False)
-    ax.set_xticks(xticks)
-    ax.set_xticklabels([' ','A','B',' '])
-    #ax.set_yticks(yticks)
-	
-    ax.plot(x, energy_horizon, label=lang["ehorizont_l"], color="red", linestyle="dashdot", lw=1)
-    ax.plot(x, energy_line, label=lang["eline_l"], color="red", lw=1.5)
-    ax.plot(x, pressure_line, label=lang["pline_l"], color="blue", linestyle="dashed", lw=1.5)
-    ax.plot(x, pipe, label=lang["paxis"], color="black", linestyle="dashdot", lw=1)
-    ax.plot(x, np.array(pipe)+d/2, color="grey", linestyle="-", lw=0.5)
-    ax.plot(x,  np.array(pipe)-d/2, color="grey", linestyle="-", lw=0.5)
-	
-	# plot reservoirs
-    ax.plot(np.array([-.50, 0]), np.array([ha, ha]), color="blue", lw=1.5)
-    ax.plot(np.array([x[-1], x[-1]+.50]), np.array([hb, hb]), color="blue", lw=1.5)
-    ax.fill_between(np.array([-.50, 0]), np.array([ha, ha]), np.array([0, 0]), color="b", alpha=0.1)
-    ax.fill_between(np.array([x[-1], x[-1]+.50]), np.array([hb, hb]), np.array([0, 0]), color="b", alpha=0.1)
-    
-    ax.plot(np.array([-.50, -.50, 0, 0]), np.array([ha+.3, 0, 0, ha+.3]), color="k", lw=1.5)
-    ax.plot(np.array([x[-1], x[-1], x[-1]+.50, x[-1]+.50]), np.array([ha+.3, 0, 0, ha+.3]), color="k", lw=1.5)
-
-    ax.text(x[-1], ha, lang["ehorizont_s"], ha='right', va="bottom")
-    ax.text(x[-1]/2, np.mean(energy_line), lang["eline_s"], ha='left', va="bottom", color="red")
-    ax.text(x[-1]/2, np.mean(pressure_line), lang["pline_s"], ha='left', va="bottom", color="blue")
-    ax.text(0, ha-0.85, f"DN{int(d*1000)} ", ha='right', va="center")
-    
-	# add labels 
-    #ax.text(x[0],ha-10,'I ',ha="right")
-    #ax.text(x[1],h2,'II', va='top', ha='center')
-    #ax.text(x[3],h3,'III', va='bottom', ha='center')
-    #ax.text(x[5],h4,' IV')
-	
-    ax.grid(axis='x')
-    #ax.legend()
-    ax.set_xlim((-.51,x[-1]+.51))
-    ax.set_ylim((-0.01,1.6))
-    ax.legend(loc='upper center', bbox_to_anchor=(0.5, -0.05),
-          fancybox=True, shadow=True, ncol=4)
-    #ax.set_xlabel("Distance [m]")
-    ax.set_ylabel(lang["height"]+" [m]")
-    #ax.set_title("Pressure- and Energyline")
-    
-    
-    secax = ax.secondary_yaxis("right")
-    secax.spines["right"].set_visible(False)
-
-    buffer = BytesIO()
-    fig.savefig(buffer, format="png")
-    plt.close(fig)
-    return Response(buffer.getvalue(), mimetype="image/png")
-
-
-@bp.route("/ajax", methods=["POST", "GET"])
-def ajax():
-    solution = compute_solution()
-    session["solution"] = solution
-
-    return render_template(
-        "problems/pressure_pipe_02_solution.html",
-        solution=solution,
-    )
+    def solve(self, params):
+        return self.solve_batch([params])[0]
+
+    def solve_batch(self, states):
+        values = self.arrays(states)
+        ha = 150 * CM
+        hout = 30 * CM
+        l = 2 * M
+        k = 0.3 * MM
+        nu_entry = 0.5
+
+        scale = 1 # over scaling velocity head for better display
+
+        d = values["d"] * MM
+        hb = values["hb"] * CM
+
+        a = area_circle(d / 2)
+
+        # the outlet is free as long as the water level in basin B is below it
+        q = discharge_pipe_chain_vec(ha - np.maximum(hb, hout), nu_entry, a, [(l, a, k, d)])
+
+        v = q / a
+
+        distances = np.array([0, l])
+
+        x = np.cumsum(distances)
+        pipe = np.array([ha-0.85, hout])
+        energy_horizon = np.full((len(x)), ha)
+
+        losses = np.stack([local_loss(nu_entry, a, q), pipe_loss_vec(l, a, k, d, q)], axis=1)
+        cum_losses = np.cumsum(losses, axis=1)
+        energy_line = energy_horizon - cum_losses
+        energy_line[:, 0] = energy_horizon[0]-scale*cum_losses[:, 0] # for display
+        kinetic_energy = np.stack([v, v], axis=1) ** 2 / (2 * GRAVITY)
+        pressure_line = energy_line - kinetic_energy
+        #pressure_line = energy_line - scale*kinetic_energy # for display
+
+        return [
+            Solution({
+                "d": d[i],
+                "hb": hb[i],
+                "discharge": q[i],
+                "x": x.tolist(),
+                "pipe": pipe.tolist(),
+                "energy_horizon": energy_horizon.tolist(),
+                "energy_line": energy_line[i].tolist(),
+                "pressure_line": pressure_line[i].tolist(),
+            })
+            for i in range(len(states))
+        ]
+
+    def moody_plot(self):
+        solution = self.solution(self.session_params())
+        k = 0.3 * MM
+        d = solution["d"]
+        re = reynolds_number(solution["discharge"] / area_circle(d / 2), d)
+        lam = lambda_vec(k, d, re)
+        return Response(
+            self.moody.render(float(re), float(lam), k / d), mimetype="image/png"
+        )
+
+    def drain_figure(self, params):
+        """Creates the figure of the level and discharge over time for the
+        selected diameter and the times to drain the basin over all
+        diameters."""
+        diameters = np.array(self.parameters[0].values())
+        # the drainage of all diameters only depends on the level in basin B
+        key = round(params["hb"], 9)
+        drain = self.drains.get(key)
+        if drain is None:
+            with self.timings.measure("drain"):
+                drain = drain_basin(diameters * MM, params["hb"] * CM)
+            self.drains.put(key, drain)
+        t, levels, discharges, durations = drain
+        i = int(np.argmin(np.abs(diameters - params["d"])))
+
+        fig, (ax_level, ax_duration) = subplots(1, 2, figsize=(10, 4))
+        ax_level.plot(t[i] / 60, levels[i], color="blue")
+        if durations[i] > 0:
+            ax_level.set_xlim(0, 1.05 * durations[i] / 60)
+        ax_level.set_xlabel("t [min]")
+        ax_level.set_ylabel(f"{lang['wlvl_basin']} A [m]", color="blue")
+        ax_discharge = ax_level.twinx()
+        ax_discharge.plot(t[i] / 60, discharges[i] * 1000, color="red")
+        ax_discharge.set_ylabel(f"{lang['discharge']} [l/s]", color="red")
+        ax_level.grid(True)
+
+        ax_duration.plot(diameters, durations / 60, color="k")
+        ax_duration.plot(diameters[i], durations[i] / 60, "ro")
+        # an empty basin drains at once
+        if np.all(durations > 0):
+            ax_duration.set_yscale("log")
+        ax_duration.set_xlabel(f"{lang['dia_pipe']} [mm]")
+        ax_duration.set_ylabel("t [min]")
+        ax_duration.grid(True, which="both")
+        fig.tight_layout()
+        return fig
+
+    def drain_plot(self):
+        return Response(
+            render_figure(self.drain_figure, self.session_params()),
+            mimetype="image/png",
+        )
+
+    def blueprint(self):
+        bp = super().blueprint()
+        bp.add_url_rule("/moody", "moody", self.moody_plot)
+        bp.add_url_rule("/drain", "drain", self.drain_plot)
+        return bp
+
+    def figure(self, solution):
+        ha = 1.5 * M
+        lang = DICT_GER
+
+        x = solution["x"]
+        d = solution["d"]
+        hb = solution["hb"]
+        pipe = solution["pipe"]
+        energy_horizon = solution["energy_horizon"]
+        energy_line = solution["energy_line"]
+        pressure_line = solution["pressure_line"]
+
+        #xticks = np.array([0, l1, l1+l2, l1+l2+l3])
+        #xticks = np.array([])
+        xticks = np.array([-.50, 0, x[-1], x[-1]+.50])
+        #yticks = np.sort(np.array([ha, hout, hb, 175]))
+
+        fig, ax = subplots(figsize=(9,5))
+        ax.set_frame_on(False)
+        ax.set_xticks(xticks)
+        ax.set_xticklabels([' ','A','B',' '])
+        #ax.set_yticks(yticks)
+
+        ax.plot(x, energy_horizon, label=lang["ehorizont_l"], color="red", linestyle="dashdot", lw=1)
+        ax.plot(x, energy_line, label=lang["eline_l"], color="red", lw=1.5)
+        ax.plot(x, pressure_line, label=lang["pline_l"], color="blue", linestyle="dashed", lw=1.5)
+        ax.plot(x, pipe, label=lang["paxis"], color="black", linestyle="dashdot", lw=1)
+        ax.plot(x, np.array(pipe)+d/2, color="grey", linestyle="-", lw=0.5)
+        ax.plot(x,  np.array(pipe)-d/2, color="grey", linestyle="-", lw=0.5)
+
+        # plot reservoirs
+        ax.plot(np.array([-.50, 0]), np.array([ha, ha]), color="blue", lw=1.5)
+        ax.plot(np.array([x[-1], x[-1]+.50]), np.array([hb, hb]), color="blue", lw=1.5)
+        ax.fill_between(np.array([-.50, 0]), np.array([ha, ha]), np.array([0, 0]), color="b", alpha=0.1)
+        ax.fill_between(np.array([x[-1], x[-1]+.50]), np.array([hb, hb]), np.array([0, 0]), color="b", alpha=0.1)
+
+        ax.plot(np.array([-.50, -.50, 0, 0]), np.array([ha+.3, 0, 0, ha+.3]), color="k", lw=1.5)
+        ax.plot(np.array([x[-1], x[-1], x[-1]+.50, x[-1]+.50]), np.array([ha+.3, 0, 0, ha+.3]), color="k", lw=1.5)
+
+        ax.text(x[-1], ha, lang["ehorizont_s"], ha='right', va="bottom")
+        ax.text(x[-1]/2, np.mean(energy_line), lang["eline_s"], ha='left', va="bottom", color="red")
+        ax.text(x[-1]/2, np.mean(pressure_line), lang["pline_s"], ha='left', va="bottom", color="blue")
+        ax.text(0, ha-0.85, f"DN{int(d*1000)} ", ha='right', va="center")
+
+        # add labels
+        #ax.text(x[0],ha-10,'I ',ha="right")
+        #ax.text(x[1],h2,'II', va='top', ha='center')
+        #ax.text(x[3],h3,'III', va='bottom', ha='center')
+        #ax.text(x[5],h4,' IV')
+
+        ax.grid(axis='x')
+        #ax.legend()
+        ax.set_xlim((-.51,x[-1]+.51))
+        ax.set_ylim((-0.01,1.6))
+        ax.legend(loc='upper center', bbox_to_anchor=(0.5, -0.05),
+              fancybox=True, shadow=True, ncol=4)
+        #ax.set_xlabel("Distance [m]")
+        ax.set_ylabel(lang["height"]+" [m]")
+        #ax.set_title("Pressure- and Energyline")
+
+
+        secax = ax.secondary_yaxis("right")
+        secax.spines["right"].set_visible(False)
+
+        return fig
+
+
+problem = PressurePipe02()
+bp = problem.blueprint()
@@ -1,21 +1,32 @@
 #!/usr/bin/env python3
 
-from flask import Blueprint, Response, render_template, request, session
-from ezprobs.geometry import area_circle
-from ezprobs.hydraulics import pipe_loss, local_loss ,calculate_lambda
-from ezprobs.problems import Parameter, Plot
-from ezprobs.units import M, CM, MM, M3PS, KINEMATIC_VISCOSITY, GRAVITY
-from ezprobs.dict import DICT_GER, DICT_ENG
-from io import BytesIO
-from math import sqrt, pi
-from scipy.optimize import fsolve
+from ezprobs.hydraulics import lambda_vec
+from ezprobs.problems import (
+    Parameter,
+    Plot,
+    Problem,
+    Solution,
+    render_figure,
+    subplots,
+)
+from ezprobs.export import ExerciseSheets
+from ezprobs.surrogate import SurrogateBatch
+from ezprobs.transient import PressureSurge, closing_valve, pump_trip, water_hammer
+from flask import Response, abort, jsonify, request
+from ezprobs.units import (
+    M,
+    MM,
+    M3PS,
+    MINUTE,
+    HOUR,
+    DAY,
+)
+from ezprobs.dict import DICT_GER
+from math import pi
+from threading import Lock
 
 import numpy as np
-import matplotlib as mpl
-
-mpl.use("Agg")
-
-import matplotlib.pyplot as plt
+from matplotlib.patches import Circle
     
 __author__ = "Alexander Wiehn & Manuel Pirker"
 __copyright__ = "Copyright (c) 2022 Alexander Wiehn & Manuel Pirker"
@@ -23,132 +34,127 @@ __license__ = ""
 __email__ = "alexander.wiehn@tugraz.at"
 
 
-bp = Blueprint("pressure_pipe_03", __name__)
+lang = DICT_GER
 
 
-def compute_solution():
+def losses(q):
+    """Calculates the velocity head and the losses of the pipes upstream and
+    downstream of the pump turbine and in total for arrays of discharges."""
     d = 1.2
     zheta = 0.15
     l_1 = 120
     l_2 = 200
     k = 0.02
-    h_o = 250
-    h_u = 150
+    vis = 1.31e-6
+    g = 9.81
+
+    q = np.abs(q)
+    v = q*4/(d*d*pi)
+    # still water has no losses despite its infinite lambda
+    lambda_1 = lambda_vec(k * MM, d, np.where(q > 0, v * d / vis, np.inf))
+    v2g2 = v ** 2 / (2 * g)
+    loss_1 = v2g2 * lambda_1 * l_1 / d
+    loss_2 = v2g2 * lambda_1 * l_2 / d
+    loss_total = v2g2 * (zheta + 1) + loss_1 + loss_2
+    return v2g2, loss_1, loss_2, loss_total
+
+
+def machine(q, h_o, h_u):
+    """Calculates the turbine and pump power in kW and the head of the pump
+    turbine for arrays of discharges and water levels.
+
+    Positive discharges flow from the upper basin at ``h_o`` to the lower
+    basin at ``h_u``, negative ones are pumped back."""
     efficiency_turbine = 0.9
     efficiency_pump = 0.9
-    vis = 1.31e-6
-    g = 9.81 
-
-    scale = 1 # over scaling velocity head for better display
-
-    q = 0 * 10 ** -3 * M3PS
-
-    if request.method == "POST":
-        q = float(request.form["q"]) * M3PS
-
-    if q > 0:
-        v = q*4/(d*d*pi)
-        lambda_1 = calculate_lambda(v,k,d,vis)
-        height = h_o - h_u - pow(v,2)/(2*g)*(zheta+lambda_1*(l_1+l_2)/d +1)
-        power = efficiency_turbine*9810*q*height/1000
-        roundpower = round(power,2)
-        if roundpower > 0: #"´Water from left to right, energy being used in a turbine."
-            fd = 0 #flow_direction
-            power_turbine = roundpower
-            power_pump = 0
-            v2 = pow(v,2)
-            g2 = 2*g   
-            "ex = np.array([0,100,100,300])"
-            energy_line = np.array([h_o-v2/g2*(zheta),h_o-v2/g2*(zheta+lambda_1*l_1/d),h_o-v2/g2*(zheta+lambda_1*l_1/d)-height,h_u+v2/g2])
-            energy_line_left = np.array([h_o-v2/g2*(zheta),h_o-v2/g2*(zheta+lambda_1*l_1/d)])
-            energy_line_right = np.array([h_o-v2/g2*(zheta+lambda_1*l_1/d)-height,h_u+v2/g2])
-            "prx = np.array([0,100,100,300])"
-            pressure_line = np.array([h_o-v2/g2*(zheta+1),h_o-v2/g2*(zheta+lambda_1*l_1/d+1),h_o-v2/g2*(zheta+lambda_1*l_1/d+1)-height,h_u])
-            pressure_line_left = np.array([h_o-v2/g2*(zheta+1),h_o-v2/g2*(zheta+lambda_1*l_1/d+1)])
-            pressure_line_right = np.array([h_o-v2/g2*(zheta+lambda_1*l_1/d+1)-height,h_u])
-        else: #"Water from left to right, further accelerated by a pump."
-            fd = 0
-            height = abs(height)
-            power = 9810*q*height/(1000*efficiency_pump)
-            power_pump = round(power,2)
-            power_turbine = 0
-            v2 = pow(v,2)
-            g2 = 2*g
-            #"ex = np.array([0,100,100,300])
-            energy_line = np.array([h_o-v2/g2*(zheta),h_o-v2/g2*(zheta+lambda_1*l_1/d),h_u+v2/g2*(lambda_1*l_2/d+1),h_u+v2/g2])
-            energy_line_left = np.array([h_o-v2/g2*(zheta),h_o-v2/g2*(zheta+lambda_1*l_1/d)])
-            energy_line_right = np.array([h_u+v2/g2*(lambda_1*l_2/d+1),h_u+v2/g2])
-            #"prx = np.array([0,100,100,300])
-            pressure_line = np.array([h_o-v2/g2*(zheta+1),h_o-v2/g2*(zheta+lambda_1*l_1/d+1),h_u+v2/g2*(lambda_1*l_2/d),h_u])
-            pressure_line_left = np.array([h_o-v2/g2*(zheta+1),h_o-v2/g2*(zheta+lambda_1*l_1/d+1)])
-            pressure_line_right = np.array([h_u+v2/g2*(lambda_1*l_2/d),h_u])
-            
-    elif q == 0:
-        fd = 0
-        power_pump = 0
-        power_turbine = 0
-        energy_line = np.array([h_o,h_o,h_u,h_u])
-        energy_line_left = np.array([h_o,h_o])
-        energy_line_right = np.array([h_u,h_u])
-        pressure_line = np.array([h_o,h_o,h_u,h_u]) 
-        pressure_line_left = np.array([h_o,h_o]) 
-        pressure_line_right = np.array([h_u,h_u]) 
-        
-            
-    else: #"Water going from right to left witht the help of a pump."
-        fd = np.pi
-        q = abs(q)
-        v = q*4/(d*d*pi)
-        lambda_1 = calculate_lambda(v,k,d,vis)
-        height = h_o - h_u + pow(v,2)/(2*g)*(zheta+lambda_1*(l_1+l_2)/d +1)
-        power = 9810*q*height/(1000*efficiency_pump)
-        power_pump = round(power,2)
-        power_turbine = 0   
-        v2 = pow(v,2)
-        g2 = 2*g
-        #"ex = np.array([0,100,100,300])
-        energy_line = np.array([h_o+v2/g2,h_o+v2/g2*(lambda_1*l_1/d+1),h_u-v2/g2*(zheta+l_2*lambda_1/d),h_u-v2/g2*(zheta)])
-        energy_line_left = np.array([h_o+v2/g2,h_o+v2/g2*(lambda_1*l_1/d+1)])
-        energy_line_right = np.array([h_u-v2/g2*(zheta+l_2*lambda_1/d),h_u-v2/g2*(zheta)])
-        #"prx = np.array([0,100,100,300])
-        pressure_line = np.array([h_o,h_o+v2/g2*(lambda_1*l_1/d),h_u-v2/g2*(zheta+l_2*lambda_1/d+1),h_u-v2/g2*(zheta+1)])
-        pressure_line_left = np.array([h_o,h_o+v2/g2*(lambda_1*l_1/d)])
-        pressure_line_right = np.array([h_u-v2/g2*(zheta+l_2*lambda_1/d+1),h_u-v2/g2*(zheta+1)])
 
-    
+    reverse = q < 0
+    q = np.abs(q)
+    loss_total = losses(q)[3]
 
-    distances = np.array([0, 100, 0, 200])
-
-    x = np.cumsum(distances)
-    pipe = np.array([230, 120, 120, 130])
-    energy_horizon = np.full((len(x)), h_o)
-	
-
-
-
-    return {
-        "q": q,
-        "x": x.tolist(),
-        "pipe": pipe.tolist(),
-        "energy_horizon": energy_horizon.tolist(),
-        "energy_line": energy_line.tolist(),
-        "pressure_line": pressure_line.tolist(),
-        "power_pump": power_pump,
-        "power_turbine": power_turbine,
-        "flow_direction" : fd,
-        "energy_line_left": energy_line_left.tolist(),
-        "energy_line_right": energy_line_right.tolist(),
-        "pressure_line_left": pressure_line_left.tolist(),
-        "pressure_line_right": pressure_line_right.tolist(),
+    # water from left to right, energy used in a turbine or further
+    # accelerated by a pump
+    power_forward = np.round(efficiency_turbine*9810*q*(h_o - h_u - loss_total)/1000, 2)
+    power_turbine = np.where(~reverse & (power_forward > 0), power_forward, 0)
+    head = np.abs(h_o - h_u + np.where(reverse, 1, -1) * loss_total)
+    power_pump = np.where(
+        power_turbine > 0,
+        0,
+        np.round(9810*q*head/(1000*efficiency_pump), 2),
+    )
+    return power_turbine, power_pump, head
+
+
+def simulate_storage(
+    schedules,
+    step,
+    h_o=250,
+    h_u=150,
+    area_upper=250000,
+    area_lower=400000,
+    limits_upper=(240, 255),
+    limits_lower=(140, 155),
+):
+    """Simulates the operation of the plant for a batch of schedules.
+
+    ``schedules`` holds one row of discharges per schedule with one value per
+    time ``step``, positive values are turbined from the upper to the lower
+    basin, negative ones are pumped back. Both basins are prismatic with the
+    given areas, the discharge is reduced when a basin would fall below or
+    rise above its limits. Returns the levels of both basins, the actual
+    discharges and the power in kW, positive while turbining, with one row
+    per schedule."""
+    schedules = np.atleast_2d(np.asarray(schedules, dtype=float))
+    count, steps = schedules.shape
+    upper = np.empty((count, steps + 1))
+    lower = np.empty((count, steps + 1))
+    discharge = np.empty((count, steps))
+    power = np.empty((count, steps))
+    upper[:, 0] = h_o
+    lower[:, 0] = h_u
+
+    for i in range(steps):
+        turbined = np.minimum(
+            (upper[:, i] - limits_upper[0]) * area_upper,
+            (limits_lower[1] - lower[:, i]) * area_lower,
+        )
+        pumped = np.minimum(
+            (limits_upper[1] - upper[:, i]) * area_upper,
+            (lower[:, i] - limits_lower[0]) * area_lower,
+        )
+        q = np.clip(
+            schedules[:, i],
+            -np.maximum(pumped, 0) / step,
+            np.maximum(turbined, 0) / step,
+        )
+        power_turbine, power_pump, _ = machine(q, upper[:, i], lower[:, i])
+        discharge[:, i] = q
+        power[:, i] = power_turbine - power_pump
+        upper[:, i + 1] = upper[:, i] - q * step / area_upper
+        lower[:, i + 1] = lower[:, i] + q * step / area_lower
+
+    return upper, lower, discharge, power
+
+
+def storage_schedules(q, steps_per_hour, days):
+    """Returns typical daily schedules of the plant and one with the constant
+    discharge ``q`` with their names."""
+    hour = np.arange(24 * steps_per_hour) / steps_per_hour
+    night = hour < 6
+    peaks = ((hour >= 8) & (hour < 12)) | ((hour >= 17) & (hour < 21))
+    day = (hour >= 6) & (hour < 22)
+    schedules = {
+        "Spitzenlast": np.where(night, -10, np.where(peaks, 15, 0)),
+        "Tagbetrieb": np.where(day, 5, -10),
+        f"Konstant {q:g} m³/s": np.full(len(hour), q),
     }
+    return list(schedules), np.tile(np.array(list(schedules.values()), dtype=float), days)
 
 
-@bp.route("/", methods=["POST", "GET"])
-def index():
-    lang = DICT_GER
-    
-    solution = compute_solution()
-    session["solution"] = solution
+class PressurePipe03(PressureSurge, SurrogateBatch, ExerciseSheets, Problem):
+    name = "pressure_pipe_03"
+    template = "problems/pressure_pipe_03.html"
+    solution_template = "problems/pressure_pipe_03_solution.html"
 
     parameters = [
         Parameter(
@@ -157,152 +163,386 @@ def index():
             -20,
             35,
             5,
-            solution["q"] / M3PS,
+            0,
             unit="m^3/s",
             description=lang["discharge"],
         ),
     ]
 
     plot = Plot("plot", alt="plot", caption="Energy- and pressure lines")
+    layered = True
+    surrogate_outputs = ["power_pump", "power_turbine", "energy_line", "pressure_line"]
+    surrogate_resolution = 20
+    # discharges of the characteristic curves
+    characteristic_discharges = np.linspace(-20, 35, 551)
+    # maximum number of schedule values simulated by one request
+    simulation_size = 2000000
 
-    return render_template(
-        "problems/pressure_pipe_03.html",
-        plot=plot,
-        parameters=parameters,      
-        solution=solution,
-    )
+    def __init__(self):
+        super().__init__()
+        self._characteristic = None
+        self._characteristic_lock = Lock()
 
+    def solve(self, params):
+        return self.solve_batch([params])[0]
 
-@bp.route("/plot")
-def plot_function():
-    rl = 35 #reservoirs_length
-    rh = 3 #reservoirs_extra_height
-    h_o = 250
-    h_u = 150   
-    ha = h_o
-    hb = h_u
-    hout = 0.5 * M
-    d = 1.2
-    lang = DICT_GER
-	
-    x = session["solution"]["x"]
-    pipe = session["solution"]["pipe"]
-    energy_horizon = session["solution"]["energy_horizon"]
-    energy_line = session["solution"]["energy_line"]
-    pressure_line = session["solution"]["pressure_line"]
-    power_pump = session["solution"]["power_pump"]
-    power_turbine = session["solution"]["power_turbine"]
-    fd = session["solution"]["flow_direction"]
-    energy_line_right = session["solution"]["energy_line_right"]
-    energy_line_left = session["solution"]["energy_line_left"]
-    pressure_line_left = session["solution"]["pressure_line_left"]
-    pressure_line_right = session["solution"]["pressure_line_right"]
-    
+    def solve_batch(self, states):
+        values = self.arrays(states)
+        zheta = 0.15
+        h_o = 250
+        h_u = 150
 
-    #xticks = np.array([0, l1, l1+l2, l1+l2+l3])
-    #xticks = np.array([])
-    #xticks = np.array([-.50, 0, x[-1], x[-1]+.50])
-    #yticks = np.sort(np.array([ha, hout, hb, 175]))
-	
-    fig, ax = plt.subplots(figsize=(9,5))
-    ax.set_frame_on(False)
-    #ax.set_xticks(xticks)
-    #ax.set_xticklabels([' ','A','B',' '])
-    #ax.set_yticks(yticks)
-
-	
-    ax.plot(x, energy_horizon, label=lang["ehorizont_l"], color="red", linestyle="dashdot", lw=1)
-    ax.plot(x, energy_line, label=lang["eline_l"], color="red", lw=1.5)
-    ax.plot(x, pressure_line, label=lang["pline_l"], color="blue", linestyle="dashed", lw=1.5)
-    ax.plot(x, pipe, label=lang["paxis"], color="black", linestyle="dashed", lw=1)
-    ax.plot(x, np.array(pipe)+d/2, color="grey", linestyle="-", lw=0.5)
-    ax.plot(x,  np.array(pipe)-d/2, color="grey", linestyle="-", lw=0.5)
-    
-	# plot reservoirs
-    ax.plot(np.array([-rl, 0]), np.array([ha, ha]), color="blue", lw=1.5)
-    ax.plot(np.array([x[-1], x[-1]+rl]), np.array([hb, hb]), color="blue", lw=1.5)
-    ax.fill_between(np.array([-rl, 0]), np.array([ha, ha]), np.array([230, 230]), color="b", alpha=0.1)
-    ax.fill_between(np.array([x[-1], x[-1]+rl]), np.array([hb, hb]), np.array([130, 130]), color="b", alpha=0.1)
-    
-    ax.plot(np.array([-rl, -rl, 0, 0]), np.array([ha+rh, 230, 230, ha+rh]), color="k", lw=1.5)
-    ax.plot(np.array([x[-1], x[-1], x[-1]+rl, x[-1]+rl]), np.array([hb+rh, 130, 130, hb+rh]), color="k", lw=1.5)
-    
-    plt.title(f'Turbinenleistung:{power_turbine/1000: 6.2f} MW \nPumpenleistung:{power_pump/1000: 6.2f} MW')
-    ax.text(x[-1], ha, lang["ehorizont_s"], ha='right', va="bottom")
-    
-    #printing leftside labels
-    pos_EL_l = np.mean(energy_line_left)
-    pos_PL_l = np.mean(pressure_line_left)
-    diff_l = abs(pos_EL_l-pos_PL_l)
-    if diff_l < 10:
-        ax.text(50, np.mean(energy_line_left)+3, lang["eline_s"], ha='left', va="bottom", color="red")
-        ax.text(50, np.mean(pressure_line_left)-10, lang["pline_s"], ha='left', va="bottom", color="blue")
-    else:
-        ax.text(50, np.mean(energy_line_left)+3, lang["eline_s"], ha='left', va="bottom", color="red")
-        ax.text(50, np.mean(pressure_line_left)+3, lang["pline_s"], ha='left', va="bottom", color="blue")
-    #printing rightside labels
-    pos_EL_r = np.mean(energy_line_right)
-    pos_PL_r = np.mean(pressure_line_right)
-    diff_r = abs(pos_EL_r-pos_PL_r)
-    if diff_r < 10:
-        ax.text(200, np.mean(energy_line_right)+3, lang["eline_s"], ha='left', va="bottom", color="red")
-        ax.text(200, np.mean(pressure_line_right)-10    , lang["pline_s"], ha='left', va="bottom", color="blue")
-    else:
-        ax.text(200, np.mean(energy_line_right)+3, lang["eline_s"], ha='left', va="bottom", color="red")
-        ax.text(200, np.mean(pressure_line_right)+3, lang["pline_s"], ha='left', va="bottom", color="blue")
-    
-    ax.text(0, ha-30, f"DN{int(d*1000)} ", ha='right', va="center")
-    phi = np.linspace(0, 2*np.pi, 50)
-    x_circle = 10*np.sin(phi)
-    y_circle = 10*np.cos(phi)
-    c = plt.Circle((100, 120), 10, color="w", zorder=2)
-    ax.add_artist(c)
-    ax.plot(100+x_circle, 120+y_circle, color="k", zorder=4)
-    phi = np.array([np.pi/2,-np.pi/6,7*np.pi/6,np.pi/2]) + fd
-    x_triangle = 10*np.sin(phi)
-    y_triangle = 10*np.cos(phi)
-    #ax.plot(100+x_triangle, 120+y_triangle, color="k", zorder=4) 
-    ax.fill(100+x_triangle, 120+y_triangle, color="k", zorder=3)  
-    
-	# add labels 
-    #ax.text(x[0],ha-10,'I ',ha="right")
-    #ax.text(x[1],h2,'II', va='top', ha='center')
-    #ax.text(x[3],h3,'III', va='bottom', ha='center')
-    #ax.text(x[5],h4,' IV')
-	
-    ax.grid(axis='both')
-    #ax.legend()
-    ax.set_yticks([120,150,250])
-    ax.set_yticklabels(["120 m.ü.A.", "150 m.ü.A.", "250 m.ü.A."])
-    
-    ax.set_xticks([0,100,300])
-    ax.set_xticklabels(["Speicher A", "Pumpturbine", "Speicher B"])
-    
-    plt.axis("equal")
-    ax.legend(loc='upper center', bbox_to_anchor=(0.5, 0.1),
-          fancybox=True, shadow=True, ncol=4)
-    #ax.set_xlabel("Distance [m]")
-    #ax.set_ylabel(lang["height"]+" [m]")
-    #ax.set_title("Pressure- and Energyline")
-    
-    
-    #secax = ax.secondary_yaxis("right")
-    #secax.spines["right"].set_visible(False)
-    ax.set_xlim((-40,x[-1]+40))
-    ax.set_ylim((110,260))
-    
-    buffer = BytesIO()
-    fig.savefig(buffer, format="png")
-    plt.close(fig)
-    return Response(buffer.getvalue(), mimetype="image/png")
+        q = values["q"] * M3PS
+        reverse = q < 0 # water going from right to left with the help of a pump
+        fd = np.where(reverse, np.pi, 0) # flow_direction
+        power_turbine, power_pump, head = machine(q, h_o, h_u)
+        q = np.abs(q)
+        v2g2, loss_1, loss_2, _ = losses(q)
 
+        # ratio of the useful to the spent power of the whole plant
+        power_gross = 9810 * q * (h_o - h_u) / 1000
+        with np.errstate(divide="ignore", invalid="ignore"):
+            efficiency = np.where(
+                power_turbine > 0,
+                power_turbine / power_gross,
+                np.where(reverse & (power_pump > 0), power_gross / power_pump, 0),
+            )
 
-@bp.route("/ajax", methods=["POST", "GET"])
-def ajax():
-    solution = compute_solution()
-    session["solution"] = solution
+        energy_line = np.where(
+            reverse[:, np.newaxis],
+            np.stack([h_o+v2g2, h_o+v2g2+loss_1, h_u-v2g2*zheta-loss_2, h_u-v2g2*zheta], axis=1),
+            np.stack([h_o-v2g2*zheta, h_o-v2g2*zheta-loss_1, h_u+v2g2+loss_2, h_u+v2g2], axis=1),
+        )
+        pressure_line = np.where(
+            reverse[:, np.newaxis],
+            np.stack([h_o*np.ones(len(q)), h_o+loss_1, h_u-v2g2*(zheta+1)-loss_2, h_u-v2g2*(zheta+1)], axis=1),
+            np.stack([h_o-v2g2*(zheta+1), h_o-v2g2*(zheta+1)-loss_1, h_u+loss_2, h_u*np.ones(len(q))], axis=1),
+        )
 
-    return render_template(
-        "problems/pressure_pipe_03_solution.html",
-        solution=solution,
-    )
+        distances = np.array([0, 100, 0, 200])
+
+        x = np.cumsum(distances)
+        pipe = np.array([230, 120, 120, 130])
+        energy_horizon = np.full((len(x)), h_o)
+
+        return [
+            Solution({
+                "q": q[i],
+                "x": x.tolist(),
+                "pipe": pipe.tolist(),
+                "energy_horizon": energy_horizon.tolist(),
+                "energy_line": energy_line[i].tolist(),
+                "pressure_line": pressure_line[i].tolist(),
+                "power_pump": power_pump[i],
+                "power_turbine": power_turbine[i],
+                "head": head[i],
+                "efficiency": efficiency[i],
+                "flow_direction" : fd[i],
+                "energy_line_left": energy_line[i, :2].tolist(),
+                "energy_line_right": energy_line[i, 2:].tolist(),
+                "pressure_line_left": pressure_line[i, :2].tolist(),
+                "pressure_line_right": pressure_line[i, 2:].tolist(),
+            })
+            for i in range(len(states))
+        ]
+
+    def characteristic(self):
+        """Returns the power, head and efficiency of the pump turbine over all
+        ``characteristic_discharges``.
+
+        The curves only depend on the plant and are computed once."""
+        with self._characteristic_lock:
+            if self._characteristic is None:
+                with self.timings.measure("characteristic"):
+                    q = self.characteristic_discharges
+                    solutions = self.solve_batch([{"q": v} for v in q])
+                    self._characteristic = {
+                        key: np.array([s[key] for s in solutions])
+                        for key in ("power_turbine", "power_pump", "head", "efficiency")
+                    }
+                    self._characteristic["q"] = q
+            return self._characteristic
+
+    def characteristic_figure(self, params):
+        """Creates the figure of the characteristic curves with the current
+        operating point."""
+        curves = self.characteristic()
+        solution = self.solution(params)
+        q = curves["q"]
+
+        fig, axes = subplots(3, 1, sharex=True, figsize=(6, 7))
+        axes[0].plot(q, curves["power_turbine"] / 1000, color="g", label="Turbine")
+        axes[0].plot(q, -curves["power_pump"] / 1000, color="r", label="Pumpe")
+        axes[0].plot(
+            params["q"],
+            (solution["power_turbine"] - solution["power_pump"]) / 1000,
+            "ko",
+        )
+        axes[0].set_ylabel("P [MW]")
+        axes[0].legend()
+        axes[1].plot(q, curves["head"], color="b")
+        axes[1].plot(params["q"], solution["head"], "ko")
+        axes[1].set_ylabel("H [m]")
+        # the efficiency is undefined while the plant is at rest
+        axes[2].plot(q, np.ma.masked_equal(curves["efficiency"], 0), color="k")
+        axes[2].plot(params["q"], solution["efficiency"], "ko")
+        axes[2].set_ylabel("$\\eta$ [-]")
+        axes[2].set_ylim(0, 1)
+        axes[2].set_xlabel(f"{lang['discharge']} [m$^3$/s]")
+        for ax in axes:
+            ax.axvline(params["q"], color="grey", lw=0.8)
+            ax.grid(True)
+        fig.tight_layout()
+        return fig
+
+    def characteristic_plot(self):
+        return Response(
+            render_figure(self.characteristic_figure, self.session_params()),
+            mimetype="image/png",
+        )
+
+    def simulation_figure(self, names, step, upper, lower, power):
+        """Creates the figure of the basin levels and the power over time."""
+        t = np.arange(upper.shape[1]) * step / HOUR
+        energy = power.sum(axis=1) * step / HOUR / 1000
+
+        fig, axes = subplots(3, 1, sharex=True, figsize=(9, 7))
+        for i, name in enumerate(names):
+            line = axes[0].plot(t, upper[i], label=f"{name}: {energy[i]:.1f} MWh")[0]
+            axes[1].plot(t, lower[i], color=line.get_color())
+            axes[2].step(
+                t, np.append(power[i], power[i, -1]) / 1000, where="post", color=line.get_color()
+            )
+        axes[0].set_ylabel("$h_A$ [m]")
+        axes[1].set_ylabel("$h_B$ [m]")
+        axes[2].set_ylabel("P [MW]")
+        axes[2].set_xlabel("t [h]")
+        axes[2].set_xticks(np.arange(0, t[-1] + 1, 6))
+        axes[0].legend(fontsize="small")
+        for ax in axes:
+            ax.grid(True)
+        fig.tight_layout()
+        return fig
+
+    def simulation_plot(self):
+        try:
+            days = int(request.args.get("days", 1))
+        except ValueError as e:
+            abort(400, str(e))
+        resolution = request.args.get("resolution", "hour")
+        if resolution not in ("hour", "minute") or not 1 <= days <= 7:
+            abort(400, "resolution must be hour or minute and days between 1 and 7")
+        step = HOUR if resolution == "hour" else MINUTE
+        names, schedules = storage_schedules(
+            self.session_params()["q"], int(HOUR / step), days
+        )
+        with self.timings.measure("simulate"):
+            upper, lower, _, power = simulate_storage(schedules, step)
+        return Response(
+            render_figure(self.simulation_figure, names, step, upper, lower, power),
+            mimetype="image/png",
+        )
+
+    def api_simulate(self):
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get("schedules"), list):
+            return jsonify(error="expected an object with a list of schedules"), 400
+        try:
+            schedules = np.array(data["schedules"], dtype=float)
+            step = float(data.get("step", HOUR))
+        except (TypeError, ValueError) as e:
+            return jsonify(error=str(e)), 400
+        if schedules.ndim != 2 or schedules.size == 0:
+            return jsonify(error="schedules must have the same number of values"), 400
+        if schedules.size > self.simulation_size:
+            return jsonify(error=f"at most {self.simulation_size} values are allowed"), 400
+        if not 0 < step <= DAY:
+            return jsonify(error="step must be between 0 and one day"), 400
+
+        with self.timings.measure("simulate"):
+            upper, lower, discharge, power = simulate_storage(schedules, step)
+        energy = power * step / HOUR
+        results = [
+            {
+                "energy_turbine": float(np.sum(np.maximum(energy[i], 0))),
+                "energy_pump": float(np.sum(np.maximum(-energy[i], 0))),
+                "energy": float(np.sum(energy[i])),
+                "level_upper": float(upper[i, -1]),
+                "level_lower": float(lower[i, -1]),
+            }
+            for i in range(len(schedules))
+        ]
+        if data.get("series", False):
+            for i, result in enumerate(results):
+                result["levels_upper"] = upper[i].tolist()
+                result["levels_lower"] = lower[i].tolist()
+                result["discharges"] = discharge[i].tolist()
+                result["power"] = power[i].tolist()
+        return jsonify(version=1, step=step, results=results)
+
+    def surge(self, params, time):
+        """Simulates the pressure surge after shutting down the pump turbine.
+
+        While turbining the guide vanes are closed within ``time`` seconds,
+        while pumping the pump trips and runs down with the time constant
+        ``time``. Returns ``None`` while the machine is at rest."""
+        q = params["q"] * M3PS
+        if q == 0:
+            return None
+        if q > 0:
+            machine, schedule = "valve", closing_valve(time)
+        else:
+            machine, schedule = "pump", pump_trip(time)
+        k = 0.02 * MM
+        with self.timings.measure("surge"):
+            return water_hammer(
+                [(120 * M, k, 1.2 * M), (200 * M, k, 1.2 * M)],
+                250 * M,
+                150 * M,
+                q,
+                1,
+                machine,
+                schedule,
+                max(20, 3 * time + 10),
+            )
+
+    def surge_profile(self, params):
+        # stations along the actual pipe lengths, the drawing is not to scale
+        x = [0, 120, 120, 320]
+        return x, [230, 120, 120, 130], self.solution(params)["pressure_line"]
+
+    def blueprint(self):
+        bp = super().blueprint()
+        bp.add_url_rule("/characteristic", "characteristic", self.characteristic_plot)
+        bp.add_url_rule("/simulation", "simulation", self.simulation_plot)
+        bp.add_url_rule(
+            "/api/v1/simulate", "api_simulate", self.api_simulate, methods=["POST"]
+        )
+        return bp
+
+    def background(self, solution):
+        rl = 35 #reservoirs_length
+        rh = 3 #reservoirs_extra_height
+        h_o = 250
+        h_u = 150
+        ha = h_o
+        hb = h_u
+        d = 1.2
+        lang = DICT_GER
+
+        x = solution["x"]
+        pipe = solution["pipe"]
+        energy_horizon = solution["energy_horizon"]
+
+
+        #xticks = np.array([0, l1, l1+l2, l1+l2+l3])
+        #xticks = np.array([])
+        #xticks = np.array([-.50, 0, x[-1], x[-1]+.50])
+        #yticks = np.sort(np.array([ha, hout, hb, 175]))
+
+        fig, ax = subplots(figsize=(9,5))
+        ax.set_frame_on(False)
+        #ax.set_xticks(xticks)
+        #ax.set_xticklabels([' ','A','B',' '])
+        #ax.set_yticks(yticks)
+
+
+        ax.plot(x, energy_horizon, label=lang["ehorizont_l"], color="red", linestyle="dashdot", lw=1)
+        energy_line, = ax.plot([], [], label=lang["eline_l"], color="red", lw=1.5)
+        pressure_line, = ax.plot([], [], label=lang["pline_l"], color="blue", linestyle="dashed", lw=1.5)
+        ax.plot(x, pipe, label=lang["paxis"], color="black", linestyle="dashed", lw=1)
+        ax.plot(x, np.array(pipe)+d/2, color="grey", linestyle="-", lw=0.5)
+        ax.plot(x,  np.array(pipe)-d/2, color="grey", linestyle="-", lw=0.5)
+
+        # plot reservoirs
+        ax.plot(np.array([-rl, 0]), np.array([ha, ha]), color="blue", lw=1.5)
+        ax.plot(np.array([x[-1], x[-1]+rl]), np.array([hb, hb]), color="blue", lw=1.5)
+        ax.fill_between(np.array([-rl, 0]), np.array([ha, ha]), np.array([230, 230]), color="b", alpha=0.1)
+        ax.fill_between(np.array([x[-1], x[-1]+rl]), np.array([hb, hb]), np.array([130, 130]), color="b", alpha=0.1)
+
+        ax.plot(np.array([-rl, -rl, 0, 0]), np.array([ha+rh, 230, 230, ha+rh]), color="k", lw=1.5)
+        ax.plot(np.array([x[-1], x[-1], x[-1]+rl, x[-1]+rl]), np.array([hb+rh, 130, 130, hb+rh]), color="k", lw=1.5)
+
+        ax.text(x[-1], ha, lang["ehorizont_s"], ha='right', va="bottom")
+
+        # leftside and rightside labels, placed by ``foreground``
+        labels = {}
+        for side, x_label in (("left", 50), ("right", 200)):
+            labels[f"eline_{side}"] = ax.text(x_label, 0, lang["eline_s"], ha='left', va="bottom", color="red")
+            labels[f"pline_{side}"] = ax.text(x_label, 0, lang["pline_s"], ha='left', va="bottom", color="blue")
+
+        ax.text(0, ha-30, f"DN{int(d*1000)} ", ha='right', va="center")
+        phi = np.linspace(0, 2*np.pi, 50)
+        x_circle = 10*np.sin(phi)
+        y_circle = 10*np.cos(phi)
+        c = Circle((100, 120), 10, color="w", zorder=2)
+        ax.add_artist(c)
+        outline, = ax.plot(100+x_circle, 120+y_circle, color="k", zorder=4)
+        triangle, = ax.fill(100+np.zeros(3), 120+np.zeros(3), color="k", zorder=3)
+
+        # add labels
+        #ax.text(x[0],ha-10,'I ',ha="right")
+        #ax.text(x[1],h2,'II', va='top', ha='center')
+        #ax.text(x[3],h3,'III', va='bottom', ha='center')
+        #ax.text(x[5],h4,' IV')
+
+        ax.grid(axis='both')
+        #ax.legend()
+        ax.set_yticks([120,150,250])
+        ax.set_yticklabels(["120 m.ü.A.", "150 m.ü.A.", "250 m.ü.A."])
+
+        ax.set_xticks([0,100,300])
+        ax.set_xticklabels(["Speicher A", "Pumpturbine", "Speicher B"])
+
+        ax.axis("equal")
+        ax.legend(loc='upper center', bbox_to_anchor=(0.5, 0.1),
+              fancybox=True, shadow=True, ncol=4)
+        #ax.set_xlabel("Distance [m]")
+        #ax.set_ylabel(lang["height"]+" [m]")
+        #ax.set_title("Pressure- and Energyline")
+
+
+        #secax = ax.secondary_yaxis("right")
+        #secax.spines["right"].set_visible(False)
+        ax.set_xlim((-40,x[-1]+40))
+        ax.set_ylim((110,260))
+
+        return fig, {
+            "energy_line": energy_line,
+            "pressure_line": pressure_line,
+            "triangle": triangle,
+            # drawn on top of the triangle
+            "outline": outline,
+            "title": ax.title,
+            **labels,
+        }
+
+    def foreground(self, artists, solution):
+        x = solution["x"]
+        power_pump = solution["power_pump"]
+        power_turbine = solution["power_turbine"]
+        fd = solution["flow_direction"]
+
+        artists["energy_line"].set_data(x, solution["energy_line"])
+        artists["pressure_line"].set_data(x, solution["pressure_line"])
+        artists["title"].set_text(f'Turbinenleistung:{power_turbine/1000: 6.2f} MW \nPumpenleistung:{power_pump/1000: 6.2f} MW')
+
+        #printing leftside and rightside labels
+        for side in ("left", "right"):
+            pos_EL = np.mean(solution[f"energy_line_{side}"])
+            pos_PL = np.mean(solution[f"pressure_line_{side}"])
+            artists[f"eline_{side}"].set_y(pos_EL+3)
+            if abs(pos_EL-pos_PL) < 10:
+                artists[f"pline_{side}"].set_y(pos_PL-10)
+            else:
+                artists[f"pline_{side}"].set_y(pos_PL+3)
+
+        phi = np.array([np.pi/2,-np.pi/6,7*np.pi/6,np.pi/2]) + fd
+        x_triangle = 10*np.sin(phi)
+        y_triangle = 10*np.cos(phi)
+        #ax.plot(100+x_triangle, 120+y_triangle, color="k", zorder=4)
+        artists["triangle"].set_xy(np.column_stack((100+x_triangle, 120+y_triangle)))
+
+
+problem = PressurePipe03()
+bp = problem.blueprint()
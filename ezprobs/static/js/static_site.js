@@ -0,0 +1,37 @@
+// Replaces the requests of a problem page to the server by lookups in the
+// index written by "python -m ezprobs.export".
+(function() {
+    var index = null;
+    var loaded = $.getJSON(document.currentScript.dataset.index, function(data) {
+        index = data;
+    });
+    var base = new URL(document.currentScript.dataset.index, window.location.href);
+
+    // files of the state of the serialized form
+    function lookup(data) {
+        var params = new URLSearchParams(data);
+        var key = index.parameters.map(function(p) {
+            var i = Math.round((Number(params.get(p.name)) - p.min) / p.step);
+            return p.values[Math.max(0, Math.min(i, p.values.length - 1))];
+        }).join(",");
+        return index.states[key];
+    }
+
+    // the page reloads the plot with this url after the solution arrived
+    stateUrl = function(urlString) {
+        return new URL(lookup($("form").serialize()).plot, base).toString();
+    };
+
+    var post = $.post;
+    $.post = function(url, data, success) {
+        if (url == "prefetch") {
+            return $.Deferred().resolve().promise();
+        }
+        if (url != "ajax") {
+            return post.apply(this, arguments);
+        }
+        return loaded.then(function() {
+            return $.get(new URL(lookup(data).solution, base).toString());
+        }).done(success);
+    };
+})();
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+from threading import Lock
+
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+class Surrogate:
+    """Interpolates results of a problem between precomputed solutions.
+
+    The solutions are computed on a regular grid spanning the range of all
+    parameters with ``resolution`` grid cells per slider step. ``outputs`` are
+    the keys of the solution to interpolate, the values may be numbers or
+    lists of a fixed length."""
+
+    def __init__(self, problem, outputs, resolution=2, method="linear"):
+        self.problem = problem
+        self.outputs = outputs
+        self.resolution = resolution
+        self.method = method
+        self.interpolators = None
+        self.errors = None
+        self._lock = Lock()
+
+    def axes(self):
+        """Returns the grid values of every parameter."""
+        return [
+            np.linspace(
+                p.val_min,
+                p.val_max,
+                int(round((p.val_max - p.val_min) / p.val_step)) * self.resolution + 1,
+            )
+            for p in self.problem.parameters
+        ]
+
+    def build(self):
+        """Computes the solutions on the grid and sets up the interpolators."""
+        with self._lock:
+            if self.interpolators is not None:
+                return
+            axes = self.axes()
+            names = [p.name for p in self.problem.parameters]
+            mesh = np.meshgrid(*axes, indexing="ij")
+            states = [
+                dict(zip(names, values))
+                for values in zip(*(m.ravel() for m in mesh))
+            ]
+            solutions = self.problem.solve_batch(states)
+            shape = mesh[0].shape
+            interpolators = {}
+            for key in self.outputs:
+                values = np.array([s[key] for s in solutions], dtype=float)
+                interpolators[key] = RegularGridInterpolator(
+                    axes, values.reshape(shape + values.shape[1:]), method=self.method
+                )
+            self.interpolators = interpolators
+
+    def points(self, states):
+        """Returns the states as array of points in the parameter space."""
+        return np.array(
+            [[params[p.name] for p in self.problem.parameters] for params in states],
+            dtype=float,
+        )
+
+    def evaluate(self, states):
+        """Returns the interpolated outputs for a list of parameter values."""
+        self.build()
+        points = self.points(states)
+        values = {key: f(points) for key, f in self.interpolators.items()}
+        return [
+            {key: values[key][i].tolist() for key in self.outputs}
+            for i in range(len(states))
+        ]
+
+    def validate(self, samples=256, seed=0):
+        """Estimates the interpolation errors against the exact solutions.
+
+        The errors are evaluated on ``samples`` random states and stored as
+        maximum and root mean square of the absolute error per output."""
+        rng = np.random.default_rng(seed)
+        states = [
+            {
+                p.name: rng.uniform(p.val_min, p.val_max)
+                for p in self.problem.parameters
+            }
+            for _ in range(samples)
+        ]
+        approximated = self.evaluate(states)
+        exact = self.problem.solve_batch(states)
+        errors = {}
+        for key in self.outputs:
+            difference = np.array(
+                [a[key] for a in approximated], dtype=float
+            ) - np.array([e[key] for e in exact], dtype=float)
+            errors[key] = {
+                "max": float(np.max(np.abs(difference))),
+                "rms": float(np.sqrt(np.mean(difference ** 2))),
+            }
+        self.errors = errors
+        return errors
+
+
+class SurrogateBatch:
+    """Mixin for problems whose batch API can answer with the surrogate.
+
+    Problems list the ``surrogate_outputs`` to interpolate, the batch API
+    then accepts the accuracy ``surrogate`` and answers with the
+    interpolated outputs and the validation errors of the surrogate."""
+
+    # solution keys which can be interpolated by the surrogate and the number
+    # of grid cells per slider step it is computed on
+    surrogate_outputs = []
+    surrogate_resolution = 2
+    accuracies = ("exact", "surrogate")
+
+    def __init__(self):
+        super().__init__()
+        self._surrogate = None
+        self._surrogate_lock = Lock()
+
+    def surrogate(self):
+        """Returns the validated surrogate of the problem, built on first
+        use."""
+        with self._surrogate_lock:
+            if self._surrogate is None:
+                with self.timings.measure("surrogate"):
+                    surrogate = Surrogate(
+                        self, self.surrogate_outputs, self.surrogate_resolution
+                    )
+                    surrogate.build()
+                    surrogate.validate()
+                self._surrogate = surrogate
+            return self._surrogate
+
+    def batch(self, states, accuracy):
+        if accuracy != "surrogate":
+            return super().batch(states, accuracy)
+        surrogate = self.surrogate()
+        with self.timings.measure("surrogate_batch"):
+            solutions = surrogate.evaluate(states) if states else []
+        return {"solutions": solutions, "errors": surrogate.errors}
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+from array import array
+from hashlib import sha256
+
+import csv
+
+import numpy as np
+
+from ezprobs.cache import LRUCache, hash_file, hashed_lines
+from ezprobs.geometry import Section, polyline
+from ezprobs.units import GRAVITY
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+# parsed surveys by the SHA-256 of their file
+_surveys = LRUCache(32)
+
+COLUMNS = ("chainage", "station", "elevation")
+
+
+class Survey:
+    """Surveyed channel given by cross sections along its axis.
+
+    The points of all cross sections are stored in flat arrays, the points of
+    section ``i`` are ``stations[offsets[i]:offsets[i + 1]]``. The geometry of
+    every section is tabulated for ``resolution`` depths between its lowest
+    point and its lower bank, the tables hold one row per section."""
+
+    def __init__(self, chainage, offsets, stations, elevations, resolution=200):
+        self.chainage = chainage
+        self.offsets = offsets
+        self.stations = stations
+        self.elevations = elevations
+        count = len(chainage)
+        self.bed = np.minimum.reduceat(elevations, offsets[:-1])
+        banks = np.minimum(elevations[offsets[:-1]], elevations[offsets[1:] - 1])
+        self.depths = np.linspace(0, 1, resolution) * (banks - self.bed)[:, None]
+        self.areas = np.empty((count, resolution))
+        self.perimeters = np.empty((count, resolution))
+        self.top_widths = np.empty((count, resolution))
+        for i in range(count):
+            points = slice(offsets[i], offsets[i + 1])
+            self.areas[i], self.perimeters[i], self.top_widths[i] = polyline(
+                self.depths[i], stations[points], elevations[points]
+            )
+
+        wet = self.areas > 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            radii = np.where(wet, self.areas / self.perimeters, 0)
+            factors = np.where(
+                wet, self.areas * np.sqrt(self.areas / self.top_widths), 0
+            )
+        conveyance = self.areas * radii ** (2 / 3)
+        self.conveyance = np.maximum.accumulate(conveyance, axis=1)
+        self.section_factor = np.maximum.accumulate(factors, axis=1)
+
+    def __len__(self):
+        return len(self.chainage)
+
+    @property
+    def slope(self):
+        """Slope of the bed between every section and the next one, the last
+        section takes the slope of the one before."""
+        slope = -np.diff(self.bed) / np.diff(self.chainage)
+        return np.append(slope, slope[-1]) if len(slope) else np.zeros(1)
+
+    def section(self, i):
+        """Returns the ``Section`` of the cross section ``i``."""
+        points = slice(self.offsets[i], self.offsets[i + 1])
+        return Section.polyline(
+            self.stations[points], self.elevations[points], self.depths.shape[1]
+        )
+
+    def _inverse(self, table, values):
+        """Interpolates the depths where every row of ``table`` reaches its
+        value in ``values``, NaN above the table.
+
+        The rows are shifted apart so all of them are interpolated at once."""
+        top = table[:, -1]
+        shift = np.cumsum(np.concatenate(([0], top[:-1] + 1)))
+        result = np.interp(
+            values + shift, (table + shift[:, None]).ravel(), self.depths.ravel()
+        )
+        return np.where((values >= 0) & (values <= top), result, np.nan)
+
+    def normal_depth(self, discharge, strickler_roughness, inclination=None):
+        """Calculates the normal depth at every section, by default with the
+        slope of the bed. Returns NaN where the slope is not positive or the
+        discharge exceeds the capacity."""
+        if inclination is None:
+            inclination = self.slope
+        inclination = np.broadcast_to(
+            np.asarray(inclination, dtype=float), (len(self),)
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            target = discharge / (
+                strickler_roughness * np.sqrt(np.maximum(inclination, 0))
+            )
+        depth = self._inverse(self.conveyance, target)
+        return np.where(inclination > 0, depth, np.nan)
+
+    def critical_depth(self, discharge):
+        """Calculates the critical depth at every section."""
+        target = np.full(len(self), discharge / np.sqrt(GRAVITY))
+        return self._inverse(self.section_factor, target)
+
+
+def read_survey(lines, resolution=200, max_points=10000000):
+    """Parses a survey from an iterable of CSV lines.
+
+    The header names the columns ``chainage``, ``station`` and ``elevation``
+    in any order, further columns are ignored. The points of a cross section
+    follow each other across the channel, the sections are ordered along
+    the channel axis. The lines are parsed one at a time into compact
+    arrays, so the file is never held in memory.
+
+    Raises a ``ValueError`` if the file is invalid."""
+    reader = csv.reader(lines)
+    header = [name.strip().lower() for name in next(reader, [])]
+    try:
+        columns = [header.index(name) for name in COLUMNS]
+    except ValueError:
+        raise ValueError(f"the header must name the columns {', '.join(COLUMNS)}")
+
+    chainage = array("d")
+    offsets = array("q")
+    stations = array("d")
+    elevations = array("d")
+    c, s, e = columns
+    for row in reader:
+        if not row:
+            continue
+        try:
+            position = float(row[c])
+            stations.append(float(row[s]))
+            elevations.append(float(row[e]))
+        except (IndexError, ValueError):
+            raise ValueError(f"invalid line {reader.line_num}")
+        if not chainage or position != chainage[-1]:
+            if chainage and position < chainage[-1]:
+                raise ValueError(f"chainage decreases in line {reader.line_num}")
+            chainage.append(position)
+            offsets.append(len(stations) - 1)
+        if len(stations) > max_points:
+            raise ValueError(f"at most {max_points} points are allowed")
+    offsets.append(len(stations))
+
+    if not chainage:
+        raise ValueError("the survey contains no points")
+    offsets = np.frombuffer(offsets, dtype=np.int64)
+    if np.any(np.diff(offsets) < 3):
+        raise ValueError("every cross section needs at least three points")
+    return Survey(
+        np.frombuffer(chainage),
+        offsets,
+        np.frombuffer(stations),
+        np.frombuffer(elevations),
+        resolution,
+    )
+
+
+def load_survey(path, resolution=200):
+    """Returns the survey of the CSV file at ``path``.
+
+    The file is hashed in blocks, a survey parsed before from a file with the
+    same content is returned from the cache."""
+    key = (hash_file(path), resolution)
+    survey = _surveys.get(key)
+    if survey is None:
+        with open(path, newline="") as f:
+            survey = read_survey(f, resolution)
+        _surveys.put(key, survey)
+    return survey
+
+
+def upload_survey(stream, resolution=200, max_points=10000000):
+    """Parses a survey from the binary ``stream`` of an upload.
+
+    The stream is read and hashed in blocks while it is parsed. Returns the
+    hash which can be passed to ``cached_survey`` later on and the survey."""
+    digest = sha256()
+    survey = read_survey(hashed_lines(stream, digest), resolution, max_points)
+    key = digest.hexdigest()
+    _surveys.put((key, resolution), survey)
+    return key, survey
+
+
+def cached_survey(key, resolution=200):
+    """Returns the cached survey with the hash ``key`` or ``None``."""
+    return _surveys.get((key, resolution))
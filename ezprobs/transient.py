@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+from flask import Response, abort, request
+
+from ezprobs.dict import DICT_GER
+from ezprobs.geometry import area_circle
+from ezprobs.hydraulics import RE_CRITICAL, lambda_vec, reynolds_number
+from ezprobs.problems import render_figure, subplots
+from ezprobs.units import GRAVITY, MPS
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+def closing_valve(closure_time):
+    """Returns the relative opening of a valve closing linearly within
+    ``closure_time`` seconds."""
+    return lambda t: max(0.0, 1 - t / closure_time) if closure_time > 0 else 0.0
+
+
+def pump_trip(rundown_time):
+    """Returns the relative speed of a pump running down after a power
+    failure with the time constant ``rundown_time``."""
+    return lambda t: 1 / (1 + t / rundown_time) if rundown_time > 0 else 0.0
+
+
+def water_hammer(
+    pipes,
+    h_upstream,
+    h_downstream,
+    q0,
+    machine_node,
+    machine,
+    schedule,
+    duration,
+    wave_speed=1000 * MPS,
+    reaches=4,
+):
+    """Simulates the pressure surge in a chain of pipes between two basins by
+    the method of characteristics.
+
+    ``pipes`` is a list of ``(l, k, d)`` tuples, the chain starts at the basin
+    with the level ``h_upstream`` and initially carries the steady discharge
+    ``q0``. A ``machine`` is placed at the start of the pipe ``machine_node``
+    (``len(pipes)`` is the outlet), it is either a ``"valve"`` whose opening
+    or a ``"pump"`` whose speed is given over time by ``schedule``. The head
+    of the machine in the steady state takes up all the head not lost by pipe
+    friction, a pump has a check valve preventing backflow. The shortest pipe
+    is divided into ``reaches`` reaches, the wave speeds of the other pipes
+    are adjusted to fit the common time step.
+
+    Returns a dictionary with the node positions ``x``, the envelopes of the
+    heads ``head_max`` and ``head_min`` at the ends of every reach at the
+    positions ``x_envelope``, the times ``t`` and the heads at both sides of
+    the machine and its discharge over time."""
+    lengths = np.array([l for l, _, _ in pipes], dtype=float)
+    dt = lengths.min() / wave_speed / reaches
+    counts = np.maximum(np.round(lengths / (wave_speed * dt)).astype(int), 1)
+
+    # properties of every reach along the chain
+    pipe = np.repeat(np.arange(len(pipes)), counts)
+    dx = (lengths / counts)[pipe]
+    k = np.array([k for _, k, _ in pipes], dtype=float)[pipe]
+    d = np.array([d for _, _, d in pipes], dtype=float)[pipe]
+    a = area_circle(d / 2)
+    # the quadratic friction of the characteristics assumes turbulent flow
+    re = np.maximum(reynolds_number(abs(q0) / a, d), RE_CRITICAL)
+    lam = lambda_vec(k, d, re)
+    b = dx / dt / (GRAVITY * a)
+    r = lam * dx / (2 * GRAVITY * d * a ** 2)
+
+    nodes = len(pipe) + 1
+    m = int(np.cumsum(np.concatenate(([0], counts)))[machine_node])
+    x = np.concatenate(([0], np.cumsum(dx)))
+
+    # characteristic impedances seen by every node, the basins have none
+    b_plus = np.concatenate(([0], b))
+    b_minus = np.concatenate((b, [0]))
+    impedances = b_plus + b_minus
+
+    # steady state, the machine takes up the remaining head
+    q = np.full(nodes, float(q0))
+    losses = r * q0 * abs(q0)
+    dh0 = h_upstream - h_downstream - losses.sum()
+    h_right = np.empty(nodes)
+    h_left = np.empty(nodes)
+    h_left[0] = h_upstream
+    h_right[0] = h_upstream - (dh0 if m == 0 else 0)
+    for j in range(1, nodes):
+        h_left[j] = h_right[j - 1] - losses[j - 1]
+        h_right[j] = h_left[j] - (dh0 if m == j else 0)
+    valve = dh0 / q0 ** 2 if q0 else 0
+
+    steps = int(np.ceil(duration / dt))
+    t = np.arange(steps + 1) * dt
+    c_plus = np.empty(nodes)
+    c_minus = np.empty(nodes)
+    envelope_max = np.concatenate((h_right[:-1, None], h_left[1:, None]), axis=1)
+    envelope_min = envelope_max.copy()
+    machine_head = np.empty((steps + 1, 2))
+    machine_discharge = np.empty(steps + 1)
+    machine_head[0] = h_left[m], h_right[m]
+    machine_discharge[0] = q0
+
+    for i in range(1, steps + 1):
+        c_plus[1:] = h_right[:-1] + b * q[:-1] - r * q[:-1] * np.abs(q[:-1])
+        c_minus[:-1] = h_left[1:] - b * q[1:] + r * q[1:] * np.abs(q[1:])
+        c_plus[0] = h_upstream
+        c_minus[-1] = h_downstream
+        np.subtract(c_plus, c_minus, out=q)
+        q /= impedances
+
+        s = c_plus[m] - c_minus[m]
+        impedance = impedances[m]
+        if machine == "valve":
+            opening = schedule(t[i])
+            if opening <= 0:
+                q[m] = 0
+            else:
+                # (b+ + b-) q + valve / opening^2 q |q| = c+ - c-
+                coefficient = valve / opening ** 2
+                q[m] = (
+                    np.sign(s)
+                    * 2
+                    * abs(s)
+                    / (impedance + np.sqrt(impedance ** 2 + 4 * coefficient * abs(s)))
+                )
+        else:
+            dh = dh0 * schedule(t[i]) ** 2
+            q[m] = (s - dh) / impedance
+            if q[m] * q0 <= 0:
+                q[m] = 0
+        np.subtract(c_plus, b_plus * q, out=h_left)
+        np.add(c_minus, b_minus * q, out=h_right)
+
+        np.maximum(envelope_max[:, 0], h_right[:-1], out=envelope_max[:, 0])
+        np.maximum(envelope_max[:, 1], h_left[1:], out=envelope_max[:, 1])
+        np.minimum(envelope_min[:, 0], h_right[:-1], out=envelope_min[:, 0])
+        np.minimum(envelope_min[:, 1], h_left[1:], out=envelope_min[:, 1])
+        machine_head[i] = h_left[m], h_right[m]
+        machine_discharge[i] = q[m]
+
+    return {
+        "x": x,
+        "x_envelope": np.column_stack((x[:-1], x[1:])).ravel(),
+        "head_max": envelope_max.ravel(),
+        "head_min": envelope_min.ravel(),
+        "t": t,
+        "machine_head": machine_head,
+        "machine_discharge": machine_discharge,
+    }
+
+
+class PressureSurge:
+    """Mixin for problems which plot the pressure surge of ``water_hammer``.
+
+    Problems implement ``surge(params, time)`` returning the result of
+    ``water_hammer`` or ``None`` while there is no surge and
+    ``surge_profile(params)`` returning the stations, the heights of the pipe
+    axis and the steady pressure line the envelopes are drawn along. The plot
+    is served under ``/surge``."""
+
+    def surge_figure(self, result, x, pipe, pressure_line):
+        """Creates the figure of a pressure surge computed by ``water_hammer``.
+
+        The envelopes of the head are drawn along the pipe axis given by the
+        stations ``x`` and the heights ``pipe`` together with the steady
+        ``pressure_line``, the heads at the machine are drawn over time."""
+        lang = DICT_GER
+        x_envelope = result["x_envelope"]
+        # water evaporates about 10 m below the atmospheric pressure
+        vapour = np.interp(x_envelope, x, pipe) - 10
+
+        fig, (ax, ax_t) = subplots(1, 2, figsize=(11, 4.5))
+        ax.fill_between(
+            x_envelope,
+            result["head_min"],
+            result["head_max"],
+            color="lightsteelblue",
+            label=lang["envelope"],
+        )
+        ax.plot(
+            x, pressure_line, color="blue", linestyle="dashed", label=lang["pline_l"]
+        )
+        ax.plot(x, pipe, color="black", linestyle="dashdot", label=lang["paxis"])
+        ax.plot(
+            x_envelope, vapour, color="red", linestyle="dotted", label=lang["cavitation"]
+        )
+        ax.set_ylabel(f"{lang['height']} [m]")
+        ax.grid(True)
+        ax.legend(fontsize="small")
+
+        t = result["t"]
+        ax_t.plot(t, result["machine_head"][:, 0], color="blue", label=lang["upstream"])
+        ax_t.plot(
+            t, result["machine_head"][:, 1], color="green", label=lang["downstream"]
+        )
+        ax_t.set_xlabel("t [s]")
+        ax_t.set_ylabel(f"{lang['height']} [m]")
+        ax_t.grid(True)
+        ax_t.legend(fontsize="small", loc="upper right")
+        ax_q = ax_t.twinx()
+        ax_q.plot(t, result["machine_discharge"], color="red")
+        ax_q.set_ylabel(f"{lang['discharge']} [m$^3$/s]", color="red")
+        fig.tight_layout()
+        return fig
+
+    def surge_time(self):
+        """Returns the closure or run-down time of a surge request."""
+        try:
+            time = float(request.args.get("time", 2))
+        except ValueError as e:
+            abort(400, str(e))
+        if not 0 <= time <= 60:
+            abort(400, "time must be between 0 and 60 s")
+        return time
+
+    def surge_plot(self):
+        params = self.session_params()
+        result = self.surge(params, self.surge_time())
+        if result is None:
+            return "", 204
+        return Response(
+            render_figure(self.surge_figure, result, *self.surge_profile(params)),
+            mimetype="image/png",
+        )
+
+    def blueprint(self):
+        bp = super().blueprint()
+        bp.add_url_rule("/surge", "surge", self.surge_plot)
+        return bp
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+
+from itertools import repeat
+
+import numpy as np
+from flask import Response, abort, current_app, jsonify, request
+
+from ezprobs.cache import LRUCache
+from ezprobs.problems import render_executor, render_figure, subplots
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+class Accumulator:
+    """Collects statistics of a stream of samples with constant memory.
+
+    Mean and variance are updated with the algorithm of Welford/Chan, the
+    distribution is collected in a histogram with the fixed bin ``edges``.
+    Samples may be scalars or vectors of a fixed length, ``edges`` then holds
+    one row of bin edges per component."""
+
+    def __init__(self, edges):
+        self.edges = np.atleast_2d(np.asarray(edges, dtype=float))
+        components, bins = self.edges.shape[0], self.edges.shape[1] - 1
+        self.count = 0
+        self.mean = np.zeros(components)
+        self.m2 = np.zeros(components)
+        self.minimum = np.full(components, np.inf)
+        self.maximum = np.full(components, -np.inf)
+        self.histogram = np.zeros((components, bins), dtype=np.int64)
+        self.below = np.zeros(components, dtype=np.int64)
+        self.above = np.zeros(components, dtype=np.int64)
+
+    def add(self, values):
+        """Adds a chunk of samples, one sample per row."""
+        values = np.asarray(values, dtype=float).reshape(len(values), -1)
+        chunk = Accumulator(self.edges)
+        chunk.count = len(values)
+        chunk.mean = values.mean(axis=0)
+        chunk.m2 = ((values - chunk.mean) ** 2).sum(axis=0)
+        chunk.minimum = values.min(axis=0)
+        chunk.maximum = values.max(axis=0)
+        for i, edges in enumerate(self.edges):
+            chunk.histogram[i] = np.histogram(values[:, i], bins=edges)[0]
+            chunk.below[i] = np.count_nonzero(values[:, i] < edges[0])
+            chunk.above[i] = np.count_nonzero(values[:, i] > edges[-1])
+        self.merge(chunk)
+
+    def merge(self, other):
+        """Adds the samples collected by ``other`` with the same bin edges."""
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / count
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.minimum = np.minimum(self.minimum, other.minimum)
+        self.maximum = np.maximum(self.maximum, other.maximum)
+        self.histogram += other.histogram
+        self.below += other.below
+        self.above += other.above
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / max(self.count - 1, 1))
+
+    def percentile(self, q):
+        """Estimates the ``q``-th percentile of every component from the histogram."""
+        result = np.empty(len(self.edges))
+        for i, edges in enumerate(self.edges):
+            cumulative = np.concatenate(
+                ([self.below[i]], self.below[i] + np.cumsum(self.histogram[i]))
+            )
+            result[i] = np.interp(q / 100 * self.count, cumulative, edges)
+        return result
+
+    def summary(self, percentiles=(5, 50, 95)):
+        """Returns the statistics as dictionary, vectors are returned as lists."""
+        squeeze = (lambda v: float(v[0])) if len(self.edges) == 1 else (lambda v: v.tolist())
+        return {
+            "count": self.count,
+            "mean": squeeze(self.mean),
+            "std": squeeze(self.std),
+            "min": squeeze(self.minimum),
+            "max": squeeze(self.maximum),
+            "percentiles": {str(q): squeeze(self.percentile(q)) for q in percentiles},
+        }
+
+
+def lognormal(rng, mean, cv, size):
+    """Draws samples of a log-normal distribution with the given mean and
+    coefficient of variation."""
+    if cv <= 0:
+        return np.full(size, float(mean))
+    sigma = np.sqrt(np.log(1 + cv ** 2))
+    return mean * rng.lognormal(-(sigma ** 2) / 2, sigma, size)
+
+
+def run_chunk(kernel, nominal, cvs, fixed, size, seed, edges=None):
+    """Evaluates ``kernel`` for ``size`` samples of the uncertain inputs.
+
+    The inputs are drawn from log-normal distributions around their
+    ``nominal`` values. Returns the accumulators of all outputs of the kernel
+    or the raw outputs if no ``edges`` are given."""
+    rng = np.random.default_rng(seed)
+    inputs = {
+        name: lognormal(rng, value, cvs.get(name, 0), size)
+        for name, value in nominal.items()
+    }
+    outputs = kernel(inputs, **fixed)
+    if edges is None:
+        return outputs
+    accumulators = {}
+    for name, values in outputs.items():
+        accumulators[name] = Accumulator(edges[name])
+        accumulators[name].add(values)
+    return accumulators
+
+
+def _edges(values, bins):
+    """Returns histogram bin edges covering the given samples with a margin."""
+    values = np.asarray(values, dtype=float).reshape(len(values), -1)
+    low = values.min(axis=0)
+    high = values.max(axis=0)
+    margin = np.maximum(0.25 * (high - low), 1e-9 * np.maximum(np.abs(high), 1))
+    return np.linspace(low - margin, high + margin, bins + 1, axis=1)
+
+
+def monte_carlo(
+    kernel,
+    nominal,
+    cvs,
+    fixed,
+    samples,
+    chunk_size=10000,
+    bins=60,
+    seed=0,
+    executor=None,
+):
+    """Propagates the uncertainty of the inputs through a vectorized kernel.
+
+    ``kernel(inputs, **fixed)`` receives a dictionary of sample arrays for the
+    names in ``nominal`` and returns a dictionary of output arrays. The samples
+    are evaluated in chunks of ``chunk_size``, in parallel if an ``executor``
+    is given, and only their statistics are kept. The first chunk is used to
+    fix the histogram ranges. Returns an ``Accumulator`` per output."""
+    sizes = [min(chunk_size, samples - start) for start in range(0, samples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    first = run_chunk(kernel, nominal, cvs, fixed, sizes[0], seeds[0])
+    edges = {name: _edges(values, bins) for name, values in first.items()}
+    result = {}
+    for name, values in first.items():
+        result[name] = Accumulator(edges[name])
+        result[name].add(values)
+
+    args = (
+        repeat(kernel),
+        repeat(nominal),
+        repeat(cvs),
+        repeat(fixed),
+        sizes[1:],
+        seeds[1:],
+        repeat(edges),
+    )
+    chunks = map(run_chunk, *args) if executor is None else executor.map(run_chunk, *args)
+    for accumulators in chunks:
+        for name, accumulator in accumulators.items():
+            result[name].merge(accumulator)
+    return result
+
+
+class UncertaintyMode:
+    """Mixin for problems whose outputs are propagated from uncertain inputs
+    by Monte Carlo simulation.
+
+    Problems implement ``uncertainty_model`` and get the plot of the output
+    statistics under ``/uncertainty`` and their summary under
+    ``/api/v1/uncertainty``."""
+
+    # inputs varied by the uncertainty mode with their default coefficient of
+    # variation and the outputs of ``uncertainty_model`` with their labels
+    uncertain_inputs = {}
+    uncertainty_outputs = {}
+    uncertainty_samples = 20000
+    uncertainty_max_samples = 1000000
+
+    def __init__(self):
+        super().__init__()
+        self.uncertainties = LRUCache(self.plot_cache_size)
+
+    def uncertainty_model(self, params):
+        """Returns the kernel propagating the uncertain inputs for ``params``.
+
+        Returns a tuple of the vectorized kernel, the nominal values of the
+        ``uncertain_inputs`` and the fixed keyword arguments of the kernel as
+        expected by ``monte_carlo``. The kernel must be a module level function
+        so it can be evaluated in the process pool."""
+        raise NotImplementedError
+
+    def uncertainty(self, params, cvs, samples, processes=0):
+        """Returns the cached statistics of the outputs for ``params`` or
+        computes them by Monte Carlo simulation.
+
+        ``cvs`` holds the coefficient of variation of every uncertain input.
+        If ``processes`` is not zero the samples are evaluated in the shared
+        process pool."""
+        key = (self.key(params), tuple(sorted(cvs.items())), samples)
+        result = self.uncertainties.get(key)
+        if result is None:
+            kernel, nominal, fixed = self.uncertainty_model(params)
+            with self.timings.measure("uncertainty"):
+                result = monte_carlo(
+                    kernel,
+                    nominal,
+                    cvs,
+                    fixed,
+                    samples,
+                    executor=render_executor(processes),
+                )
+            self.uncertainties.put(key, result)
+        return result
+
+    def uncertainty_figure(self, solution, result):
+        """Creates the figure displaying the statistics of the outputs.
+
+        Scalar outputs are shown as histogram, vectors as band between the 5th
+        and 95th percentile over the ``x`` values of the solution."""
+        count = len(self.uncertainty_outputs)
+        fig, axes = subplots(1, count, figsize=(4.5 * count, 3.5), squeeze=False)
+        for ax, (name, label) in zip(axes[0], self.uncertainty_outputs.items()):
+            accumulator = result[name]
+            if len(accumulator.edges) == 1:
+                ax.stairs(
+                    accumulator.histogram[0] / accumulator.count,
+                    accumulator.edges[0],
+                    fill=True,
+                    color="lightsteelblue",
+                )
+                for q, style in ((5, ":"), (50, "-"), (95, ":")):
+                    ax.axvline(accumulator.percentile(q)[0], color="k", linestyle=style)
+                ax.set_xlabel(label)
+                ax.set_ylabel("relative frequency")
+            else:
+                x = solution.get("x", np.arange(len(accumulator.edges)))
+                ax.fill_between(
+                    x,
+                    accumulator.percentile(5),
+                    accumulator.percentile(95),
+                    color="lightsteelblue",
+                    label="5% - 95%",
+                )
+                ax.plot(x, accumulator.percentile(50), color="k", label="50%")
+                ax.set_ylabel(label)
+                ax.legend()
+        fig.tight_layout()
+        return fig
+
+    def uncertainty_params(self):
+        """Returns the parameter values, coefficients of variation and number
+        of samples of an uncertainty request."""
+        try:
+            if any(p.name in request.args for p in self.parameters):
+                params = self.parse(request.args)
+            else:
+                params = self.session_params()
+            cvs = {
+                name: float(request.args.get(f"{name}_cv", cv))
+                for name, cv in self.uncertain_inputs.items()
+            }
+            samples = int(request.args.get("samples", self.uncertainty_samples))
+        except ValueError as e:
+            abort(400, str(e))
+        if not all(0 <= cv <= 1 for cv in cvs.values()):
+            abort(400, "coefficients of variation must be between 0 and 1")
+        if not 1 <= samples <= self.uncertainty_max_samples:
+            abort(400, f"samples must be between 1 and {self.uncertainty_max_samples}")
+        return params, cvs, samples
+
+    def uncertainty_plot(self):
+        params, cvs, samples = self.uncertainty_params()
+        result = self.uncertainty(
+            params, cvs, samples, current_app.config.get("render_processes", 0)
+        )
+        return Response(
+            render_figure(self.uncertainty_figure, self.solution(params), result),
+            mimetype="image/png",
+        )
+
+    def api_uncertainty(self):
+        params, cvs, samples = self.uncertainty_params()
+        result = self.uncertainty(
+            params, cvs, samples, current_app.config.get("render_processes", 0)
+        )
+        return jsonify(
+            version=1,
+            state=params,
+            cvs=cvs,
+            samples=samples,
+            outputs={name: a.summary() for name, a in result.items()},
+        )
+
+    def page_context(self, params):
+        return dict(super().page_context(params), uncertainty=True)
+
+    def caches(self):
+        return dict(super().caches(), uncertainties=self.uncertainties)
+
+    def blueprint(self):
+        bp = super().blueprint()
+        bp.add_url_rule("/uncertainty", "uncertainty", self.uncertainty_plot)
+        bp.add_url_rule("/api/v1/uncertainty", "api_uncertainty", self.api_uncertainty)
+        return bp
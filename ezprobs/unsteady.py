@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+
+from uuid import uuid4
+
+import json
+
+import numpy as np
+from flask import Response, jsonify, request
+
+from ezprobs.cache import LRUCache
+from ezprobs.dict import DICT_GER
+from ezprobs.hydraulics import t_n_rect_vec
+from ezprobs.problems import job_executor, render_figure, subplots
+from ezprobs.units import GRAVITY
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+def hydrograph_function(hydrograph):
+    """Returns the discharge over time of a hydrograph given as list of
+    ``(t, q)`` pairs, interpolated linearly and constant outside."""
+    times, discharges = np.array(hydrograph, dtype=float).T
+    return lambda t: np.interp(t, times, discharges)
+
+
+def saint_venant(
+    length,
+    width,
+    slope,
+    strickler_roughness,
+    hydrograph,
+    duration,
+    sections=1000,
+    frame_interval=60,
+    courant=0.8,
+):
+    """Solves the Saint-Venant equations for a rectangular channel with the
+    MacCormack scheme.
+
+    ``slope`` and ``strickler_roughness`` are numbers or arrays with a value
+    per cross section. The inflow at the upstream end is given by the
+    ``hydrograph`` as list of ``(t, q)`` pairs, the channel initially carries
+    the first discharge at normal depth and the water leaves it freely at the
+    downstream end. The time step follows from the ``courant`` number.
+
+    This is a generator yielding the time, depths and discharges of all
+    ``sections`` cross sections every ``frame_interval`` seconds until
+    ``duration``. Raises a ``ValueError`` if the simulation becomes
+    unstable."""
+    inflow = hydrograph_function(hydrograph)
+    dx = length / (sections - 1)
+    slope = np.broadcast_to(np.asarray(slope, dtype=float), (sections,))
+    ks = np.broadcast_to(np.asarray(strickler_roughness, dtype=float), (sections,))
+    w = width
+
+    q = np.full(sections, float(inflow(0)))
+    a = w * t_n_rect_vec(q, ks, slope, w)
+    a_predicted = np.empty(sections)
+    q_predicted = np.empty(sections)
+
+    def flux(a, q):
+        return q ** 2 / a + GRAVITY * a ** 2 / (2 * w)
+
+    ks2 = ks ** 2
+
+    def source(a, q):
+        r = a / (w + 2 * a / w)
+        friction = q * np.abs(q) / (ks2 * a ** 2 * r ** (4 / 3))
+        return GRAVITY * a * (slope - friction)
+
+    t = 0.0
+    frame = 0.0
+    while True:
+        if t >= frame - 1e-9:
+            yield t, a / w, q.copy()
+            frame += frame_interval
+            if frame > duration + 1e-9:
+                return
+        celerity = np.abs(q / a) + np.sqrt(GRAVITY * a / w)
+        # the friction is integrated explicitly, so it limits the time step
+        # of coarse cross sections as well
+        r = a / (w + 2 * a / w)
+        relaxation = 2 * GRAVITY * np.abs(q) / (ks2 * a * r ** (4 / 3))
+        dt = min(
+            courant * dx / celerity.max(),
+            courant / max(relaxation.max(), 1e-12),
+            frame - t,
+        )
+        if not np.isfinite(dt):
+            raise ValueError("the simulation became unstable")
+
+        # predictor with forward differences
+        f = flux(a, q)
+        s = source(a, q)
+        a_predicted[:-1] = a[:-1] - dt / dx * (q[1:] - q[:-1])
+        q_predicted[:-1] = q[:-1] - dt / dx * (f[1:] - f[:-1]) + dt * s[:-1]
+        a_predicted[-1] = a_predicted[-2]
+        q_predicted[-1] = q_predicted[-2]
+        np.maximum(a_predicted, 1e-6, out=a_predicted)
+
+        # corrector with backward differences
+        f = flux(a_predicted, q_predicted)
+        s = source(a_predicted, q_predicted)
+        a[1:] = 0.5 * (
+            a[1:]
+            + a_predicted[1:]
+            - dt / dx * (q_predicted[1:] - q_predicted[:-1])
+        )
+        q[1:] = 0.5 * (
+            q[1:]
+            + q_predicted[1:]
+            - dt / dx * (f[1:] - f[:-1])
+            + dt * s[1:]
+        )
+        t += dt
+
+        # inflow upstream, free outflow downstream
+        q[0] = inflow(t)
+        a[0] = a[1]
+        a[-1] = a[-2]
+        q[-1] = q[-2]
+        np.maximum(a, 1e-6, out=a)
+
+
+def time_steps(
+    length,
+    width,
+    slope,
+    strickler_roughness,
+    hydrograph,
+    duration,
+    sections=1000,
+    courant=0.8,
+):
+    """Estimates the number of time steps ``saint_venant`` takes.
+
+    The celerity is taken at the normal depths of the smallest and largest
+    discharge of the hydrograph."""
+    dx = length / (sections - 1)
+    discharges = np.array(hydrograph, dtype=float)[:, 1]
+    q = np.array([[discharges.min()], [discharges.max()]])
+    slope = np.atleast_1d(np.asarray(slope, dtype=float))
+    ks = np.atleast_1d(np.asarray(strickler_roughness, dtype=float))
+    h = t_n_rect_vec(q, ks, slope, width)
+    celerity = q / (width * h) + np.sqrt(GRAVITY * h)
+    r = h / (1 + 2 * h / width)
+    relaxation = 2 * GRAVITY * q / (ks ** 2 * width * h * r ** (4 / 3))
+    dt = min(courant * dx / celerity.max(), courant / relaxation.max())
+    return int(np.ceil(duration / dt))
+
+
+class UnsteadyChannel:
+    """Mixin for problems whose channel is simulated by the Saint-Venant
+    equations.
+
+    Problems implement ``channel`` and get the plot of a flood wave under
+    ``/unsteady`` and the simulation API under ``/api/v1/unsteady``."""
+
+    # a streamed simulation may take at most ``unsteady_budget`` cross
+    # sections times time steps, longer ones have to be run as background job
+    unsteady_sections = 1000
+    unsteady_max_sections = 5000
+    unsteady_max_duration = 7 * 24 * 3600
+    unsteady_budget = 20000000
+    # maximum number of values of all frames of a simulation
+    unsteady_max_values = 2000000
+
+    def __init__(self):
+        super().__init__()
+        self.floods = LRUCache(16)
+        self.jobs = LRUCache(64)
+
+    def channel(self, params, sections):
+        """Returns the channel of the unsteady simulation for ``params``.
+
+        Returns a dictionary with the ``length``, ``width``, ``slope`` and
+        ``strickler_roughness`` of the channel as expected by
+        ``saint_venant``, the latter two may be arrays with a value for every
+        one of the ``sections`` cross sections, and the design ``discharge``."""
+        raise NotImplementedError
+
+    def flood(self, params):
+        """Returns the hydrograph and duration of the default simulation, a
+        flood wave rising from half to the full design discharge."""
+        q = self.channel(params, 2)["discharge"]
+        return [(0, q / 2), (3600, q), (3 * 3600, q / 2)], 6 * 3600
+
+    def simulate(self, params, hydrograph, duration, sections, frame_interval):
+        """Runs the unsteady simulation of the channel for ``params``.
+
+        Returns the positions of the cross sections and the generator of the
+        frames of ``saint_venant``."""
+        channel = self.channel(params, sections)
+        del channel["discharge"]
+        x = np.linspace(0, channel["length"], sections)
+        frames = saint_venant(
+            hydrograph=hydrograph,
+            duration=duration,
+            sections=sections,
+            frame_interval=frame_interval,
+            **channel,
+        )
+        return x, frames
+
+    def unsteady_request(self):
+        """Returns the parameter values and the options of an unsteady
+        simulation submitted as JSON with the current request together with
+        its estimated number of time steps.
+
+        Missing options are taken from ``flood``. Raises a ``ValueError`` if a
+        value is invalid."""
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            raise ValueError("expected an object")
+        try:
+            params = self.parse(data)
+            hydrograph, duration = self.flood(params)
+            if "hydrograph" in data:
+                hydrograph = [(float(t), float(q)) for t, q in data["hydrograph"]]
+            duration = float(data.get("duration", duration))
+            sections = int(data.get("sections", self.unsteady_sections))
+            frame_interval = float(data.get("frame_interval", 60))
+        except (AttributeError, TypeError) as e:
+            raise ValueError(str(e))
+
+        times = [t for t, _ in hydrograph]
+        if not hydrograph or times[0] < 0 or np.any(np.diff(times) < 0):
+            raise ValueError("hydrograph must be a list of [t, q] with increasing times")
+        if not all(q > 0 for _, q in hydrograph):
+            raise ValueError("discharges must be positive")
+        if not 0 < duration <= self.unsteady_max_duration:
+            raise ValueError(f"duration must be between 0 and {self.unsteady_max_duration} s")
+        if not 3 <= sections <= self.unsteady_max_sections:
+            raise ValueError(f"sections must be between 3 and {self.unsteady_max_sections}")
+        if not frame_interval > 0:
+            raise ValueError("frame_interval must be positive")
+        if (int(duration / frame_interval) + 2) * sections > self.unsteady_max_values:
+            raise ValueError(
+                f"frames must hold at most {self.unsteady_max_values} values, increase frame_interval"
+            )
+
+        channel = self.channel(params, sections)
+        del channel["discharge"]
+        steps = time_steps(
+            hydrograph=hydrograph, duration=duration, sections=sections, **channel
+        )
+        options = {
+            "hydrograph": hydrograph,
+            "duration": duration,
+            "sections": sections,
+            "frame_interval": frame_interval,
+        }
+        return params, options, steps
+
+    def unsteady_figure(self, x, frames):
+        """Creates the figure of an unsteady simulation.
+
+        The depths are drawn over time at the upstream end, the middle and the
+        downstream end of the channel and along the channel every hour
+        together with their maximum. ``frames`` is a list of the frames of
+        ``saint_venant``."""
+        lang = DICT_GER
+        t = np.array([frame[0] for frame in frames])
+        depths = np.array([frame[1] for frame in frames])
+
+        fig, (ax_t, ax_x) = subplots(1, 2, figsize=(11, 4.5))
+        for i, color in ((0, "blue"), (len(x) // 2, "green"), (-1, "red")):
+            ax_t.plot(t / 3600, depths[:, i], color=color, label=f"x = {x[i]:.0f} m")
+        ax_t.set_xlabel("t [h]")
+        ax_t.set_ylabel(f"{lang['wlvl']} [m]")
+        ax_t.grid(True)
+        ax_t.legend(fontsize="small")
+
+        hours = np.isclose(t % 3600, 0)
+        for time, depth in zip(t[hours], depths[hours]):
+            ax_x.plot(x, depth, color="steelblue", linewidth=0.8)
+            ax_x.annotate(f"{time / 3600:.0f} h", (x[0], depth[0]), fontsize="small")
+        ax_x.plot(
+            x,
+            depths.max(axis=0),
+            color="black",
+            linestyle="dashed",
+            label=lang["envelope"],
+        )
+        ax_x.set_xlabel("x [m]")
+        ax_x.set_ylabel(f"{lang['wlvl']} [m]")
+        ax_x.set_ylim(0)
+        ax_x.grid(True)
+        ax_x.legend(fontsize="small")
+        fig.tight_layout()
+        return fig
+
+    def unsteady_plot(self):
+        params = self.session_params()
+        key = self.key(params)
+        result = self.floods.get(key)
+        if result is None:
+            hydrograph, duration = self.flood(params)
+            with self.timings.measure("unsteady"):
+                x, frames = self.simulate(
+                    params, hydrograph, duration, self.unsteady_sections, 300
+                )
+                result = (x, list(frames))
+            self.floods.put(key, result)
+        return Response(
+            render_figure(self.unsteady_figure, *result), mimetype="image/png"
+        )
+
+    def api_unsteady(self):
+        try:
+            params, options, steps = self.unsteady_request()
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        if steps * options["sections"] > self.unsteady_budget:
+            return (
+                jsonify(
+                    error=f"about {steps} time steps exceed the budget of a request, submit a job instead"
+                ),
+                400,
+            )
+        x, frames = self.simulate(params, **options)
+
+        def stream():
+            yield json.dumps(
+                dict(version=1, state=params, steps=steps, x=x.tolist(), **options)
+            ) + "\n"
+            with self.timings.measure("unsteady"):
+                for t, depth, discharge in frames:
+                    yield json.dumps(
+                        {
+                            "t": t,
+                            "depth": np.round(depth, 4).tolist(),
+                            "discharge": np.round(discharge, 4).tolist(),
+                        }
+                    ) + "\n"
+
+        return Response(stream(), mimetype="application/x-ndjson")
+
+    def _unsteady_job(self, params, options):
+        with self.timings.measure("unsteady_job"):
+            x, frames = self.simulate(params, **options)
+            t, depths, discharges = zip(*frames)
+        return {
+            "x": x.tolist(),
+            "t": list(t),
+            "depth": np.round(depths, 4).tolist(),
+            "discharge": np.round(discharges, 4).tolist(),
+        }
+
+    def api_unsteady_submit(self):
+        try:
+            params, options, steps = self.unsteady_request()
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        job = uuid4().hex
+        self.jobs.put(job, job_executor().submit(self._unsteady_job, params, options))
+        return jsonify(version=1, job=job, state=params, steps=steps, **options), 202
+
+    def api_unsteady_job(self, job):
+        future = self.jobs.get(job)
+        if future is None:
+            return jsonify(error="unknown job"), 404
+        if not future.done():
+            return jsonify(version=1, job=job, status="running")
+        if future.exception() is not None:
+            return jsonify(version=1, job=job, status="failed", error=str(future.exception()))
+        return jsonify(version=1, job=job, status="done", **future.result())
+
+    def caches(self):
+        return dict(super().caches(), floods=self.floods, jobs=self.jobs)
+
+    def blueprint(self):
+        bp = super().blueprint()
+        bp.add_url_rule("/unsteady", "unsteady", self.unsteady_plot)
+        bp.add_url_rule(
+            "/api/v1/unsteady", "api_unsteady", self.api_unsteady, methods=["POST"]
+        )
+        bp.add_url_rule(
+            "/api/v1/unsteady/jobs",
+            "api_unsteady_submit",
+            self.api_unsteady_submit,
+            methods=["POST"],
+        )
+        bp.add_url_rule(
+            "/api/v1/unsteady/jobs/<job>", "api_unsteady_job", self.api_unsteady_job
+        )
+        return bp
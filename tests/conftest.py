@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+# ezprobs reads the config.ini of the working directory on import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+with open("config.ini", "w") as f:
+    f.write("[server]\nsecret_key = test\n[application]\nsubmit_on_change = true\n")
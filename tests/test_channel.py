@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pytest
+
+from ezprobs.channel import specific_energy, specific_force, water_surface
+from ezprobs.hydraulics import t_crit_rect, t_n_rect
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+Q = 150
+MILD = (1000, 30, 0.001, 30)
+STEEP = (500, 30, 0.02, 40)
+
+
+def test_uniform_flow():
+    result = water_surface([MILD], Q)
+    assert result["depth"] == pytest.approx(t_n_rect(Q, 30, 0.001, 30), rel=1e-3)
+    assert result["jumps"] == [] and result["controls"] == []
+
+
+def test_backwater_curve():
+    h_n = t_n_rect(Q, 30, 0.001, 30)
+    result = water_surface([MILD], Q, downstream_depth=2 * h_n)
+    depth = result["depth"]
+    # the M1 curve rises downstream from the normal depth to the given depth
+    assert depth[-1] == pytest.approx(2 * h_n)
+    assert np.all(np.diff(depth) > 0)
+    assert np.all(depth > h_n)
+
+
+def test_chained_reaches_match_single_reach():
+    h_n = t_n_rect(Q, 30, 0.001, 30)
+    half = (500, 30, 0.001, 30)
+    chained = water_surface(
+        [half, half], Q, downstream_depth=2 * h_n, points=41, samples=400
+    )
+    single = water_surface([MILD], Q, downstream_depth=2 * h_n, points=81, samples=400)
+    assert np.interp(single["x"], chained["x"], chained["depth"]) == pytest.approx(
+        single["depth"], rel=1e-4
+    )
+
+
+def test_energy_conserved_at_junction():
+    wide = (1000, 40, 0.001, 30)
+    result = water_surface([MILD, wide], Q)
+    x = result["x"]
+    junction = np.flatnonzero(np.isclose(x, 1000))
+    upstream, downstream = result["depth"][junction]
+    assert specific_energy(upstream, Q, 30) == pytest.approx(
+        specific_energy(downstream, Q, 40), rel=1e-6
+    )
+
+
+def test_hydraulic_jump():
+    result = water_surface([STEEP, MILD], Q, points=201)
+    assert len(result["jumps"]) == 1
+    jump = result["jumps"][0]
+    assert jump["t_1"] < t_crit_rect(Q, 30) < jump["t_2"]
+    assert specific_force(jump["t_1"], Q, 30) == pytest.approx(
+        specific_force(jump["t_2"], Q, 30), rel=1e-3
+    )
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+from io import BytesIO
+
+import numpy as np
+import pytest
+from matplotlib.image import imread
+
+from ezprobs import app
+from ezprobs.problems import PROBLEMS
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+URL = "/problems/flow_regime_transition_bernoulli"
+
+
+def test_regime_map_redraws_operating_point():
+    client = app.test_client()
+    client.post(f"{URL}/", data={"ks1": 40, "ks2": 70, "i1": 3, "i2": 8})
+    before = imread(BytesIO(client.get(f"{URL}/regime_map?plane=ks").data))
+    cached = client.get(f"{URL}/stats").json["regime_maps"]["size"]
+
+    # moving within the plane only moves the operating point
+    client.post(f"{URL}/", data={"ks1": 60, "ks2": 30, "i1": 3, "i2": 8})
+    after = imread(BytesIO(client.get(f"{URL}/regime_map?plane=ks").data))
+    assert client.get(f"{URL}/stats").json["regime_maps"]["size"] == cached
+    assert before.shape == after.shape
+    assert 0 < np.mean(np.any(before != after, axis=-1)) < 0.01
+
+    # another slice through the parameter space needs a map of its own
+    client.post(f"{URL}/", data={"ks1": 60, "ks2": 30, "i1": 5, "i2": 8})
+    client.get(f"{URL}/regime_map?plane=ks")
+    assert client.get(f"{URL}/stats").json["regime_maps"]["size"] == cached + 1
+
+    assert client.get(f"{URL}/regime_map?plane=q").status_code == 400
+
+
+def test_solve_extends_batch_solution():
+    problem = PROBLEMS["free_surface_02"]
+    states = [dict(ks1=a, ks2=b, i1=8, i2=8) for a in (20, 90) for b in (20, 90)]
+    for params, batch in zip(states, problem.solve_batch(states)):
+        solution = problem.solve(params)
+        assert {k: solution[k] for k in batch} == pytest.approx(batch, rel=1e-12)
+        assert {"xx", "so", "depth", "head"} <= set(solution) - set(batch)
+    # all four flow regimes are covered
+    assert len({tuple(s["sub_critical"]) for s in problem.solve_batch(states)}) == 4
+
+    client = app.test_client()
+    params = states[0]
+    response = client.post(f"{URL}/api/v1/solve", json={"states": [params]})
+    t_n1 = response.json["solutions"][0]["t_n1"]
+    assert t_n1 == pytest.approx(problem.solve(params)["t_n1"], rel=1e-12)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+from math import pi
+
+import numpy as np
+import pytest
+
+from ezprobs.geometry import Section, area_circle
+from ezprobs.hydraulics import t_crit_rect, t_n_rect
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+# depths on and between the rows of the tables
+DEPTHS = np.array([0, 0.37, 1.25, 2.5, 3.999, 4])
+
+
+def test_area_circle():
+    for r in (0.05, 0.5, 1, 3):
+        assert area_circle(r) == pytest.approx(pi * r ** 2)
+
+
+def test_rectangle_tables():
+    section = Section.rectangle(30, 4)
+    assert section.area(DEPTHS) == pytest.approx(30 * DEPTHS)
+    assert section.perimeter(DEPTHS) == pytest.approx(30 + 2 * DEPTHS)
+    assert section.top_width(DEPTHS) == pytest.approx(np.full(DEPTHS.shape, 30))
+
+
+def test_trapezoid_tables():
+    section = Section.trapezoid(10, 1.5, 4)
+    # the tables are linear between their rows, the area is quadratic
+    assert section.area(DEPTHS) == pytest.approx(
+        (10 + 1.5 * DEPTHS) * DEPTHS, abs=1e-5
+    )
+    assert section.perimeter(DEPTHS) == pytest.approx(
+        10 + 2 * DEPTHS * np.sqrt(1 + 1.5 ** 2)
+    )
+    assert section.top_width(DEPTHS) == pytest.approx(10 + 3 * DEPTHS)
+
+
+def test_polyline_matches_trapezoid():
+    trapezoid = Section.trapezoid(10, 1.5, 4)
+    polyline = Section.polyline([0, 6, 16, 22], [4, 0, 0, 4])
+    # the bed of the polyline is dry without water
+    wet = DEPTHS[1:]
+    for kind in ("area", "perimeter", "top_width"):
+        assert getattr(polyline, kind)(wet) == pytest.approx(
+            getattr(trapezoid, kind)(wet)
+        )
+    assert polyline.perimeter(0) == 0
+
+
+def test_full_circle():
+    section = Section.circle(2)
+    assert section.area(2) == pytest.approx(area_circle(1))
+    assert section.perimeter(2) == pytest.approx(2 * pi)
+    assert section.top_width(1) == pytest.approx(2)
+
+
+def test_rectangle_depths():
+    section = Section.rectangle(30, 10)
+    for q in (20, 150, 600):
+        assert section.normal_depth(q, 30, 0.001) == pytest.approx(
+            t_n_rect(q, 30, 0.001, 30), abs=1e-4
+        )
+        assert section.critical_depth(q) == pytest.approx(
+            t_crit_rect(q, 30), abs=1e-4
+        )
+    # beyond the capacity of the table
+    assert np.isnan(section.normal_depth(1e5, 30, 0.001))
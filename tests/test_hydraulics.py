@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pytest
+
+from ezprobs.geometry import area_circle
+from ezprobs.hydraulics import (
+    discharge_pipe_chain_vec,
+    l_transition_i_r_rect,
+    lambda_pipe,
+    lambda_vec,
+    pipe_loss,
+    pipe_loss_vec,
+    t_n_rect,
+    t_n_rect_vec,
+)
+from ezprobs.units import GRAVITY
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+D = 0.05
+A = area_circle(D / 2)
+REYNOLDS = [1, 10, 49, 100, 2000, 2319, 2320, 5000, 1e5, 1e7]
+
+
+@pytest.mark.parametrize("k", [0, 1e-5, 3e-4])
+@pytest.mark.parametrize("re", REYNOLDS)
+def test_lambda_vec_matches_scalar(k, re):
+    assert lambda_vec(k, D, re) == pytest.approx(lambda_pipe(k, D, re), rel=1e-4)
+
+
+def test_lambda_vec_laminar():
+    re = np.array([1, 10, 100, 2000])
+    assert lambda_vec(3e-4, D, re) == pytest.approx(64 / re)
+    assert lambda_vec(3e-4, D, 0) == np.inf
+
+
+def test_lambda_vec_smooth_pipe():
+    lam = lambda_vec(0, D, [1e4, 1e5, 1e6])
+    assert np.all(np.isfinite(lam))
+    assert np.all(np.diff(lam) < 0)
+
+
+@pytest.mark.parametrize("k", [0, 3e-4])
+def test_pipe_loss_vec_matches_scalar(k):
+    q = np.array([-5e-3, -1e-6, 0, 1e-6, 1e-4, 5e-3])
+    expected = [pipe_loss(2, A, k, D, v) for v in q]
+    assert pipe_loss_vec(2, A, k, D, q) == pytest.approx(expected, rel=1e-4)
+    assert pipe_loss_vec(2, A, k, D, 0) == 0
+
+
+@pytest.mark.parametrize("k", [0, 3e-4])
+@pytest.mark.parametrize("head", [0, 1e-6, 1e-4, 1e-2, 1])
+def test_discharge_pipe_chain_vec_balances_head(k, head):
+    with np.errstate(all="raise"):
+        q = float(discharge_pipe_chain_vec(head, 0.5, A, [(2, A, k, D)]))
+    losses = 1.5 * (q / A) ** 2 / (2 * GRAVITY) + pipe_loss(2, A, k, D, q)
+    assert losses == pytest.approx(head, rel=1e-6, abs=1e-15)
+
+
+def test_discharge_pipe_chain_vec_start():
+    head = np.linspace(0, 1, 11)
+    pipes = [(2, A, 3e-4, D), (5, A, 3e-4, D)]
+    q = discharge_pipe_chain_vec(head, 0.5, A, pipes)
+    assert discharge_pipe_chain_vec(head, 0.5, A, pipes, start=q) == pytest.approx(q)
+
+
+@pytest.mark.parametrize("q", [0.5, 10, 150, 400])
+@pytest.mark.parametrize("ks", [20, 40, 80])
+@pytest.mark.parametrize("i", [0.0005, 0.008, 0.05])
+def test_t_n_rect_vec_matches_scalar(q, ks, i):
+    assert t_n_rect_vec(q, ks, i, 30) == pytest.approx(t_n_rect(q, ks, i, 30), rel=1e-3)
+
+
+def test_t_n_rect_vec_broadcasts():
+    q = np.linspace(1, 400, 7)[:, None]
+    ks = np.array([20, 40, 80])
+    t_n = t_n_rect_vec(q, ks, 0.008, 30)
+    assert t_n.shape == (7, 3)
+    assert np.all(np.diff(t_n, axis=0) > 0) and np.all(np.diff(t_n, axis=1) < 0)
+
+
+def test_transition_without_change_of_depth():
+    t_n = float(t_n_rect_vec(150, 40, 0.008, 30))
+    assert l_transition_i_r_rect(150, 40, 30, t_n, t_n, 0.008) == 0
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+from io import BytesIO
+
+import pytest
+
+from ezprobs import app
+from ezprobs.network import Network, read_inp, upload_network
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+URL = "/problems/pressure_pipe/api/v1/network"
+# reservoir feeding two junctions in a chain, the units follow the links so
+# they are applied after all sections are read
+INP = """[TITLE]
+chain of two pipes
+
+[JUNCTIONS]
+;ID  Elev  Demand
+ J1  100   2.5     ;first
+ J2  95    1.5
+
+[RESERVOIRS]
+ R1  130
+
+[PIPES]
+;ID  Node1  Node2  Length  Diameter  Roughness  MinorLoss  Status
+ P1  R1     J1     500     300       0.1        0          Open
+ P2  J1     J2     250     200       0.1        0.5        Open
+
+[PATTERNS]
+ 1  1.0  1.2  0.8
+
+[OPTIONS]
+ Units     LPS
+ Headloss  D-W
+
+[END]
+"""
+
+
+def lines(text):
+    return text.splitlines(keepends=True)
+
+
+def test_read_inp():
+    network = read_inp(lines(INP))
+    assert network.node_ids.tolist() == ["J1", "J2", "R1"]
+    assert network.node_kind.tolist() == [0, 0, 1]
+    assert network.elevation.tolist() == [100, 95, 130]
+    assert network.head.tolist() == [100, 95, 130]
+    assert network.demand == pytest.approx([2.5e-3, 1.5e-3, 0])
+
+    assert network.link_ids.tolist() == ["P1", "P2"]
+    assert network.link_kind.tolist() == [0, 0]
+    # R1 -> J1 -> J2
+    assert network.start.tolist() == [2, 0]
+    assert network.end.tolist() == [0, 1]
+    assert network.length.tolist() == [500, 250]
+    assert network.diameter == pytest.approx([0.3, 0.2])
+    assert network.roughness == pytest.approx([1e-4, 1e-4])
+    assert network.minor_loss.tolist() == [0, 0.5]
+    assert network.closed.tolist() == [False, False]
+    assert network.node_index == {"J1": 0, "J2": 1, "R1": 2}
+
+    summary = network.summary()
+    assert summary["nodes"] == {"junction": 2, "reservoir": 1, "tank": 0}
+    assert summary["links"] == {"pipe": 2, "pump": 0, "valve": 0}
+    assert summary["length"] == 750
+    assert summary["demand"] == pytest.approx(4e-3)
+    assert summary["headloss"] == "D-W"
+    assert summary["components"] == 1 and summary["unsupplied"] == 0
+
+
+def test_unsupplied_junction():
+    network = read_inp(lines(INP.replace(" J2  95", " J3  90  1\n J2  95")))
+    assert network.components() == (2, 1)
+
+
+def test_upload_network_is_cached(tmp_path):
+    key, network = upload_network(BytesIO(INP.encode()), tmp_path)
+    loaded = Network.load(tmp_path / f"{key}.npz")
+    for name in Network.fields:
+        assert getattr(loaded, name).tolist() == getattr(network, name).tolist()
+
+
+@pytest.mark.parametrize(
+    "text, message",
+    [
+        (INP.replace(" J2  95 ", " J2  x  "), "invalid line 7 in section JUNCTIONS"),
+        (INP.replace("P1  R1  ", "P1  R2  "), "unknown node 'R2'"),
+        (INP.replace("300 ", "   "), "invalid line 14 in section PIPES"),
+        (INP.replace("LPS", "XYZ"), "unknown flow units XYZ"),
+    ],
+    ids=["elevation", "node", "diameter", "units"],
+)
+def test_read_invalid_inp(text, message):
+    with pytest.raises(ValueError, match=message):
+        read_inp(lines(text))
+
+
+def test_api_network():
+    client = app.test_client()
+    response = client.post(URL, data=INP.encode())
+    assert response.status_code == 200
+    assert response.json["nodes"]["junction"] == 2
+    assert response.json["links"]["pipe"] == 2
+    assert response.json["length"] == 750
+
+    key = response.json["network"]
+    response = client.get(f"{URL}/{key}")
+    assert response.status_code == 200
+    assert response.json["network"] == key
+    assert response.json["nodes"] == {"junction": 2, "reservoir": 1, "tank": 0}
+
+    assert client.get(f"{URL}/{'0' * 64}").status_code == 404
+    assert client.get(f"{URL}/{key[:8]}").status_code == 400
+    assert client.get(f"{URL}/{'x' * 64}").status_code == 400
+
+
+def test_api_network_invalid_upload():
+    client = app.test_client()
+    for data in [
+        INP.replace("P1  R1  ", "P1  R2  ").encode(),
+        INP.replace(" J2  95 ", " J2  x  ").encode(),
+        INP.replace("chain", "cha\xefn").encode("latin-1"),
+    ]:
+        response = client.post(URL, data=data)
+        assert response.status_code == 400
+        assert response.json["error"]
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+import pytest
+
+from ezprobs import app
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+URL = "/problems/pressure_pipe/api/v1/optimize"
+
+
+def test_api_optimize():
+    client = app.test_client()
+    response = client.get(URL, query_string={"discharge": 0.05, "pressure": 20})
+    assert response.status_code == 200
+    optimum = response.json["optimum"]
+    assert optimum["discharge"] >= 0.05 * (1 - 1e-6)
+    assert optimum["pressure_head"] >= 20 * (1 - 1e-6)
+    # no design of the Pareto front meeting the requirements is cheaper
+    for design in response.json["front"]:
+        if design["discharge"] >= 0.05 and design["pressure_head"] >= 20:
+            assert design["cost"] >= optimum["cost"] * (1 - 1e-6)
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        {},
+        {"discharge": "fast"},
+        {"discharge": 0},
+        {"discharge": -1},
+        {"discharge": "nan"},
+        {"discharge": "inf"},
+        {"pressure": "nan"},
+        {"pressure": "-inf"},
+    ],
+)
+def test_api_optimize_invalid(query):
+    client = app.test_client()
+    assert client.get(URL, query_string=query).status_code == 400
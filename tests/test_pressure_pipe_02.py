@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pytest
+
+from ezprobs import app
+from ezprobs.problems.pressure_pipe_02 import drain_basin
+from ezprobs.units import CM, MM
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+DIAMETERS = np.arange(10, 125, 5) * MM
+
+
+@pytest.mark.parametrize("hb", [20, 100, 140])
+def test_drain_basin_finite(hb):
+    with np.errstate(all="raise"):
+        t, levels, discharges, durations = drain_basin(DIAMETERS, hb * CM)
+    assert np.all(np.isfinite(levels)) and np.all(np.isfinite(discharges))
+    assert np.all(np.isfinite(durations)) and np.all(durations > 0)
+    assert np.all(np.diff(durations) < 0)
+    assert levels[:, -1] == pytest.approx(max(hb * CM, 30 * CM))
+    assert discharges[:, -1] == pytest.approx(0)
+    assert np.all(np.diff(t, axis=1) >= 0)
+
+
+def test_drain_basin_converges():
+    coarse = drain_basin(DIAMETERS, 20 * CM, steps=50)[3]
+    fine = drain_basin(DIAMETERS, 20 * CM, steps=2000)[3]
+    assert coarse == pytest.approx(fine, rel=1e-3)
+
+
+def test_drain_basin_empty():
+    t, levels, discharges, durations = drain_basin(DIAMETERS, 150 * CM)
+    assert np.all(durations == 0)
+    assert np.all(discharges == 0)
+
+
+def test_moody_plot_without_discharge():
+    client = app.test_client()
+    client.post("/problems/pressure_pipe_single/", data={"d": 50, "hb": 150})
+    with np.errstate(all="raise"):
+        response = client.get("/problems/pressure_pipe_single/moody")
+    assert response.status_code == 200
+    assert response.mimetype == "image/png"
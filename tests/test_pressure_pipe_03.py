@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pytest
+
+from ezprobs import app
+from ezprobs.problems.pressure_pipe_03 import simulate_storage, storage_schedules
+from ezprobs.units import DAY, HOUR
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+URL = "/problems/pressure_pump_turbine/api/v1/simulate"
+
+
+def test_storage_conserves_volume():
+    _, schedules = storage_schedules(20, 4, 3)
+    upper, lower, discharge, _ = simulate_storage(schedules, HOUR / 4)
+    assert (250 - upper) * 250000 == pytest.approx((lower - 150) * 400000, abs=1e-3)
+    assert np.diff(upper, axis=1) == pytest.approx(-discharge * HOUR / 4 / 250000)
+
+
+def test_storage_limits():
+    schedules = [np.full(48, 35), np.full(48, -20), np.tile([35, -20], 24)]
+    upper, lower, discharge, _ = simulate_storage(schedules, HOUR)
+    assert np.all((upper >= 240 - 1e-9) & (upper <= 255 + 1e-9))
+    assert np.all((lower >= 140 - 1e-9) & (lower <= 155 + 1e-9))
+    # turbining fills the lower basin, pumping fills the upper one
+    assert lower[0, -1] == pytest.approx(155) and discharge[0, -1] == 0
+    assert upper[1, -1] == pytest.approx(255) and discharge[1, -1] == 0
+
+
+def test_storage_batch_matches_single():
+    _, schedules = storage_schedules(-15, 1, 2)
+    batch = simulate_storage(schedules, HOUR)
+    for i, schedule in enumerate(schedules):
+        single = simulate_storage(schedule, HOUR)
+        for a, b in zip(batch, single):
+            assert a[i] == pytest.approx(b[0])
+
+
+def test_storage_at_rest():
+    with np.errstate(all="raise"):
+        upper, lower, discharge, power = simulate_storage(np.zeros(24), HOUR)
+    assert np.all(upper == 250) and np.all(lower == 150)
+    assert np.all(discharge == 0) and np.all(power == 0)
+
+
+def test_api_simulate():
+    client = app.test_client()
+    response = client.post(
+        URL, json={"schedules": [[10] * 24, [-10] * 24], "series": True}
+    )
+    assert response.status_code == 200
+    turbine, pump = response.json["results"]
+    assert turbine["energy_turbine"] > 0 and turbine["energy_pump"] == 0
+    assert pump["energy_pump"] > 0 and pump["energy_turbine"] == 0
+    assert turbine["level_upper"] < 250 < pump["level_upper"]
+    assert len(turbine["levels_upper"]) == 25 and len(turbine["power"]) == 24
+
+    for data in [
+        {},
+        {"schedules": [1, 2]},
+        {"schedules": [[1, 2], [3]]},
+        {"schedules": [["x"]]},
+        {"schedules": [[1]], "step": 0},
+        {"schedules": [[1]], "step": 2 * DAY},
+    ]:
+        assert client.post(URL, json=data).status_code == 400
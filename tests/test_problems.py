@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pytest
+
+import ezprobs
+from ezprobs.problems import PROBLEMS
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+def numbers(value):
+    """Returns the numbers of a solution value as flat array or ``None``."""
+    if isinstance(value, (str, bool)):
+        return None
+    try:
+        return np.asarray(value, dtype=float).ravel()
+    except (TypeError, ValueError):
+        return None
+
+
+@pytest.mark.parametrize("name", sorted(PROBLEMS))
+def test_solve_batch_matches_solve(name):
+    problem = PROBLEMS[name]
+    rng = np.random.default_rng(0)
+    states = [{p.name: p.val_initial for p in problem.parameters}]
+    states += [
+        {p.name: float(rng.choice(p.values())) for p in problem.parameters}
+        for _ in range(20)
+    ]
+    for params, batch in zip(states, problem.solve_batch(states)):
+        solution = problem.solve(params)
+        for key, value in batch.items():
+            expected = numbers(solution[key])
+            if expected is not None:
+                approx = pytest.approx(expected, rel=1e-5, abs=1e-9)
+                assert numbers(value) == approx, key
+
+
+def test_api_solve():
+    client = ezprobs.app.test_client()
+    states = [{"d1": 80, "d2": 74, "d3": 70}, {"d1": 90}]
+    response = client.post(
+        "/problems/pressure_pipe/api/v1/solve", json={"states": states}
+    )
+    assert response.status_code == 200
+    problem = PROBLEMS["pressure_pipe_01"]
+    for state, solution in zip(response.json["states"], response.json["solutions"]):
+        assert solution["discharge"] == pytest.approx(problem.solve(state)["discharge"])
+
+    for data in [{}, {"states": [{"d1": 1000}]}, {"states": [], "accuracy": "rough"}]:
+        response = client.post("/problems/pressure_pipe/api/v1/solve", json=data)
+        assert response.status_code == 400
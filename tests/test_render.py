@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from ezprobs import app
+from ezprobs.problems import render_figure, subplots
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+# endpoints of all problems returning images
+IMAGES = {
+    "plot_function",
+    "uncertainty",
+    "unsteady",
+    "rating_curve",
+    "regime_map",
+    "moody",
+    "drain",
+    "surge",
+    "characteristic",
+    "simulation",
+}
+ROUTES = sorted(
+    rule.rule
+    for rule in app.url_map.iter_rules()
+    if rule.endpoint.split(".")[-1] in IMAGES
+)
+
+
+def math_figure(n):
+    fig, ax = subplots()
+    ax.plot(np.arange(10), np.arange(10) ** (1 + n / 10))
+    ax.set_title(f"$h_{{{n}}} = \\frac{{v^2}}{{2g}} + \\sqrt{{\\lambda_{n}}}$")
+    ax.set_xlabel("$Q\\,[m^3/s]$")
+    ax.set_ylabel("$\\Delta h\\,[m]$")
+    return fig
+
+
+def test_render_math_text_in_threads():
+    # every label is new so the layout isn't taken from matplotlib's cache
+    with ThreadPoolExecutor(2) as executor:
+        rendered = list(executor.map(render_figure, [math_figure] * 32, range(32)))
+    assert rendered == [render_figure(math_figure, n) for n in range(32)]
+
+
+@pytest.mark.parametrize("url", ROUTES)
+def test_plot_routes(url):
+    client = app.test_client()
+    client.post(url.rsplit("/", 1)[0] + "/")
+    response = client.get(url)
+    assert response.status_code in (200, 204)
+    if response.status_code == 200:
+        assert response.mimetype == "image/png"
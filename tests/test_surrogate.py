@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pytest
+
+from ezprobs import app
+from ezprobs.problems import PROBLEMS, Parameter
+from ezprobs.surrogate import Surrogate
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+class Bilinear:
+    """Problem whose outputs are reproduced exactly by linear interpolation."""
+
+    parameters = [Parameter("a", "a", 0, 10, 1, 5), Parameter("b", "b", 0, 4, 0.5, 2)]
+
+    def solve_batch(self, states):
+        return [
+            {"z": 2 * s["a"] + 3 * s["b"], "v": [s["a"], s["a"] * s["b"]]}
+            for s in states
+        ]
+
+
+def test_surrogate_interpolates():
+    problem = Bilinear()
+    surrogate = Surrogate(problem, ["z", "v"])
+    states = [{"a": 0.3, "b": 3.7}, {"a": 9.99, "b": 0.01}, {"a": 10, "b": 4}]
+    for approximated, exact in zip(
+        surrogate.evaluate(states), problem.solve_batch(states)
+    ):
+        assert approximated["z"] == pytest.approx(exact["z"])
+        assert approximated["v"] == pytest.approx(exact["v"])
+    errors = surrogate.validate(samples=64)
+    assert errors["z"]["max"] == pytest.approx(0, abs=1e-9)
+    assert errors["v"]["max"] == pytest.approx(0, abs=1e-9)
+
+
+def test_surrogate_of_problem():
+    problem = PROBLEMS["free_surface_01"]
+    surrogate = problem.surrogate()
+    assert surrogate.errors["t_n"]["rms"] < 1e-2
+    rng = np.random.default_rng(0)
+    states = [
+        {p.name: float(rng.choice(p.values())) for p in problem.parameters}
+        for _ in range(10)
+    ]
+    # the slider states are nodes of the grid
+    for approximated, exact in zip(
+        surrogate.evaluate(states), problem.solve_batch(states)
+    ):
+        assert approximated["t_n"] == pytest.approx(exact["t_n"], rel=1e-9)
+
+
+def test_api_solve_surrogate():
+    client = app.test_client()
+    states = [{"ks": 33.3, "iso": 7.3, "q": 123.4}]
+    response = client.post(
+        "/problems/flow_regime/api/v1/solve",
+        json={"states": states, "accuracy": "surrogate"},
+    )
+    assert response.status_code == 200
+    exact = PROBLEMS["free_surface_01"].solve(response.json["states"][0])
+    approximated = response.json["solutions"][0]
+    assert approximated["t_n"] == pytest.approx(exact["t_n"], rel=1e-2)
+    assert "t_n" in response.json["errors"]
+
+    response = client.post(
+        "/problems/xy/api/v1/solve", json={"states": [], "accuracy": "surrogate"}
+    )
+    assert response.status_code == 400
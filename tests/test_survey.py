@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+from io import BytesIO
+
+import numpy as np
+import pytest
+
+from ezprobs import app
+from ezprobs.geometry import Section
+from ezprobs.problems import PROBLEMS
+from ezprobs.survey import read_survey, upload_survey
+from ezprobs.units import M, M3PS, S
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+URL = "/problems/flow_regime/api/v1/survey"
+# trapezoidal cross section with a bottom of 10 m, side slopes of 1.5 and
+# banks 4 m above the bed
+PROFILE = [(0, 4), (6, 0), (16, 0), (22, 4)]
+
+
+def survey_lines(chainages=(0, 100, 200), slope=0.001, reverse=False):
+    lines = ["Note,Elevation,Chainage,Station\n"]
+    for chainage in chainages:
+        points = PROFILE[::-1] if reverse else PROFILE
+        for station, elevation in points:
+            z = 100 + elevation - slope * chainage
+            lines.append(f"x,{z},{chainage},{station}\n")
+        lines.append("\n")
+    return lines
+
+
+def test_read_survey():
+    survey = read_survey(survey_lines(), resolution=2000)
+    assert len(survey) == 3
+    assert survey.chainage.tolist() == [0, 100, 200]
+    assert survey.offsets.tolist() == [0, 4, 8, 12]
+    assert survey.bed == pytest.approx([100, 99.9, 99.8])
+    assert survey.slope == pytest.approx([0.001] * 3)
+
+    section = Section.trapezoid(10, 1.5, 4)
+    assert survey.normal_depth(50, 30) == pytest.approx(
+        [section.normal_depth(50, 30, 0.001)] * 3, abs=1e-3
+    )
+    assert survey.critical_depth(50) == pytest.approx(
+        [section.critical_depth(50)] * 3, abs=1e-3
+    )
+    # beyond the banks
+    assert np.all(np.isnan(survey.normal_depth(1e5, 30)))
+
+
+def test_sections_surveyed_in_both_directions():
+    forward = read_survey(survey_lines())
+    backward = read_survey(survey_lines(reverse=True))
+    assert backward.areas == pytest.approx(forward.areas)
+    assert backward.perimeters == pytest.approx(forward.perimeters)
+    assert backward.top_widths == pytest.approx(forward.top_widths)
+
+
+@pytest.mark.parametrize(
+    "lines, message",
+    [
+        ([], "header"),
+        (["chainage,station\n", "0,1\n"], "header"),
+        (["chainage,station,elevation\n"], "no points"),
+        (["chainage,station,elevation\n", "0,1,x\n"], "line 2"),
+        (["chainage,station,elevation\n", "0,1\n"], "line 2"),
+        (survey_lines((0, 200, 100)), "decreases in line 12"),
+        (survey_lines()[:-3], "three points"),
+    ],
+)
+def test_read_invalid_survey(lines, message):
+    with pytest.raises(ValueError, match=message):
+        read_survey(lines)
+
+
+def test_read_survey_limits_points():
+    with pytest.raises(ValueError, match="at most 11 points"):
+        read_survey(survey_lines(), max_points=11)
+    assert len(read_survey(survey_lines(), max_points=12).stations) == 12
+
+
+def test_upload_survey_hashes_content():
+    data = "".join(survey_lines()).encode()
+    key, survey = upload_survey(BytesIO(data))
+    # the key does not depend on the blocks the stream is read in
+    assert key == upload_survey(BytesIO(data))[0]
+    assert key != upload_survey(BytesIO(data.replace(b"x,", b"y,")))[0]
+    assert len(survey) == 3
+
+
+def test_api_survey():
+    client = app.test_client()
+    response = client.post(URL, data="".join(survey_lines()).encode())
+    assert response.status_code == 200
+    assert response.json["sections"] == 3 and response.json["points"] == 12
+
+    key = response.json["survey"]
+    response = client.get(f"{URL}/{key}?ks=30&iso=5&q=100")
+    assert response.status_code == 200
+    assert response.json["chainage"] == [0, 100, 200]
+    assert response.json["slope"] == pytest.approx([0.001] * 3)
+    q = 100 * M3PS
+    section = Section.trapezoid(10, 1.5, 4)
+    t_n = section.normal_depth(q, 30 * M ** (1 / 3) / S, 0.001)
+    assert response.json["t_n"] == pytest.approx([t_n] * 3, abs=1e-3)
+
+    # sections above the banks have no depth
+    response = client.get(f"{URL}/{key}?ks=15&iso=5&q=200")
+    assert response.status_code == 200
+    assert response.json["t_n"] == [None] * 3
+
+    assert client.get(f"{URL}/{'0' * 64}").status_code == 404
+    assert client.get(f"{URL}/{key}?ks=x").status_code == 400
+
+
+def test_api_survey_invalid_upload(monkeypatch):
+    client = app.test_client()
+    for data in [
+        b"",
+        b"chainage,station\n0,1\n",
+        "".join(survey_lines((0, 200, 100))).encode(),
+        "chainage,station,elevation\n0,1,\xff\n".encode("latin-1"),
+    ]:
+        response = client.post(URL, data=data)
+        assert response.status_code == 400
+        assert response.json["error"]
+
+    monkeypatch.setattr(PROBLEMS["free_surface_01"], "survey_max_points", 8)
+    response = client.post(URL, data="".join(survey_lines()).encode())
+    assert response.status_code == 400
+    assert response.json["error"] == "at most 8 points are allowed"
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pytest
+
+from ezprobs import app
+from ezprobs.geometry import area_circle
+from ezprobs.transient import closing_valve, pump_trip, water_hammer
+from ezprobs.units import GRAVITY
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+PIPES = [(1000, 0.01e-3, 0.5)]
+V0 = 1.0
+Q0 = V0 * area_circle(0.25)
+
+
+def test_water_hammer_steady():
+    result = water_hammer(PIPES, 100, 0, Q0, 1, "valve", lambda t: 1, 10)
+    assert result["machine_discharge"] == pytest.approx(Q0)
+    assert result["machine_head"] == pytest.approx(
+        np.broadcast_to(result["machine_head"][0], result["machine_head"].shape)
+    )
+
+
+def test_water_hammer_joukowsky():
+    result = water_hammer(PIPES, 100, 0, Q0, 1, "valve", closing_valve(0), 10)
+    rise = result["machine_head"][:, 0].max() - result["machine_head"][0, 0]
+    assert rise == pytest.approx(1000 * V0 / GRAVITY, rel=0.05)
+    assert result["machine_discharge"][1:] == pytest.approx(0)
+
+
+def test_water_hammer_pump_trip():
+    # pumping from the lower basin at the end into the upper basin
+    result = water_hammer(PIPES * 2, 50, 0, -Q0, 1, "pump", pump_trip(2), 20)
+    # the check valve prevents backflow
+    assert np.all(result["machine_discharge"] <= 0)
+    assert result["machine_discharge"][-1] == 0
+
+
+def test_water_hammer_without_flow():
+    with np.errstate(all="raise"):
+        result = water_hammer(PIPES, 50, 50, 0, 1, "valve", closing_valve(2), 10)
+    assert result["head_max"] == pytest.approx(50)
+    assert result["head_min"] == pytest.approx(50)
+    assert result["machine_discharge"] == pytest.approx(0)
+
+
+@pytest.mark.parametrize("problem", ["pressure_pipe", "pressure_pump_turbine"])
+def test_surge_plot(problem):
+    client = app.test_client()
+    client.post(f"/problems/{problem}/", data={"q": 20})
+    response = client.get(f"/problems/{problem}/surge?time=2")
+    assert response.status_code == 200
+    assert response.mimetype == "image/png"
+    for time in ["-1", "61", "fast"]:
+        response = client.get(f"/problems/{problem}/surge?time={time}")
+        assert response.status_code == 400
+
+
+def test_surge_plot_at_rest():
+    client = app.test_client()
+    client.post("/problems/pressure_pump_turbine/", data={"q": 0})
+    assert client.get("/problems/pressure_pump_turbine/surge").status_code == 204
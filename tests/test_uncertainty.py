@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pytest
+
+from ezprobs import app
+from ezprobs.uncertainty import Accumulator, lognormal, monte_carlo
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+def identity(inputs):
+    return {"x": inputs["x"], "xy": np.column_stack((inputs["x"], inputs["y"]))}
+
+
+def test_accumulator_chunks():
+    values = np.random.default_rng(0).normal(10, 2, 10000)
+    edges = np.linspace(0, 20, 81)
+    whole = Accumulator(edges)
+    whole.add(values)
+    chunked = Accumulator(edges)
+    for chunk in np.array_split(values, 7):
+        chunked.add(chunk)
+
+    for accumulator in (whole, chunked):
+        assert accumulator.count == len(values)
+        assert accumulator.mean == pytest.approx(values.mean())
+        assert accumulator.std == pytest.approx(values.std(ddof=1))
+        assert accumulator.minimum == pytest.approx(values.min())
+        assert accumulator.maximum == pytest.approx(values.max())
+        for q in (5, 50, 95):
+            assert accumulator.percentile(q) == pytest.approx(
+                np.percentile(values, q), abs=0.25
+            )
+    assert np.array_equal(whole.histogram, chunked.histogram)
+
+
+def test_accumulator_outside_edges():
+    accumulator = Accumulator([0, 1, 2])
+    accumulator.add([-1, 0.5, 1.5, 3, 4])
+    assert accumulator.below[0] == 1 and accumulator.above[0] == 2
+    assert accumulator.histogram.sum() == 2
+
+
+def test_lognormal():
+    rng = np.random.default_rng(0)
+    samples = lognormal(rng, 40, 0.1, 100000)
+    assert samples.mean() == pytest.approx(40, rel=1e-2)
+    assert samples.std() / samples.mean() == pytest.approx(0.1, rel=2e-2)
+    assert np.all(lognormal(rng, 40, 0, 10) == 40)
+
+
+def test_monte_carlo():
+    nominal = {"x": 2.0, "y": 5.0}
+    result = monte_carlo(identity, nominal, {"x": 0.1}, {}, 25000, chunk_size=4000)
+    assert result["x"].count == 25000
+    assert result["x"].mean == pytest.approx(2, rel=1e-2)
+    assert result["x"].std == pytest.approx(0.2, rel=5e-2)
+    # inputs without a coefficient of variation are fixed
+    assert result["xy"].mean[1] == pytest.approx(5)
+    assert result["xy"].std[1] == pytest.approx(0)
+    again = monte_carlo(identity, nominal, {"x": 0.1}, {}, 25000, chunk_size=4000)
+    assert again["x"].mean == result["x"].mean
+
+
+def test_api_uncertainty():
+    client = app.test_client()
+    url = "/problems/flow_regime/api/v1/uncertainty"
+    response = client.get(f"{url}?samples=2000&ks_cv=0.1&iso_cv=0")
+    assert response.status_code == 200
+    t_n = response.json["outputs"]["t_n"]
+    assert t_n["count"] == 2000
+    assert t_n["percentiles"]["5"] < t_n["mean"] < t_n["percentiles"]["95"]
+    for query in ["samples=0", "ks_cv=2", "ks_cv=x", "ks=1000"]:
+        assert client.get(f"{url}?{query}").status_code == 400
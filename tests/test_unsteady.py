@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import json
+import time
+
+import numpy as np
+import pytest
+
+from ezprobs import app
+from ezprobs.hydraulics import t_n_rect
+from ezprobs.unsteady import saint_venant, time_steps
+
+__author__ = "Manuel Pirker"
+__copyright__ = "Copyright (c) 2022 Manuel Pirker"
+__license__ = "MIT"
+__email__ = "manuel.pirker@tugraz.at"
+
+
+CHANNEL = dict(length=2000, width=30, slope=0.001, strickler_roughness=30)
+
+
+def test_saint_venant_steady():
+    frames = list(
+        saint_venant(hydrograph=[(0, 100)], duration=1800, sections=50, **CHANNEL)
+    )
+    t_n = t_n_rect(100, 30, 0.001, 30)
+    t, depth, discharge = frames[-1]
+    assert t == pytest.approx(1800)
+    assert depth == pytest.approx(t_n, rel=1e-3)
+    assert discharge == pytest.approx(100, rel=1e-3)
+
+
+def test_saint_venant_flood_wave():
+    hydrograph = [(0, 50), (600, 200), (1800, 50)]
+    frames = list(
+        saint_venant(
+            hydrograph=hydrograph,
+            duration=3600,
+            sections=100,
+            frame_interval=30,
+            **CHANNEL,
+        )
+    )
+    depths = np.array([depth for _, depth, _ in frames])
+    assert np.all(np.isfinite(depths)) and np.all(depths > 0)
+    # the peak travels downstream and attenuates
+    peaks = depths.argmax(axis=0)
+    assert peaks[-1] > peaks[0]
+    assert depths[:, -1].max() <= depths[:, 0].max()
+
+
+def test_time_steps():
+    hydrograph = [(0, 50), (600, 200)]
+    steps = [
+        time_steps(hydrograph=hydrograph, duration=3600, sections=sections, **CHANNEL)
+        for sections in (20, 100, 200)
+    ]
+    assert 0 < steps[0] <= steps[1] < steps[2]
+
+
+def test_saint_venant_coarse():
+    # the explicit friction of coarse cross sections must not blow up
+    frames = saint_venant(
+        hydrograph=[(0, 50), (600, 200)],
+        duration=3600,
+        sections=5,
+        frame_interval=600,
+        **CHANNEL,
+    )
+    depths = np.array([depth for _, depth, _ in frames])
+    assert len(depths) == 7
+    assert np.all(np.isfinite(depths))
+
+
+def test_api_unsteady():
+    client = app.test_client()
+    response = client.post(
+        "/problems/flow_regime/api/v1/unsteady",
+        json={"duration": 600, "sections": 20, "frame_interval": 300},
+    )
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert len(lines[0]["x"]) == 20
+    assert [line["t"] for line in lines[1:]] == pytest.approx([0, 300, 600])
+
+    for options in [{"sections": 2}, {"duration": -1}, {"hydrograph": [[0, -1]]}]:
+        response = client.post("/problems/flow_regime/api/v1/unsteady", json=options)
+        assert response.status_code == 400
+
+
+def test_api_unsteady_job():
+    client = app.test_client()
+    response = client.post(
+        "/problems/flow_regime_transition_bernoulli/api/v1/unsteady/jobs",
+        json={"duration": 600, "sections": 20},
+    )
+    assert response.status_code == 202
+    url = "/problems/flow_regime_transition_bernoulli/api/v1/unsteady/jobs/"
+    url += response.json["job"]
+    for _ in range(100):
+        result = client.get(url).json
+        if result["status"] != "running":
+            break
+        time.sleep(0.1)
+    assert result["status"] == "done"
+    assert len(result["depth"][0]) == 20
+
+
+def test_unsteady_routes_only_for_channels():
+    client = app.test_client()
+    assert client.get("/problems/flow_regime/stats").json["floods"]["maxsize"] > 0
+    assert client.get("/problems/pressure_pipe/unsteady").status_code == 404
+    assert "floods" not in client.get("/problems/pressure_pipe/stats").json